@@ -0,0 +1,155 @@
+import gc
+import os
+import sys
+import time
+import hashlib
+import logging
+import threading
+from django.conf import settings
+from django.utils.module_loading import import_string
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+# The active detector; replaced as a whole so readers never see a half-swapped model
+_active = None  # (model, version, path, mtime)
+_lock = threading.Lock()
+_load_lock = threading.Lock()
+_reloading = threading.Event()
+_last_check = 0.0
+_failed_mtime = None
+
+
+def model_version(path):
+    """Version string recorded on incidents: weights file name plus a short content hash."""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            digest.update(chunk)
+    return f"{os.path.basename(path)}@{digest.hexdigest()[:12]}"
+
+
+def load_model(path):
+    """Build the configured detector backend for the given weights and warm it up."""
+    backend = import_string(settings.DETECTOR_BACKEND)
+    model = backend(path)
+    model.warm_up()
+    return model
+
+
+def reload_model(path=None):
+    """
+    Load and warm new weights next to the current ones, then swap them in.
+    Streams pick up the new model on their next frame; the old model is
+    freed once the last in-flight frame using it completes.
+    """
+    global _active, _failed_mtime
+    path = path or settings.YOLO_MODEL_PATH
+    # Backends without weights (the stub) have nothing to watch
+    mtime = os.path.getmtime(path) if os.path.exists(path) else None
+
+    try:
+        model = load_model(path)
+    except Exception:
+        # Keep serving the old weights; don't retry this file until it changes again
+        _failed_mtime = mtime
+        raise
+    version = model.version
+
+    with _lock:
+        old, _active = _active, (model, version, path, mtime)
+    logger.info(f"Detector switched to {version}" + (f" (was {old[1]})" if old else ""))
+
+    del old
+    gc.collect()
+    torch = sys.modules.get("torch")  # only if a backend already imported it
+    if torch is not None and torch.cuda.is_available():
+        torch.cuda.empty_cache()
+    return version
+
+
+def _reload_in_background(path):
+    try:
+        reload_model(path)
+    except Exception as e:
+        logger.error(f"Failed to reload detector weights from {path}: {e}")
+    finally:
+        _reloading.clear()
+
+
+def _check_for_new_weights():
+    """Start a background reload if the weights file on disk has changed."""
+    global _last_check
+    now = time.monotonic()
+    if now - _last_check < settings.YOLO_RELOAD_CHECK_INTERVAL:
+        return
+    _last_check = now
+
+    model, version, path, mtime = _active
+    try:
+        current_mtime = os.path.getmtime(path)
+    except OSError:
+        return  # file is mid-replace; try again next interval
+    if mtime is None or current_mtime in (mtime, _failed_mtime) or _reloading.is_set():
+        return
+
+    _reloading.set()
+    threading.Thread(target=_reload_in_background, args=(path,), daemon=True).start()
+
+
+def _torch():
+    """torch if the backend needs it; the stub backend runs without it installed."""
+    try:
+        import torch
+    except ImportError:
+        return None
+    return torch
+
+
+def preload():
+    """
+    Load the detector in a prefork master so workers share its memory.
+
+    Warm-up runs single-threaded so no OpenMP pool exists at fork time, the
+    weights are moved into shared memory, and gc.freeze() keeps the garbage
+    collector in each worker from touching (and so copying) the master's objects.
+    Call after_fork() in every worker.
+    """
+    torch = _torch()
+    if torch is not None:
+        torch.set_num_threads(1)
+    version = reload_model()
+
+    _active[0].share_memory()
+    if torch is not None and torch.cuda.is_available() and torch.cuda.is_initialized():
+        logger.warning("CUDA was initialised before fork; workers will not be able to use the GPU")
+
+    gc.collect()
+    gc.freeze()
+    logger.info(f"Preloaded detector {version} for forked workers")
+    return version
+
+
+def after_fork():
+    """Per-worker setup after forking from a master that called preload()."""
+    global _lock, _load_lock, _reloading
+
+    # Locks are copied in whatever state the master held them; start fresh
+    _lock, _load_lock, _reloading = threading.Lock(), threading.Lock(), threading.Event()
+    torch = _torch()
+    if torch is not None:
+        torch.set_num_threads(settings.YOLO_WORKER_THREADS)
+
+
+def get_model():
+    """Return (detector, version) for the next frame, loading the weights on first use."""
+    if _active is None:
+        # Serialise the first load so concurrent streams don't each load a copy
+        with _load_lock:
+            if _active is None:
+                reload_model()
+    elif settings.YOLO_RELOAD_CHECK_INTERVAL:
+        _check_for_new_weights()
+
+    model, version, _, _ = _active
+    return model, version
@@ -0,0 +1,50 @@
+import numpy as np
+
+
+class Detections:
+    """Detections for a single frame, independent of the backend that produced them."""
+
+    def __init__(self, frame, classes, boxes, confidences=None, plot=None):
+        self.frame = frame
+        self.classes = list(classes)  # class name per box
+        self.boxes = np.asarray(boxes, dtype=np.float32).reshape(-1, 4)  # xyxy pixels
+        if confidences is None:
+            confidences = np.ones(len(self.classes), dtype=np.float32)
+        self.confidences = np.asarray(confidences, dtype=np.float32)
+        self._plot = plot
+
+    def plot(self):
+        """Return the frame annotated with the detections."""
+        if self._plot is not None:
+            return self._plot()
+        return self.frame
+
+
+class Detector:
+    """
+    Interface for detector backends, selected with settings.DETECTOR_BACKEND.
+    Backends are constructed with the weights path and must be safe to share
+    between streams once warm_up() has run.
+    """
+
+    # Class names in index order, as used by the heatmap and risk code
+    names = []
+    # Recorded on incidents raised from this detector's output
+    version = ""
+
+    def __init__(self, weights_path):
+        self.weights_path = weights_path
+
+    def warm_up(self):
+        """Run a dummy frame so the first real frame isn't slow."""
+        self.detect(np.zeros((640, 640, 3), dtype=np.uint8))
+
+    def detect(self, frame, frame_index=None):
+        """
+        Detections for one frame. frame_index is the frame's position in its
+        stream, for backends whose output depends on it (see StubDetector).
+        """
+        raise NotImplementedError
+
+    def share_memory(self):
+        """Move weights to shared memory before forking workers (see detection.preload)."""
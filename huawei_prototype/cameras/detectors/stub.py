@@ -0,0 +1,85 @@
+import itertools
+import threading
+import cv2
+from django.conf import settings
+from .base import Detector, Detections
+
+# Same classes as the trained model, so stubbed events map onto real severities
+DEFAULT_NAMES = [
+    "Multiple collision",
+    "Vehicle fire",
+    "Vehicular accident",
+    "Reckless driving",
+    "Tailgating",
+    "Self-accident",
+]
+
+
+class StubDetector(Detector):
+    """
+    Deterministic backend for tests and load tests: no model, no torch.
+
+    settings.DETECTOR_STUB_SCRIPT is a list with one entry per frame, replayed
+    in a loop from each stream's first frame by the frame_index the stream
+    passes, so concurrent streams don't advance each other's script. Calls
+    without a frame_index share one cursor. Each entry is a list of detections, either a class name or a
+    (class name, (x0, y0, x1, y1)) pair with the box given as fractions of the
+    frame size. An empty script never detects anything.
+    """
+
+    version = "stub"
+
+    def __init__(self, weights_path=None):
+        super().__init__(weights_path)
+        self.script = [self._parse(entry) for entry in settings.DETECTOR_STUB_SCRIPT]
+        self.names = list(DEFAULT_NAMES)
+        for entry in self.script:
+            for name, _ in entry:
+                if name not in self.names:
+                    self.names.append(name)
+        self._frames = itertools.count()
+        self._lock = threading.Lock()
+
+    def _parse(self, entry):
+        detections = []
+        for item in entry:
+            if isinstance(item, str):
+                detections.append((item, None))
+            else:
+                name, box = item
+                detections.append((name, tuple(box)))
+        return detections
+
+    def _default_box(self, name):
+        # Spread classes across the lower half of the frame so boxes don't overlap
+        i = self.names.index(name) % 6
+        x0 = 0.05 + i * 0.15
+        return (x0, 0.55, x0 + 0.12, 0.8)
+
+    def warm_up(self):
+        pass
+
+    def detect(self, frame, frame_index=None):
+        if not self.script:
+            return Detections(frame, [], [])
+
+        if frame_index is None:
+            with self._lock:
+                frame_index = next(self._frames)
+        entry = self.script[frame_index % len(self.script)]
+
+        h, w = frame.shape[:2]
+        classes, boxes = [], []
+        for name, box in entry:
+            x0, y0, x1, y1 = box or self._default_box(name)
+            classes.append(name)
+            boxes.append((x0 * w, y0 * h, x1 * w, y1 * h))
+
+        def plot():
+            img = frame.copy()
+            for name, (x0, y0, x1, y1) in zip(classes, boxes):
+                cv2.rectangle(img, (int(x0), int(y0)), (int(x1), int(y1)), (0, 0, 255), 2)
+                cv2.putText(img, name, (int(x0), int(y0) - 4), cv2.FONT_HERSHEY_SIMPLEX, 0.5, (0, 0, 255), 1)
+            return img
+
+        return Detections(frame, classes, boxes, plot=plot)
@@ -0,0 +1,32 @@
+from .base import Detector, Detections
+
+
+class YoloDetector(Detector):
+    """Ultralytics YOLO backend; imports torch/ultralytics only when constructed."""
+
+    def __init__(self, weights_path):
+        from ultralytics import YOLO
+        from cameras.detection import model_version
+
+        super().__init__(weights_path)
+        self.model = YOLO(weights_path)
+        self.names = [self.model.names[i] for i in sorted(self.model.names)]
+        self.version = model_version(weights_path)
+
+    def detect(self, frame, frame_index=None):
+        res = self.model(frame, verbose=False)[0]
+        boxes = res.boxes
+        cls = boxes.cls.cpu().numpy().astype(int)
+        return Detections(
+            frame,
+            classes=[res.names[c] for c in cls],
+            boxes=boxes.xyxy.cpu().numpy(),
+            confidences=boxes.conf.cpu().numpy(),
+            plot=res.plot,
+        )
+
+    def share_memory(self):
+        self.model.model.share_memory()
+        if getattr(self.model, "predictor", None) is not None:
+            # Warm-up fused the layers into the predictor's own copy of the weights
+            self.model.predictor.model.share_memory()
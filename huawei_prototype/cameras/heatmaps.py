@@ -0,0 +1,188 @@
+import os
+import time
+import logging
+import threading
+from contextlib import contextmanager
+import numpy as np
+import cv2
+from django.conf import settings
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+try:
+    import fcntl
+except ImportError:  # Windows dev servers run a single process
+    fcntl = None
+
+# Serialises read-merge-write of the on-disk arrays between streams in this process
+_flush_lock = threading.Lock()
+
+
+def heatmap_path(camera_id):
+    return os.path.join(settings.HEATMAP_DIR, f"camera_{camera_id}.npz")
+
+
+@contextmanager
+def _locked(camera_id):
+    """
+    Hold a camera's heatmap for a read-merge-write: the thread lock covers
+    streams in this process, an flock on a sidecar file covers the other
+    prefork workers streaming the same camera.
+    """
+    with _flush_lock:
+        if fcntl is None:
+            yield
+            return
+        os.makedirs(settings.HEATMAP_DIR, exist_ok=True)
+        with open(heatmap_path(camera_id) + ".lock", "a") as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock, fcntl.LOCK_UN)
+
+
+def load_heatmap(camera_id):
+    """Return (names, counts, frames, frame_size) from disk, or None if nothing was flushed yet."""
+    path = heatmap_path(camera_id)
+    if not os.path.exists(path):
+        return None
+    with np.load(path) as data:
+        return list(data["names"]), data["counts"], int(data["frames"]), tuple(data["frame_size"])
+
+
+class OccupancyGrid:
+    """
+    Per-camera, per-class count of how often each grid cell of the frame was
+    covered by a detection box.
+
+    Boxes are accumulated into a 2D difference array (+1/-1 at the box
+    corners) with np.add.at, so each frame costs four scatter-adds however
+    many boxes there are; the prefix sums that turn it into counts are only
+    taken when flushing to disk.
+    """
+
+    def __init__(self, camera_id, names=(), grid=None):
+        self.camera_id = camera_id
+        self.rows, self.cols = grid or settings.HEATMAP_GRID
+        self.names = []
+        self.index = {}
+        self.diff = np.zeros((0, self.rows + 1, self.cols + 1), dtype=np.int32)
+        self.frames = 0
+        self.frame_size = (0, 0)  # (width, height) of the frames seen
+        self.last_flush = time.monotonic()
+        self._add_names(names)
+
+    def _add_names(self, names):
+        new = [n for n in dict.fromkeys(names) if n not in self.index]
+        if not new:
+            return
+        for n in new:
+            self.index[n] = len(self.names)
+            self.names.append(n)
+        pad = np.zeros((len(new), self.rows + 1, self.cols + 1), dtype=np.int32)
+        self.diff = np.concatenate([self.diff, pad])
+
+    def add(self, detections):
+        """Accumulate one frame of detections."""
+        self.frames += 1
+        h, w = detections.frame.shape[:2]
+        self.frame_size = (w, h)
+        if not detections.classes:
+            return
+
+        self._add_names(detections.classes)
+        cls = np.fromiter((self.index[c] for c in detections.classes), dtype=np.intp, count=len(detections.classes))
+
+        # Box edges in grid cells; every box covers at least one cell
+        boxes = detections.boxes
+        x0 = np.clip((boxes[:, 0] / w * self.cols).astype(np.intp), 0, self.cols - 1)
+        y0 = np.clip((boxes[:, 1] / h * self.rows).astype(np.intp), 0, self.rows - 1)
+        x1 = np.clip(np.ceil(boxes[:, 2] / w * self.cols).astype(np.intp), x0 + 1, self.cols)
+        y1 = np.clip(np.ceil(boxes[:, 3] / h * self.rows).astype(np.intp), y0 + 1, self.rows)
+
+        np.add.at(self.diff, (cls, y0, x0), 1)
+        np.add.at(self.diff, (cls, y0, x1), -1)
+        np.add.at(self.diff, (cls, y1, x0), -1)
+        np.add.at(self.diff, (cls, y1, x1), 1)
+
+    def counts(self):
+        """Occupancy counts accumulated since the last flush, shape (classes, rows, cols)."""
+        return self.diff.cumsum(axis=1).cumsum(axis=2)[:, :self.rows, :self.cols].astype(np.uint32)
+
+    def maybe_flush(self):
+        if time.monotonic() - self.last_flush >= settings.HEATMAP_FLUSH_INTERVAL:
+            self.flush()
+
+    def flush(self):
+        """Merge the in-memory counts into the camera's .npz file and reset."""
+        self.last_flush = time.monotonic()
+        if not self.frames:
+            return
+
+        names, counts = list(self.names), self.counts()
+        frames, frame_size = self.frames, self.frame_size
+        self.diff[:] = 0
+        self.frames = 0
+
+        try:
+            with _locked(self.camera_id):
+                existing = load_heatmap(self.camera_id)
+                if existing is not None and existing[1].shape[1:] == counts.shape[1:]:
+                    old_names, old_counts, old_frames, _ = existing
+                    # Line classes up by name in case the detector's classes changed
+                    for n in old_names:
+                        if n not in names:
+                            names.append(n)
+                    merged = np.zeros((len(names),) + counts.shape[1:], dtype=np.uint32)
+                    merged[:len(counts)] = counts
+                    for i, n in enumerate(old_names):
+                        merged[names.index(n)] += old_counts[i]
+                    counts, frames = merged, frames + old_frames
+
+                os.makedirs(settings.HEATMAP_DIR, exist_ok=True)
+                path = heatmap_path(self.camera_id)
+                tmp = path + ".tmp.npz"
+                np.savez_compressed(
+                    tmp,
+                    names=np.array(names),
+                    counts=counts,
+                    frames=frames,
+                    frame_size=np.array(frame_size),
+                )
+                os.replace(tmp, path)
+        except Exception as e:
+            logger.error(f"Error flushing heatmap for camera {self.camera_id}: {e}")
+
+
+def render_overlay(camera_id, class_name=None, max_width=640):
+    """
+    Render a camera's heatmap as a transparent PNG with the frame's aspect
+    ratio, so it lines up when laid over the stream. Returns None if no data.
+    """
+    data = load_heatmap(camera_id)
+    if data is None:
+        return None
+    names, counts, _, (w, h) = data
+
+    if class_name:
+        if class_name not in names:
+            return None
+        grid = counts[names.index(class_name)].astype(np.float32)
+    else:
+        grid = counts.sum(axis=0, dtype=np.float32)
+
+    # Log scale so a few busy lanes don't wash out everything else
+    grid = np.log1p(grid)
+    if grid.max() > 0:
+        grid /= grid.max()
+
+    out_w = min(max_width, w or max_width)
+    out_h = max(1, round(out_w * h / w)) if w else round(out_w * grid.shape[0] / grid.shape[1])
+    grid = cv2.resize(grid, (out_w, out_h), interpolation=cv2.INTER_LINEAR)
+
+    colours = cv2.applyColorMap((grid * 255).astype(np.uint8), cv2.COLORMAP_JET)
+    alpha = (np.clip(grid, 0, 1) * 180).astype(np.uint8)
+    success, png = cv2.imencode(".png", np.dstack([colours, alpha]))
+    return png.tobytes() if success else None
@@ -0,0 +1,40 @@
+from django.core.management.base import BaseCommand, CommandError
+import psutil
+
+class Command(BaseCommand):
+    help = "Report RSS/PSS/USS of a server master and its worker processes"
+
+    def add_arguments(self, parser):
+        parser.add_argument("pid", type=int, help="PID of the gunicorn master")
+
+    def handle(self, *args, **options):
+        try:
+            master = psutil.Process(options["pid"])
+        except psutil.NoSuchProcess:
+            raise CommandError(f"No process with pid {options['pid']}")
+
+        procs = [master] + master.children(recursive=True)
+
+        # RSS counts shared pages once per process, so it overstates the saving from preloading;
+        # USS (memory unique to a process) and PSS (shared pages split between sharers) do not.
+        self.stdout.write(f"{'pid':>8} {'role':<8} {'rss MB':>10} {'pss MB':>10} {'uss MB':>10}")
+        totals = {"rss": 0, "pss": 0, "uss": 0}
+        for proc in procs:
+            try:
+                mem = proc.memory_full_info()
+            except (psutil.NoSuchProcess, psutil.AccessDenied):
+                continue
+            pss = getattr(mem, "pss", 0)  # Linux only
+            role = "master" if proc.pid == master.pid else "worker"
+            self.stdout.write(
+                f"{proc.pid:>8} {role:<8} {mem.rss / 2**20:>10.1f} {pss / 2**20:>10.1f} {mem.uss / 2**20:>10.1f}"
+            )
+            totals["rss"] += mem.rss
+            totals["pss"] += pss
+            totals["uss"] += mem.uss
+
+        workers = len(procs) - 1
+        self.stdout.write(self.style.SUCCESS(
+            f"{workers} workers: total rss {totals['rss'] / 2**20:.1f} MB, "
+            f"pss {totals['pss'] / 2**20:.1f} MB, uss {totals['uss'] / 2**20:.1f} MB"
+        ))
@@ -0,0 +1,36 @@
+from django.core.management.base import BaseCommand
+from django.conf import settings
+import cv2
+
+from cameras.monitor import CameraMonitor
+
+class Command(BaseCommand):
+    help = "Probe every camera feed on a schedule and raise alerts when cameras go offline"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--once", action="store_true", help="Run a single sweep and exit")
+        parser.add_argument("--interval", type=int, default=settings.CAMERA_MONITOR_INTERVAL)
+        parser.add_argument("--concurrency", type=int, default=settings.CAMERA_MONITOR_CONCURRENCY)
+
+    def handle(self, *args, **options):
+        # One decode thread per probe; parallelism is capped by the pool size instead
+        cv2.setNumThreads(1)
+        monitor = CameraMonitor(concurrency=options["concurrency"])
+
+        if not options["once"]:
+            self.stdout.write(f"Monitoring cameras every {options['interval']}s…")
+            monitor.run_forever(interval=options["interval"])
+            return
+
+        changes = monitor.run_once()
+        for camera, old, new in changes:
+            self.stdout.write(f"{camera.camera_name}: {old} -> {new}")
+
+        for health in monitor.health.values():
+            fps = f"{health.decode_fps} fps" if health.decode_fps else "no frames"
+            self.stdout.write(f"{health.camera_name}: {health.status}, {fps}, errors={health.total_errors}")
+
+        online = sum(1 for h in monitor.health.values() if h.status == "online")
+        self.stdout.write(self.style.SUCCESS(
+            f"Sweep complete: {online}/{len(monitor.health)} cameras online."
+        ))
@@ -0,0 +1,166 @@
+import os
+import time
+import logging
+from concurrent.futures import ThreadPoolExecutor
+import cv2
+from django.conf import settings
+from django.utils import timezone
+from dashboard.models import Camera, Notification, User
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+
+class CameraHealth:
+    """Liveness stats for a single camera feed, updated after every probe."""
+
+    def __init__(self, camera_id, camera_name):
+        self.camera_id = camera_id
+        self.camera_name = camera_name
+        self.status = "unknown"  # unknown / online / offline
+        self.decode_fps = None
+        self.last_frame_time = None
+        self.last_probe_time = None
+        self.consecutive_errors = 0
+        self.total_errors = 0
+        self.last_error = ""
+
+
+def feed_source(feed_url):
+    """Return what cv2.VideoCapture should open for a camera feed_url."""
+    if feed_url.startswith(("http://", "https://", "rtsp://")):
+        return feed_url
+    # Local files are stored relative to the project, same as camera_stream
+    return os.path.join(settings.BASE_DIR, feed_url.lstrip('/'))
+
+
+def probe_feed(feed_url, frames=None, timeout_ms=None):
+    """
+    Open a feed and decode a few frames.
+    Returns (frames_read, decode_fps, error); error is "" on success.
+    """
+    frames = frames or settings.CAMERA_MONITOR_PROBE_FRAMES
+    timeout_ms = timeout_ms or settings.CAMERA_MONITOR_TIMEOUT_MS
+
+    cap = cv2.VideoCapture(
+        feed_source(feed_url),
+        cv2.CAP_ANY,
+        [cv2.CAP_PROP_OPEN_TIMEOUT_MSEC, timeout_ms, cv2.CAP_PROP_READ_TIMEOUT_MSEC, timeout_ms],
+    )
+    try:
+        if not cap.isOpened():
+            return 0, None, "Cannot open video."
+
+        read = 0
+        start = time.monotonic()
+        for _ in range(frames):
+            ret, _frame = cap.read()
+            if not ret:
+                break
+            read += 1
+        elapsed = time.monotonic() - start
+
+        if read == 0:
+            return 0, None, "No frames decoded."
+        return read, round(read / elapsed, 1) if elapsed > 0 else None, ""
+    finally:
+        cap.release()
+
+
+def _alert_user():
+    """Notifications need an owner; reuse the first user like the notifications view does."""
+    user = User.objects.first()
+    if not user:
+        user = User.objects.create(
+            username="system",
+            password="not_a_real_password",
+            email="system@example.com"
+        )
+    return user
+
+
+class CameraMonitor:
+    """
+    Periodically probes every Camera.feed_url and raises an `alert`
+    Notification whenever a camera goes offline or comes back online.
+
+    Probes run on a small thread pool so that at most
+    CAMERA_MONITOR_CONCURRENCY feeds are decoded at once.
+    """
+
+    def __init__(self, concurrency=None, offline_after=None):
+        self.concurrency = concurrency or settings.CAMERA_MONITOR_CONCURRENCY
+        self.offline_after = offline_after or settings.CAMERA_MONITOR_OFFLINE_AFTER
+        self.health = {}  # camera_id -> CameraHealth
+
+    def run_once(self):
+        """Probe all cameras once and return the list of state changes."""
+        cameras = list(Camera.objects.only('camera_id', 'camera_name', 'feed_url'))
+
+        # Only the decoding happens in worker threads; all DB writes stay on this thread
+        with ThreadPoolExecutor(max_workers=self.concurrency) as pool:
+            results = list(pool.map(self.probe, cameras))
+
+        changes = []
+        for camera, result in zip(cameras, results):
+            change = self.record(camera, *result)
+            if change:
+                changes.append(change)
+        return changes
+
+    def probe(self, camera):
+        if not camera.feed_url:
+            return 0, None, "No feed URL."
+        try:
+            return probe_feed(camera.feed_url)
+        except Exception as e:
+            return 0, None, str(e)
+
+    def run_forever(self, interval=None):
+        interval = interval or settings.CAMERA_MONITOR_INTERVAL
+        while True:
+            started = time.monotonic()
+            try:
+                self.run_once()
+            except Exception as e:
+                logger.error(f"Camera monitor sweep failed: {e}")
+            time.sleep(max(0, interval - (time.monotonic() - started)))
+
+    def record(self, camera, frames_read, decode_fps, error):
+        """Update a camera's health from one probe result; returns (camera, old, new) on a state change."""
+        health = self.health.get(camera.camera_id)
+        if health is None:
+            health = self.health[camera.camera_id] = CameraHealth(camera.camera_id, camera.camera_name)
+
+        now = timezone.now()
+        health.last_probe_time = now
+        old_status = health.status
+
+        if frames_read:
+            health.decode_fps = decode_fps
+            health.last_frame_time = now
+            health.consecutive_errors = 0
+            health.last_error = ""
+            health.status = "online"
+        else:
+            health.decode_fps = None
+            health.consecutive_errors += 1
+            health.total_errors += 1
+            health.last_error = error
+            if health.consecutive_errors >= self.offline_after:
+                health.status = "offline"
+
+        if health.status == old_status:
+            return None
+
+        logger.info(f"Camera {camera.camera_name} changed from {old_status} to {health.status}")
+        if health.status == "offline":
+            message = f"Camera {camera.camera_name} offline – maintenance required ({health.last_error})"
+        elif old_status == "offline":
+            message = f"Camera {camera.camera_name} back online"
+        else:
+            # unknown -> online is just the first successful probe
+            return (camera, old_status, health.status)
+
+        Notification.objects.create(message=message, category="alert", user=_alert_user())
+        return (camera, old_status, health.status)
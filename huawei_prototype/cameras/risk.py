@@ -0,0 +1,93 @@
+import math
+import time
+import logging
+import threading
+from shapely.geometry import Point
+from django.conf import settings
+from django.utils import timezone
+from dashboard.models import AccidentProbabilityScore
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+
+class RiskUpdater:
+    """
+    Online accident risk for one camera, fed with the detector's classes every frame.
+
+    Each detected class adds evidence at its RISK_CLASS_WEIGHTS rate (per second
+    it is seen); evidence decays with a half-life of RISK_HALF_LIFE seconds and
+    is squashed to a 0-1 score with 1 - exp(-evidence). A new
+    AccidentProbabilityScore row is written only when the score has moved more
+    than RISK_PERSIST_DELTA from the last persisted value.
+    """
+
+    # Longest gap credited to a single frame, so a stalled stream doesn't count as a long detection
+    MAX_FRAME_GAP = 1.0
+
+    def __init__(self, camera):
+        self.camera = camera
+        self.decay = math.log(2) / settings.RISK_HALF_LIFE
+        self.evidence = 0.0
+        self.last_update = None
+        self.persisted_score = 0.0  # no row needed while risk stays near zero
+        self._lock = threading.Lock()
+        self._resume_from_db()
+
+    def _resume_from_db(self):
+        """Start from the latest stored score, decayed for the time since it was written."""
+        latest = AccidentProbabilityScore.objects.filter(camera=self.camera).order_by('-timestamp').first()
+        if latest is None:
+            return
+        self.persisted_score = latest.accident_prob_score
+        age = (timezone.now() - latest.timestamp).total_seconds()
+        score = min(max(latest.accident_prob_score, 0.0), 0.999)
+        self.evidence = -math.log(1 - score) * math.exp(-self.decay * max(age, 0))
+
+    @property
+    def score(self):
+        return 1 - math.exp(-self.evidence)
+
+    def update(self, classes, now=None):
+        """Decay, add this frame's detections, and persist if the score moved enough. Returns the score."""
+        now = time.monotonic() if now is None else now
+        weights = settings.RISK_CLASS_WEIGHTS
+
+        with self._lock:
+            dt = 0.0 if self.last_update is None else max(now - self.last_update, 0.0)
+            self.last_update = now
+            self.evidence *= math.exp(-self.decay * dt)
+            if classes:
+                frame_dt = min(dt, self.MAX_FRAME_GAP)
+                self.evidence += frame_dt * sum(weights.get(c, weights.get("default", 0.0)) for c in set(classes))
+
+            score = self.score
+            if abs(score - self.persisted_score) <= settings.RISK_PERSIST_DELTA:
+                return score
+            self.persisted_score = score
+
+        self._persist(score)
+        return score
+
+    def _persist(self, score):
+        try:
+            AccidentProbabilityScore.objects.create(
+                camera=self.camera,
+                accident_prob_score=round(score, 3),
+                geometry=Point(self.camera.latitude, self.camera.longitude),
+            )
+        except Exception as e:
+            logger.error(f"Error persisting risk score for camera {self.camera.camera_id}: {e}")
+
+
+# One updater per camera, shared by every stream of that camera in this process
+_updaters = {}
+_updaters_lock = threading.Lock()
+
+
+def get_updater(camera):
+    with _updaters_lock:
+        updater = _updaters.get(camera.camera_id)
+        if updater is None:
+            updater = _updaters[camera.camera_id] = RiskUpdater(camera)
+        return updater
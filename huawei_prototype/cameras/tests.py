@@ -1,7 +1,20 @@
-from django.test import TestCase, Client
+from django.test import TestCase, Client, override_settings
 from django.urls import reverse
-from dashboard.models import Camera, Weather, AccidentProbabilityScore
+from django.conf import settings
+from dashboard.models import Camera, CameraState, Weather, AccidentProbabilityScore, Incident, Notification
+from cameras import detection, risk
+from cameras.detectors import Detections
+from cameras.detectors.stub import StubDetector
+from cameras.heatmaps import OccupancyGrid, load_heatmap
+from cameras.monitor import CameraMonitor
 from datetime import datetime, timedelta
+from unittest.mock import patch
+import cv2
+import multiprocessing
+import numpy as np
+import os
+import shutil
+import tempfile
 
 
 class CameraListViewTests(TestCase):
@@ -216,3 +229,361 @@ class CameraFeedViewTests(TestCase):
         self.assertTrue("accident_prob_score" in response.context)
         self.assertTrue("risk_level" in response.context)
         self.assertTrue(isinstance(response.context["accident_prob_score"], float))
+
+
+class CameraMonitorTests(TestCase):
+    """Tests for the camera liveness monitor."""
+
+    def setUp(self):
+        self.camera = Camera.objects.create(
+            camera_id=1,
+            camera_name="CTE-04",
+            location="1.3545,103.8390",
+            road_name="Central Expressway",
+            feed_url="https://example.com/cte04",
+        )
+        self.monitor = CameraMonitor(concurrency=1, offline_after=2)
+
+    def test_offline_after_consecutive_failures(self):
+        """Test that a camera only goes offline after repeated failed probes."""
+        with patch("cameras.monitor.probe_feed", return_value=(0, None, "Cannot open video.")):
+            self.monitor.run_once()
+            self.assertEqual(self.monitor.health[1].status, "unknown")
+            self.assertFalse(Notification.objects.exists())
+
+            changes = self.monitor.run_once()
+
+        self.assertEqual(self.monitor.health[1].status, "offline")
+        self.assertEqual(self.monitor.health[1].total_errors, 2)
+        self.assertEqual(len(changes), 1)
+        alert = Notification.objects.get()
+        self.assertEqual(alert.category, "alert")
+        self.assertIn("CTE-04 offline", alert.message)
+
+    def test_back_online_notification(self):
+        """Test that recovering from offline raises a second alert."""
+        with patch("cameras.monitor.probe_feed", return_value=(0, None, "Cannot open video.")):
+            self.monitor.run_once()
+            self.monitor.run_once()
+        with patch("cameras.monitor.probe_feed", return_value=(5, 24.0, "")):
+            self.monitor.run_once()
+
+        health = self.monitor.health[1]
+        self.assertEqual(health.status, "online")
+        self.assertEqual(health.decode_fps, 24.0)
+        self.assertIsNotNone(health.last_frame_time)
+        self.assertEqual(Notification.objects.count(), 2)
+        self.assertTrue(Notification.objects.filter(message__contains="back online").exists())
+
+    def test_first_successful_probe_is_silent(self):
+        """Test that cameras coming online on the first sweep do not raise alerts."""
+        with patch("cameras.monitor.probe_feed", return_value=(5, 30.0, "")):
+            self.monitor.run_once()
+        self.assertEqual(self.monitor.health[1].status, "online")
+        self.assertFalse(Notification.objects.exists())
+
+
+def stub_detector(version):
+    """A stub detector standing in for a particular set of weights."""
+    detector = StubDetector()
+    detector.version = version
+    return detector
+
+
+class DetectorReloadTests(TestCase):
+    """Tests for hot-swapping detector weights."""
+
+    def setUp(self):
+        self.weights_dir = tempfile.mkdtemp()
+        self.weights = os.path.join(self.weights_dir, "best.pt")
+        with open(self.weights, "wb") as f:
+            f.write(b"v1")
+        detection._active = None
+        self.addCleanup(setattr, detection, "_active", None)
+        self.addCleanup(shutil.rmtree, self.weights_dir)
+
+    def test_reload_swaps_model_and_version(self):
+        """Test that reloading swaps in the new weights and changes the version."""
+        old, new = stub_detector("best.pt@1"), stub_detector("best.pt@2")
+        with override_settings(YOLO_MODEL_PATH=self.weights, YOLO_RELOAD_CHECK_INTERVAL=0), \
+                patch("cameras.detection.load_model", side_effect=[old, new]):
+            self.assertEqual(detection.get_model(), (old, "best.pt@1"))
+
+            with open(self.weights, "wb") as f:
+                f.write(b"v2")
+            self.assertEqual(detection.reload_model(), "best.pt@2")
+            self.assertEqual(detection.get_model(), (new, "best.pt@2"))
+
+    def test_failed_reload_keeps_old_model(self):
+        """Test that weights which fail to load leave the current model in place."""
+        old = stub_detector("best.pt@1")
+        with override_settings(YOLO_MODEL_PATH=self.weights, YOLO_RELOAD_CHECK_INTERVAL=0), \
+                patch("cameras.detection.load_model", side_effect=[old, RuntimeError("corrupt")]):
+            detection.get_model()
+            with self.assertRaises(RuntimeError):
+                detection.reload_model()
+            self.assertEqual(detection.get_model(), (old, "best.pt@1"))
+
+    def test_model_version_hashes_weights(self):
+        """Test that the version changes with the weights file contents."""
+        version = detection.model_version(self.weights)
+        self.assertTrue(version.startswith("best.pt@"))
+        with open(self.weights, "wb") as f:
+            f.write(b"v2")
+        self.assertNotEqual(detection.model_version(self.weights), version)
+
+
+@override_settings(
+    DETECTOR_BACKEND="cameras.detectors.stub.StubDetector",
+    DETECTOR_STUB_SCRIPT=[["Tailgating"], ["Vehicle fire", "Tailgating"]] + [[]] * 6,
+    YOLO_RELOAD_CHECK_INTERVAL=0,
+)
+class StubDetectorStreamTests(TestCase):
+    """Tests for the stream/event/incident pipeline driven by the stub detector."""
+
+    def setUp(self):
+        detection._active = None
+        self.addCleanup(setattr, detection, "_active", None)
+        risk._updaters.clear()
+        self.addCleanup(risk._updaters.clear)
+
+        from django.contrib.auth import get_user_model
+        get_user_model().objects.create_user(username="streamuser", password="testpass")
+        self.client.login(username="streamuser", password="testpass")
+
+        # Short local clip for camera_stream to read
+        self.video_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.video_dir)
+        heatmap_settings = override_settings(HEATMAP_DIR=os.path.join(self.video_dir, "heatmaps"))
+        heatmap_settings.enable()
+        self.addCleanup(heatmap_settings.disable)
+        video = os.path.join(self.video_dir, "clip.avi")
+        writer = cv2.VideoWriter(video, cv2.VideoWriter_fourcc(*"MJPG"), 10, (64, 48))
+        for i in range(8):
+            writer.write(np.full((48, 64, 3), i * 20, dtype=np.uint8))
+        writer.release()
+
+        self.camera = Camera.objects.create(
+            camera_id=1,
+            camera_name="TEST-01",
+            location="1.3099,103.9053",
+            road_name="Test Road A",
+            feed_url=os.path.relpath(video, settings.BASE_DIR),
+        )
+
+    def test_stub_replays_script(self):
+        """Test that the stub returns the scripted detections in order."""
+        detector = detection.load_model(None)
+        frame = np.zeros((48, 64, 3), dtype=np.uint8)
+        self.assertEqual(detector.detect(frame).classes, ["Tailgating"])
+        dets = detector.detect(frame)
+        self.assertEqual(dets.classes, ["Vehicle fire", "Tailgating"])
+        self.assertEqual(dets.boxes.shape, (2, 4))
+        self.assertEqual(detector.detect(frame).classes, [])
+
+    def test_stream_creates_incident(self):
+        """Test that a scripted event becomes one incident with the worst class."""
+        response = self.client.get(reverse("camera_stream", args=[1]))
+        self.assertEqual(response.status_code, 200)
+        chunks = list(response.streaming_content)
+        self.assertEqual(len(chunks), 8)
+
+        incident = Incident.objects.get()
+        self.assertEqual(incident.incident_type, "Vehicle fire")
+        self.assertEqual(incident.severity, "high")
+        self.assertEqual(incident.model_version, "stub")
+
+        # The stream marked the camera as live and the new incident as open
+        state = CameraState.objects.get(camera_id=1)
+        self.assertIsNotNone(state.last_frame_time)
+        self.assertEqual(state.open_incidents, 1)
+
+        # Boxes from the stream were flushed to the camera's heatmap
+        names, counts, frames, _ = load_heatmap(1)
+        self.assertEqual(frames, 8)
+        self.assertEqual(counts[names.index("Tailgating")].max(), 2)
+        self.assertEqual(counts[names.index("Vehicle fire")].max(), 1)
+
+    def test_interleaved_streams_replay_own_script(self):
+        """Test that two streams read in turns each see the script from their first frame."""
+        first = iter(self.client.get(reverse("camera_stream", args=[1])).streaming_content)
+        second = iter(self.client.get(reverse("camera_stream", args=[1])).streaming_content)
+        for _ in range(8):
+            next(first)
+            next(second)
+        for stream in (first, second):
+            self.assertEqual(list(stream), [])
+
+        incidents = Incident.objects.all()
+        self.assertEqual([i.incident_type for i in incidents], ["Vehicle fire", "Vehicle fire"])
+
+    def test_incident_keeps_version_of_opening_frame(self):
+        """Test that weights reloaded mid-event don't change the event's model version."""
+        detector = detection.load_model(None)
+        versions = iter(["stub@1"] + ["stub@2"] * 7)
+        with patch("cameras.detection.get_model", side_effect=lambda: (detector, next(versions))):
+            list(self.client.get(reverse("camera_stream", args=[1])).streaming_content)
+        self.assertEqual(Incident.objects.get().model_version, "stub@1")
+
+    def test_disconnect_releases_capture(self):
+        """Test that a client leaving mid-stream releases the video capture."""
+        captures = []
+        open_capture = cv2.VideoCapture
+        with patch("cameras.views.cv2.VideoCapture", side_effect=lambda path: captures.append(open_capture(path)) or captures[-1]):
+            response = self.client.get(reverse("camera_stream", args=[1]))
+            next(iter(response.streaming_content))
+            self.assertTrue(captures[0].isOpened())
+            # What the WSGI server does when the client goes away
+            response.close()
+        self.assertFalse(captures[0].isOpened())
+
+    @override_settings(DETECTOR_STUB_SCRIPT=[["Jaywalking"]] + [[]] * 5 + [["Jaywalking", "Tailgating"], []])
+    def test_unranked_class_does_not_end_stream(self):
+        """Test that a class missing from the severity ranking still makes incidents, below the ranked ones."""
+        chunks = list(self.client.get(reverse("camera_stream", args=[1])).streaming_content)
+        self.assertEqual(len(chunks), 8)
+        incidents = Incident.objects.order_by("pk")
+        self.assertEqual([(i.incident_type, i.severity) for i in incidents], [("Jaywalking", "medium"), ("Tailgating", "medium")])
+
+
+class OccupancyGridTests(TestCase):
+    """Tests for per-camera detection occupancy heatmaps."""
+
+    def setUp(self):
+        self.heatmap_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.heatmap_dir)
+        heatmap_settings = override_settings(HEATMAP_DIR=self.heatmap_dir)
+        heatmap_settings.enable()
+        self.addCleanup(heatmap_settings.disable)
+        self.frame = np.zeros((100, 200, 3), dtype=np.uint8)
+
+    def test_boxes_fill_covered_cells(self):
+        """Test that each box adds one to every cell it covers."""
+        grid = OccupancyGrid(1, names=["Tailgating", "Vehicle fire"], grid=(10, 20))
+        grid.add(Detections(self.frame, ["Tailgating"], [(0, 0, 50, 30)]))
+        grid.add(Detections(self.frame, ["Tailgating", "Vehicle fire"], [(20, 10, 50, 30), (190, 90, 200, 100)]))
+
+        counts = grid.counts()
+        self.assertEqual(counts.shape, (2, 10, 20))
+        self.assertEqual(counts[0, 0, 0], 1)    # first box only
+        self.assertEqual(counts[0, 2, 3], 2)    # both boxes
+        self.assertEqual(counts[0, 3, 5], 0)    # outside both
+        self.assertEqual(counts[0].sum(), 5 * 3 + 3 * 2)
+        self.assertEqual(counts[1, 9, 19], 1)
+        self.assertEqual(counts[1].sum(), 1)
+
+    def test_flush_merges_with_disk(self):
+        """Test that successive flushes add up on disk, lining classes up by name."""
+        grid = OccupancyGrid(1, names=["Tailgating"], grid=(10, 20))
+        grid.add(Detections(self.frame, ["Tailgating"], [(0, 0, 10, 10)]))
+        grid.flush()
+
+        grid = OccupancyGrid(1, names=["Vehicle fire", "Tailgating"], grid=(10, 20))
+        grid.add(Detections(self.frame, ["Tailgating"], [(0, 0, 10, 10)]))
+        grid.add(Detections(self.frame, [], []))
+        grid.flush()
+
+        names, counts, frames, frame_size = load_heatmap(1)
+        self.assertEqual(frames, 3)
+        self.assertEqual(frame_size, (200, 100))
+        self.assertEqual(counts[names.index("Tailgating"), 0, 0], 2)
+        self.assertEqual(counts[names.index("Vehicle fire")].sum(), 0)
+
+    def test_concurrent_process_flushes_add_up(self):
+        """Test that workers in separate processes flushing one camera don't lose each other's counts."""
+        def worker():
+            for _ in range(10):
+                grid = OccupancyGrid(1, names=["Tailgating"], grid=(10, 20))
+                grid.add(Detections(self.frame, ["Tailgating"], [(0, 0, 10, 10)]))
+                grid.flush()
+            os._exit(0)
+
+        context = multiprocessing.get_context("fork")
+        processes = [context.Process(target=worker) for _ in range(4)]
+        for process in processes:
+            process.start()
+        for process in processes:
+            process.join()
+
+        names, counts, frames, _ = load_heatmap(1)
+        self.assertEqual(frames, 40)
+        self.assertEqual(counts[names.index("Tailgating"), 0, 0], 40)
+
+    def test_overlay_endpoint(self):
+        """Test that the overlay is served as a PNG once data exists."""
+        from django.contrib.auth import get_user_model
+        get_user_model().objects.create_user(username="heatuser", password="testpass")
+        self.client.login(username="heatuser", password="testpass")
+        Camera.objects.create(
+            camera_id=1,
+            camera_name="TEST-01",
+            location="1.3099,103.9053",
+            road_name="Test Road A",
+            feed_url="https://example.com/test01",
+        )
+        url = reverse("camera_heatmap", args=[1])
+        self.assertEqual(self.client.get(url).status_code, 404)
+
+        grid = OccupancyGrid(1)
+        grid.add(Detections(self.frame, ["Tailgating"], [(0, 0, 50, 50)]))
+        grid.flush()
+
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response["Content-Type"], "image/png")
+        self.assertEqual(self.client.get(url + "?class=Tailgating").status_code, 200)
+
+
+@override_settings(RISK_HALF_LIFE=60, RISK_PERSIST_DELTA=0.05)
+class RiskUpdaterTests(TestCase):
+    """Tests for the online exponential-decay risk updater."""
+
+    def setUp(self):
+        self.camera = Camera.objects.create(
+            camera_id=1,
+            camera_name="TEST-01",
+            location="1.3099,103.9053",
+            road_name="Test Road A",
+            feed_url="https://example.com/test01",
+        )
+
+    def test_detections_raise_score_and_persist_on_delta(self):
+        """Test that sustained detections raise risk, writing rows only on large moves."""
+        updater = risk.RiskUpdater(self.camera)
+        updater.update([], now=0.0)
+        self.assertFalse(AccidentProbabilityScore.objects.exists())
+
+        # 30 seconds of fire detections at 10 fps
+        for i in range(1, 301):
+            score = updater.update(["Vehicle fire"], now=i / 10)
+
+        self.assertGreater(score, 0.5)
+        rows = AccidentProbabilityScore.objects.filter(camera=self.camera).order_by("timestamp")
+        self.assertGreater(rows.count(), 1)
+        self.assertLess(rows.count(), 30)
+        self.assertAlmostEqual(rows.last().accident_prob_score, updater.persisted_score, places=3)
+        self.assertEqual(rows.last().geometry.coords[0], (1.3099, 103.9053))
+
+    def test_score_decays_without_detections(self):
+        """Test that risk decays back towards zero once detections stop."""
+        updater = risk.RiskUpdater(self.camera)
+        updater.update([], now=0.0)
+        high = updater.update(["Multiple collision"], now=1.0)
+        for i in range(2, 20):
+            high = updater.update(["Multiple collision"], now=float(i))
+        low = updater.update([], now=600.0)
+
+        self.assertLess(low, high / 100)
+        self.assertAlmostEqual(AccidentProbabilityScore.objects.order_by("-accident_prob_score_id").first().accident_prob_score, round(low, 3))
+
+    def test_resumes_from_latest_score(self):
+        """Test that a new updater starts from the latest stored score."""
+        AccidentProbabilityScore.objects.create(
+            camera=self.camera,
+            area_geometry="POINT(1.3099 103.9053)",
+            accident_prob_score=0.6,
+        )
+        updater = risk.RiskUpdater(self.camera)
+        self.assertAlmostEqual(updater.score, 0.6, places=2)
+        updater.update([], now=0.0)
+        self.assertEqual(AccidentProbabilityScore.objects.count(), 1)
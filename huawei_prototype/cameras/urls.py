@@ -5,4 +5,5 @@ urlpatterns = [
     path('', views.cameras, name='cameras'),
     path('view/<int:camera_id>/', views.camera_feed, name='camera_feed'),
     path('stream/<int:camera_id>/', views.camera_stream, name='camera_stream'),
+    path('heatmap/<int:camera_id>/', views.camera_heatmap, name='camera_heatmap'),
 ]
@@ -1,16 +1,18 @@
-import os, logging, random, cv2
-from datetime import datetime, timedelta
+import os, logging, random, time, itertools, cv2
+from datetime import datetime
 from django.shortcuts import render, get_object_or_404
 from django.core.paginator import Paginator
-from django.http import StreamingHttpResponse, HttpResponseNotFound
+from django.http import StreamingHttpResponse, HttpResponseNotFound, HttpResponse
 from django.conf import settings
 from django.db.models import Q
+from django.utils import timezone
 from django.contrib.auth.decorators import login_required
-from ultralytics import YOLO
-from dashboard.models import Camera, Weather, AccidentProbabilityScore, Incident
+from dashboard.models import Camera, CameraState, Incident
+from . import detection
+from .heatmaps import OccupancyGrid, load_heatmap, render_overlay
+from .risk import get_updater
 
 logger = logging.getLogger(__name__)
-model = YOLO(settings.YOLO_MODEL_PATH)  # load once
 
 @login_required
 def cameras(request):
@@ -31,20 +33,20 @@ def cameras(request):
 def camera_feed(request, camera_id):
     """Renders the page with an MJPEG <img> pointing at camera_stream."""
     camera = get_object_or_404(Camera, camera_id=camera_id)
-    # fetch weather & risk (same as before)...
-    try:
-        w = Weather.objects.filter(camera=camera).latest('timestamp')
-        weather = {"temperature": w.temperature,"conditions":w.conditions,"updated":w.timestamp}
-    except Weather.DoesNotExist:
+    # fetch current weather & risk from the camera's state row
+    state = CameraState.objects.filter(camera=camera).first()
+    if state and state.weather_updated:
+        weather = {"temperature": state.temperature,"conditions":state.conditions,"updated":state.weather_updated}
+    else:
         weather = {"temperature":round(random.uniform(25,33),1),
                    "conditions":random.choice(["Sunny","Cloudy","Rain","Clear","Hazy"]),
                    "updated":datetime.now()}
-    try:
-        p = AccidentProbabilityScore.objects.filter(camera=camera).latest('timestamp')
-        acc_prob = p.accident_prob_score
-    except AccidentProbabilityScore.DoesNotExist:
+    if state and state.score_updated:
+        acc_prob = state.accident_prob_score
+    else:
         acc_prob = round(random.uniform(0.2,0.8),2)
     risk = "High" if acc_prob>=0.7 else "Medium" if acc_prob>=0.4 else "Low"
+    heatmap = load_heatmap(camera.camera_id)
 
     return render(request, "cameras/camera_feed.html", {
         'camera': camera,
@@ -53,7 +55,8 @@ def camera_feed(request, camera_id):
         'risk_level': risk,
         'timestamp': datetime.now(),
         'title': f"Camera: {camera.camera_name}",
-        'description': "Live annotated stream"
+        'description': "Live annotated stream",
+        'heatmap_classes': heatmap[0] if heatmap else [],
     })
 
 @login_required
@@ -84,67 +87,104 @@ def camera_stream(request, camera_id):
         "Tailgating",
         "Self-accident",
     ]
+    # Classes a detector backend adds beyond these rank below all of them
+    severity_rank = {name: i for i, name in enumerate(severity_ranking)}
 
     in_event = False
     event_buffer = set()
     no_det_count = 0
     no_det_threshold = 5
+    model_version = ""
+    event_version = ""
+    occupancy = OccupancyGrid(camera.camera_id)
+    risk = get_updater(camera)
+    last_state_write = 0.0
 
     def gen():
-        nonlocal in_event, event_buffer, no_det_count
-
-        while True:
-            ret, frame = cap.read()
-            if not ret:
-                break
-
-            res = model(frame)[0]
-            img = res.plot()
-
-            frame_classes = [res.names[int(c)] for c in getattr(res.boxes, "cls", [])]
-
-            if frame_classes:
-                if not in_event:
-                    in_event = True
-                    event_buffer.clear()
-                    no_det_count = 0
-                event_buffer.update(frame_classes)
-                no_det_count = 0
-            else:
-                if in_event:
-                    no_det_count += 1
-                    if no_det_count >= no_det_threshold:
-                        # Event ended → choose highest‐severity class
-                        chosen = min(event_buffer, key=lambda x: severity_ranking.index(x))
-                        sev = severity_map.get(chosen, "medium")
-                        Incident.objects.create(
-                            incident_type=chosen,
-                            severity=sev,
-                            camera=camera
-                        )
-                        in_event = False
+        nonlocal in_event, event_buffer, no_det_count, model_version, event_version, last_state_write
+
+        try:
+            for frame_index in itertools.count():
+                ret, frame = cap.read()
+                if not ret:
+                    break
+
+                # Fetch the detector per frame so hot-reloaded weights take over at a frame boundary
+                detector, model_version = detection.get_model()
+                dets = detector.detect(frame, frame_index)
+                img = dets.plot()
+
+                frame_classes = dets.classes
+                occupancy.add(dets)
+                occupancy.maybe_flush()
+                risk.update(frame_classes)
+
+                # Frame liveness for the camera's state row, throttled to keep writes off the frame path
+                if time.monotonic() - last_state_write >= settings.CAMERA_STATE_FRAME_INTERVAL:
+                    last_state_write = time.monotonic()
+                    CameraState.record(camera.camera_id, 'last_frame_time', timezone.now())
+
+                if frame_classes:
+                    if not in_event:
+                        in_event = True
                         event_buffer.clear()
                         no_det_count = 0
-
-            success, jpeg = cv2.imencode('.jpg', img)
-            if success:
-                yield (b'--frame\r\n'
-                       b'Content-Type: image/jpeg\r\n\r\n' +
-                       jpeg.tobytes() +
-                       b'\r\n')
+                        # A reload mid-event doesn't reattribute it; the opening frame's model owns it
+                        event_version = model_version
+                    event_buffer.update(frame_classes)
+                    no_det_count = 0
+                else:
+                    if in_event:
+                        no_det_count += 1
+                        if no_det_count >= no_det_threshold:
+                            # Event ended → choose highest‐severity class
+                            chosen = min(event_buffer, key=lambda x: severity_rank.get(x, len(severity_rank)))
+                            sev = severity_map.get(chosen, "medium")
+                            Incident.objects.create(
+                                incident_type=chosen,
+                                severity=sev,
+                                camera=camera,
+                                model_version=event_version
+                            )
+                            in_event = False
+                            event_buffer.clear()
+                            no_det_count = 0
+
+                success, jpeg = cv2.imencode('.jpg', img)
+                if success:
+                    yield (b'--frame\r\n'
+                           b'Content-Type: image/jpeg\r\n\r\n' +
+                           jpeg.tobytes() +
+                           b'\r\n')
+        finally:
+            # Also runs when the client disconnects mid-stream
+            occupancy.flush()
+            cap.release()
 
         # Flush any open event at end of video
         if in_event and event_buffer:
-            chosen = min(event_buffer, key=lambda x: severity_ranking.index(x))
+            chosen = min(event_buffer, key=lambda x: severity_rank.get(x, len(severity_rank)))
             sev = severity_map.get(chosen, "medium")
             Incident.objects.create(
                 incident_type=chosen,
                 severity=sev,
-                camera=camera
+                camera=camera,
+                model_version=event_version
             )
-        cap.release()
 
     return StreamingHttpResponse(
         gen(),
         content_type='multipart/x-mixed-replace; boundary=frame'
     )
+
+@login_required
+def camera_heatmap(request, camera_id):
+    """Detection hotspot overlay (transparent PNG) for the camera feed page."""
+    camera = get_object_or_404(Camera, camera_id=camera_id)
+    png = render_overlay(camera.camera_id, request.GET.get('class'))
+    if png is None:
+        return HttpResponseNotFound("No heatmap data.")
+    response = HttpResponse(png, content_type='image/png')
+    # The file only changes when a stream flushes
+    response['Cache-Control'] = f"private, max-age={settings.HEATMAP_FLUSH_INTERVAL}"
+    return response
@@ -7,6 +7,7 @@ import osmnx as ox
 import numpy as np
 from shapely.ops import unary_union
 
+from geomap.roads import load_drive_graph
 from dashboard.models import (
     Camera, Weather, AccidentProbabilityScore,
     Incident, ResponseTime
@@ -28,9 +29,9 @@ class Command(BaseCommand):
             {"name": "Kallang-Paya Lebar Expressway", "code": "KPE"},
         ]
 
-        # 2) Download Singapore’s drivable graph once
+        # 2) Download Singapore’s drivable graph once, kept for road segments and routing
         self.stdout.write("Fetching Singapore road network…")
-        G = ox.graph_from_place("Singapore", network_type="drive")
+        G = load_drive_graph()
         edges = ox.graph_to_gdfs(G, nodes=False, edges=True)
 
         total_cams = total_scores = total_incidents = 0
@@ -69,6 +70,8 @@ class Command(BaseCommand):
                     camera_name=cam_name,
                     defaults={
                         "location": f"{lat:.6f},{lng:.6f}",
+                        "latitude": lat,
+                        "longitude": lng,
                         "road_name": name,
                         "feed_url": f"https://example.com/feed/{cam_name.lower()}.mp4"
                     }
@@ -0,0 +1,18 @@
+# Generated by Django 4.2.11 on 2026-10-19 11:13
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('dashboard', '0005_rename_accident_probability_score_accidentprobabilityscore_accident_prob_score_and_more'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='incident',
+            name='model_version',
+            field=models.CharField(blank=True, default='', help_text='Detector weights that raised the incident', max_length=100),
+        ),
+    ]
@@ -0,0 +1,41 @@
+# Generated by Django 4.2.11 on 2026-10-19 11:19
+
+from django.db import migrations, models
+
+
+def populate_coordinates(apps, schema_editor):
+    """Fill latitude/longitude from the existing "lat,lng" location strings."""
+    Camera = apps.get_model('dashboard', 'Camera')
+    cameras = []
+    for camera in Camera.objects.only('camera_id', 'location').iterator():
+        try:
+            camera.latitude, camera.longitude = map(float, camera.location.split(','))
+        except ValueError:
+            continue
+        cameras.append(camera)
+    Camera.objects.bulk_update(cameras, ['latitude', 'longitude'], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('dashboard', '0006_incident_model_version'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='camera',
+            name='latitude',
+            field=models.FloatField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='camera',
+            name='longitude',
+            field=models.FloatField(blank=True, null=True),
+        ),
+        migrations.RunPython(populate_coordinates, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='camera',
+            index=models.Index(fields=['latitude', 'longitude'], name='camera_lat_lng_idx'),
+        ),
+    ]
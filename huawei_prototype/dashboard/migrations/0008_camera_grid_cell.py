@@ -0,0 +1,34 @@
+# Generated by Django 4.2.11 on 2026-10-19 11:20
+
+from django.db import migrations, models
+
+# Frozen copies of dashboard.models.GRID_CELL_DEGREES / GRID_CELL_COLUMNS
+CELL_DEGREES = 0.01
+CELL_COLUMNS = 36000
+
+
+def populate_grid_cells(apps, schema_editor):
+    Camera = apps.get_model('dashboard', 'Camera')
+    cameras = []
+    for camera in Camera.objects.exclude(latitude=None).only('camera_id', 'latitude', 'longitude').iterator():
+        row = int((camera.latitude + 90) // CELL_DEGREES)
+        col = int((camera.longitude + 180) // CELL_DEGREES)
+        camera.grid_cell = row * CELL_COLUMNS + col
+        cameras.append(camera)
+    Camera.objects.bulk_update(cameras, ['grid_cell'], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('dashboard', '0007_camera_latitude_longitude'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='camera',
+            name='grid_cell',
+            field=models.IntegerField(blank=True, db_index=True, null=True),
+        ),
+        migrations.RunPython(populate_grid_cells, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,50 @@
+# Generated by Django 4.2.11 on 2026-10-19 11:32
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def backfill_camera_state(apps, schema_editor):
+    Camera = apps.get_model('dashboard', 'Camera')
+    CameraState = apps.get_model('dashboard', 'CameraState')
+    Weather = apps.get_model('dashboard', 'Weather')
+    AccidentProbabilityScore = apps.get_model('dashboard', 'AccidentProbabilityScore')
+    Incident = apps.get_model('dashboard', 'Incident')
+
+    states = []
+    for camera_id in Camera.objects.values_list('camera_id', flat=True).iterator():
+        state = CameraState(camera_id=camera_id)
+        weather = Weather.objects.filter(camera_id=camera_id).order_by('-timestamp', '-weather_id').first()
+        if weather:
+            state.temperature, state.conditions, state.weather_updated = weather.temperature, weather.conditions, weather.timestamp
+        score = AccidentProbabilityScore.objects.filter(camera_id=camera_id) \
+                                                .order_by('-timestamp', '-accident_prob_score_id').first()
+        if score:
+            state.accident_prob_score, state.score_updated = score.accident_prob_score, score.timestamp
+        state.open_incidents = Incident.objects.filter(camera_id=camera_id, response_times__isnull=True).count()
+        states.append(state)
+    CameraState.objects.bulk_create(states, batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('dashboard', '0008_camera_grid_cell'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CameraState',
+            fields=[
+                ('camera', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='state', serialize=False, to='dashboard.camera')),
+                ('temperature', models.FloatField(blank=True, null=True)),
+                ('conditions', models.CharField(blank=True, default='', max_length=100)),
+                ('weather_updated', models.DateTimeField(blank=True, null=True)),
+                ('accident_prob_score', models.FloatField(blank=True, null=True)),
+                ('score_updated', models.DateTimeField(blank=True, null=True)),
+                ('open_incidents', models.IntegerField(default=0, help_text='Incidents without a recorded response time')),
+                ('last_frame_time', models.DateTimeField(blank=True, null=True)),
+            ],
+        ),
+        migrations.RunPython(backfill_camera_state, migrations.RunPython.noop),
+    ]
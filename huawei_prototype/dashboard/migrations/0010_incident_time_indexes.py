@@ -0,0 +1,25 @@
+# Generated by Django 4.2.11 on 2026-10-19 11:50
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('dashboard', '0009_camerastate'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='incident',
+            index=models.Index(fields=['timestamp'], name='incident_time_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='incident',
+            index=models.Index(fields=['severity', 'timestamp'], name='incident_severity_time_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='incident',
+            index=models.Index(fields=['incident_type', 'timestamp'], name='incident_type_time_idx'),
+        ),
+    ]
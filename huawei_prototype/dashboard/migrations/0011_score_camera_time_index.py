@@ -0,0 +1,17 @@
+# Generated by Django 4.2.11 on 2026-10-19 12:05
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('dashboard', '0010_incident_time_indexes'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='accidentprobabilityscore',
+            index=models.Index(fields=['camera', 'timestamp'], name='score_camera_time_idx'),
+        ),
+    ]
@@ -0,0 +1,26 @@
+# Generated by Django 4.2.11 on 2026-10-19 12:20
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('dashboard', '0011_score_camera_time_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ChangeLog',
+            fields=[
+                ('change_id', models.BigAutoField(primary_key=True, serialize=False)),
+                ('layer', models.CharField(choices=[('incident', 'Incident'), ('score', 'Accident probability score'), ('weather', 'Weather')], max_length=10)),
+                ('object_id', models.IntegerField()),
+                ('camera_id', models.IntegerField()),
+                ('timestamp', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['layer', 'change_id'], name='changelog_layer_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,38 @@
+# Generated by Django 4.2.11 on 2026-10-19 12:40
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('dashboard', '0012_changelog'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RoadSegment',
+            fields=[
+                ('segment_id', models.AutoField(primary_key=True, serialize=False)),
+                ('road_name', models.CharField(max_length=255)),
+                ('sequence', models.IntegerField()),
+                ('length_m', models.FloatField()),
+                ('polylines', models.JSONField()),
+                ('min_lat', models.FloatField()),
+                ('min_lng', models.FloatField()),
+                ('max_lat', models.FloatField()),
+                ('max_lng', models.FloatField()),
+            ],
+        ),
+        migrations.AddField(
+            model_name='camera',
+            name='snap_distance_m',
+            field=models.FloatField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='camera',
+            name='road_segment',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='cameras', to='dashboard.roadsegment'),
+        ),
+    ]
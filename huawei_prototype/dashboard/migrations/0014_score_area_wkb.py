@@ -0,0 +1,83 @@
+# Generated by Django 4.2.11 on 2026-10-19 13:05
+
+import logging
+import shapely
+from django.db import migrations, models
+
+logger = logging.getLogger(__name__)
+
+
+def text_to_wkb(apps, schema_editor):
+    AccidentProbabilityScore = apps.get_model('dashboard', 'AccidentProbabilityScore')
+    scores = []
+    for score in AccidentProbabilityScore.objects.only('accident_prob_score_id', 'area_geometry').iterator():
+        try:
+            geometry = shapely.from_wkt(score.area_geometry)
+        except shapely.errors.GEOSException:
+            logger.warning(f"Score {score.pk}: unreadable area_geometry {score.area_geometry!r} left empty")
+            continue
+        score.area_wkb = shapely.to_wkb(geometry)
+        score.min_lat, score.min_lng, score.max_lat, score.max_lng = geometry.bounds
+        scores.append(score)
+    AccidentProbabilityScore.objects.bulk_update(
+        scores, ['area_wkb', 'min_lat', 'min_lng', 'max_lat', 'max_lng'], batch_size=500
+    )
+
+
+def wkb_to_text(apps, schema_editor):
+    AccidentProbabilityScore = apps.get_model('dashboard', 'AccidentProbabilityScore')
+    scores = []
+    for score in AccidentProbabilityScore.objects.exclude(area_wkb=None).only('accident_prob_score_id', 'area_wkb').iterator():
+        score.area_geometry = shapely.from_wkb(bytes(score.area_wkb)).wkt
+        scores.append(score)
+    AccidentProbabilityScore.objects.bulk_update(scores, ['area_geometry'], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('dashboard', '0013_road_segments'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='accidentprobabilityscore',
+            name='area_wkb',
+            field=models.BinaryField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='accidentprobabilityscore',
+            name='max_lat',
+            field=models.FloatField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='accidentprobabilityscore',
+            name='max_lng',
+            field=models.FloatField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='accidentprobabilityscore',
+            name='min_lat',
+            field=models.FloatField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='accidentprobabilityscore',
+            name='min_lng',
+            field=models.FloatField(blank=True, null=True),
+        ),
+        migrations.RunPython(text_to_wkb, wkb_to_text),
+        # A default, so migrating back can re-add the column before wkb_to_text fills it
+        migrations.AlterField(
+            model_name='accidentprobabilityscore',
+            name='area_geometry',
+            field=models.TextField(default=''),
+        ),
+        migrations.RemoveField(
+            model_name='accidentprobabilityscore',
+            name='area_geometry',
+        ),
+        migrations.AddIndex(
+            model_name='accidentprobabilityscore',
+            index=models.Index(fields=['min_lat', 'min_lng'], name='score_bbox_idx'),
+        ),
+    ]
@@ -1,5 +1,10 @@
-from django.db import models
+from django.conf import settings
+from django.db import models, transaction
+from django.utils import timezone
+from datetime import timedelta
+from django.db.models import Q
 from django.core.validators import MinValueValidator, MaxValueValidator
+import shapely
 
 # User Authentication
 class User(models.Model):
@@ -11,13 +16,75 @@ class User(models.Model):
     def __str__(self):
         return self.username
 
+def parse_location(location):
+    """Parse a "lat,lng" string into floats; returns (None, None) if it isn't one."""
+    try:
+        lat, lng = map(float, location.split(','))
+    except (AttributeError, ValueError):
+        return None, None
+    return lat, lng
+
+# Size of the square cells (in degrees, ~1.1 km) used to index cameras spatially
+GRID_CELL_DEGREES = 0.01
+# Cells per row of the grid, so (row, col) packs into one integer
+GRID_CELL_COLUMNS = round(360 / GRID_CELL_DEGREES)
+
+def grid_cell(lat, lng):
+    """Integer id of the grid cell containing a coordinate (see geomap/spatial.py)."""
+    row = int((lat + 90) // GRID_CELL_DEGREES)
+    col = int((lng + 180) // GRID_CELL_DEGREES)
+    return row * GRID_CELL_COLUMNS + col
+
+# Road Segment Model
+class RoadSegment(models.Model):
+    """
+    A stretch of expressway built from the OSM road network by geomap's
+    build_road_segments, with its polyline pre-simplified per zoom tier.
+    """
+    segment_id = models.AutoField(primary_key=True)
+    road_name = models.CharField(max_length=255)
+    sequence = models.IntegerField()  # order of the stretch along its road
+    length_m = models.FloatField()
+    polylines = models.JSONField()  # {"z<min zoom>": [[lat, lng], ...]} per simplification tier
+    min_lat = models.FloatField()
+    min_lng = models.FloatField()
+    max_lat = models.FloatField()
+    max_lng = models.FloatField()
+
+    def __str__(self):
+        return f"{self.road_name} #{self.sequence}"
+
 # Camera Model
 class Camera(models.Model):
     camera_id = models.AutoField(primary_key=True)
     camera_name = models.CharField(max_length=100)
-    location = models.CharField(max_length=255)  # Coordinates as string, or consider using GeoDjango
+    location = models.CharField(max_length=255)  # "lat,lng", kept in step with latitude/longitude
+    latitude = models.FloatField(null=True, blank=True)
+    longitude = models.FloatField(null=True, blank=True)
+    grid_cell = models.IntegerField(null=True, blank=True, db_index=True)
     road_name = models.CharField(max_length=255)
     feed_url = models.URLField(max_length=255)
+    road_segment = models.ForeignKey(RoadSegment, null=True, blank=True, on_delete=models.SET_NULL, related_name='cameras')
+    snap_distance_m = models.FloatField(null=True, blank=True)  # from the camera to road_segment
+
+    class Meta:
+        indexes = [
+            # Bounding-box queries: range on latitude, then filter longitude
+            models.Index(fields=['latitude', 'longitude'], name='camera_lat_lng_idx'),
+        ]
+
+    def save(self, *args, **kwargs):
+        # The coordinate columns are authoritative; the location string only fills them while they are empty
+        if self.latitude is None or self.longitude is None:
+            self.latitude, self.longitude = parse_location(self.location)
+        if self.latitude is not None:
+            if parse_location(self.location) != (self.latitude, self.longitude):
+                self.location = f"{self.latitude:.6f},{self.longitude:.6f}"
+            self.grid_cell = grid_cell(self.latitude, self.longitude)
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and {'location', 'latitude', 'longitude'} & set(update_fields):
+            kwargs['update_fields'] = set(update_fields) | {'location', 'latitude', 'longitude', 'grid_cell'}
+        super().save(*args, **kwargs)
     
     def __str__(self):
         return self.camera_name
@@ -40,6 +107,26 @@ class Incident(models.Model):
         help_text='Incident severity level'
     )
     camera = models.ForeignKey(Camera, on_delete=models.CASCADE, related_name='incidents')
+    model_version = models.CharField(max_length=100, blank=True, default='', help_text='Detector weights that raised the incident')
+
+    class Meta:
+        indexes = [
+            # Time-window queries on the incident map, optionally narrowed by severity or type
+            models.Index(fields=['timestamp'], name='incident_time_idx'),
+            models.Index(fields=['severity', 'timestamp'], name='incident_severity_time_idx'),
+            models.Index(fields=['incident_type', 'timestamp'], name='incident_type_time_idx'),
+        ]
+
+    def save(self, *args, **kwargs):
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+            CameraState.refresh_open_incidents(self.camera_id)
+
+    def delete(self, *args, **kwargs):
+        with transaction.atomic():
+            result = super().delete(*args, **kwargs)
+            CameraState.refresh_open_incidents(self.camera_id)
+        return result
     
     def __str__(self):
         return f"{self.incident_type} at {self.timestamp}"
@@ -50,6 +137,17 @@ class ResponseTime(models.Model):
     incident = models.ForeignKey(Incident, on_delete=models.CASCADE, related_name='response_times')
     response_time = models.DurationField()
     timestamp = models.DateTimeField(auto_now_add=True)
+
+    def save(self, *args, **kwargs):
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+            CameraState.refresh_open_incidents(self.incident.camera_id)
+
+    def delete(self, *args, **kwargs):
+        with transaction.atomic():
+            result = super().delete(*args, **kwargs)
+            CameraState.refresh_open_incidents(self.incident.camera_id)
+        return result
     
     def __str__(self):
         return f"Response time: {self.response_time} for incident {self.incident_id}"
@@ -61,6 +159,18 @@ class Weather(models.Model):
     conditions = models.CharField(max_length=100)
     timestamp = models.DateTimeField(auto_now_add=True)
     camera = models.ForeignKey(Camera, on_delete=models.CASCADE, related_name='weather_data')
+
+    def save(self, *args, **kwargs):
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+            CameraState.record(self.camera_id, 'weather_updated', self.timestamp,
+                               temperature=self.temperature, conditions=self.conditions)
+
+    def delete(self, *args, **kwargs):
+        with transaction.atomic():
+            result = super().delete(*args, **kwargs)
+            CameraState.refresh_weather(self.camera_id)
+        return result
     
     def __str__(self):
         return f"{self.conditions} at {self.temperature}°C"
@@ -99,11 +209,210 @@ class Notification(models.Model):
 
 # Accident Probability Score Model
 class AccidentProbabilityScore(models.Model):
+    """
+    Risk score of an area. The area is stored as WKB with its bounding box,
+    coordinates (lat, lng) like the WKT it replaced; set it through
+    `geometry` (a shapely geometry) or `area_geometry` (WKT).
+    """
     accident_prob_score_id = models.AutoField(primary_key=True)
-    area_geometry = models.TextField()  # Consider using GeoDjango for proper geometry support
+    area_wkb = models.BinaryField(null=True, blank=True)  # null only for legacy text that did not parse
+    min_lat = models.FloatField(null=True, blank=True)
+    min_lng = models.FloatField(null=True, blank=True)
+    max_lat = models.FloatField(null=True, blank=True)
+    max_lng = models.FloatField(null=True, blank=True)
     accident_prob_score = models.FloatField()
     timestamp = models.DateTimeField(auto_now_add=True)
     camera = models.ForeignKey(Camera, on_delete=models.CASCADE, related_name='accident_probabilitys')
+
+    class Meta:
+        indexes = [
+            # Latest score per camera, and per-camera aggregates over a time window
+            models.Index(fields=['camera', 'timestamp'], name='score_camera_time_idx'),
+            # Bounding-box pre-filter of intersecting()
+            models.Index(fields=['min_lat', 'min_lng'], name='score_bbox_idx'),
+        ]
+
+    @property
+    def geometry(self):
+        """The area as a shapely geometry, parsed once per instance."""
+        if self.area_wkb is None:
+            return None
+        cached = self.__dict__.get('_geometry')
+        if cached is None or cached[0] is not self.area_wkb:
+            cached = self.__dict__['_geometry'] = (self.area_wkb, shapely.from_wkb(bytes(self.area_wkb)))
+        return cached[1]
+
+    @geometry.setter
+    def geometry(self, value):
+        self.area_wkb = shapely.to_wkb(value) if value is not None else None
+        self.min_lat, self.min_lng, self.max_lat, self.max_lng = value.bounds if value is not None else (None,) * 4
+
+    @property
+    def area_geometry(self):
+        """The area as WKT."""
+        geometry = self.geometry
+        return geometry.wkt if geometry is not None else None
+
+    @area_geometry.setter
+    def area_geometry(self, value):
+        self.geometry = shapely.from_wkt(value) if value else None
+
+    @classmethod
+    def intersecting(cls, area, queryset=None):
+        """
+        Scores whose area intersects a shapely geometry in (lat, lng): the
+        bounding boxes are compared in SQL, then the candidates exactly.
+        """
+        min_lat, min_lng, max_lat, max_lng = area.bounds
+        candidates = list((queryset if queryset is not None else cls.objects.all()).filter(
+            min_lat__lte=max_lat, max_lat__gte=min_lat, min_lng__lte=max_lng, max_lng__gte=min_lng,
+        ))
+        if not candidates:
+            return []
+        hits = shapely.intersects(area, shapely.from_wkb([bytes(c.area_wkb) for c in candidates]))
+        return [c for c, hit in zip(candidates, hits) if hit]
+
+    def save(self, *args, **kwargs):
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+            CameraState.record(self.camera_id, 'score_updated', self.timestamp,
+                               accident_prob_score=self.accident_prob_score)
+
+    def delete(self, *args, **kwargs):
+        with transaction.atomic():
+            result = super().delete(*args, **kwargs)
+            CameraState.refresh_score(self.camera_id)
+        return result
     
     def __str__(self):
-        return f"Risk score: {self.accident_prob_score} at {self.timestamp}"
\ No newline at end of file
+        return f"Risk score: {self.accident_prob_score} at {self.timestamp}"
+
+# Camera State Model
+class CameraState(models.Model):
+    """
+    Current readings for one camera, kept in step with the time-series tables
+    by their save()/delete() so "current" views read one row per camera.
+    Queryset update()/delete()/bulk_create() skip this; call refresh() after them.
+    """
+    camera = models.OneToOneField(Camera, primary_key=True, on_delete=models.CASCADE, related_name='state')
+    temperature = models.FloatField(null=True, blank=True)
+    conditions = models.CharField(max_length=100, blank=True, default='')
+    weather_updated = models.DateTimeField(null=True, blank=True)
+    accident_prob_score = models.FloatField(null=True, blank=True)
+    score_updated = models.DateTimeField(null=True, blank=True)
+    open_incidents = models.IntegerField(default=0, help_text='Incidents without a recorded response time')
+    last_frame_time = models.DateTimeField(null=True, blank=True)
+
+    @classmethod
+    def record(cls, camera_id, time_field, when, **values):
+        """Store values stamped `when` unless the row already holds something newer."""
+        newer = Q(**{f"{time_field}__isnull": True}) | Q(**{f"{time_field}__lte": when})
+        values[time_field] = when
+        if not cls.objects.filter(Q(camera_id=camera_id) & newer).update(**values):
+            cls.objects.get_or_create(camera_id=camera_id, defaults=values)
+
+    @classmethod
+    def refresh_weather(cls, camera_id):
+        latest = Weather.objects.filter(camera_id=camera_id).order_by('-timestamp', '-weather_id').first()
+        cls.objects.update_or_create(camera_id=camera_id, defaults={
+            'temperature': latest.temperature if latest else None,
+            'conditions': latest.conditions if latest else '',
+            'weather_updated': latest.timestamp if latest else None,
+        })
+
+    @classmethod
+    def refresh_score(cls, camera_id):
+        latest = AccidentProbabilityScore.objects.filter(camera_id=camera_id) \
+                                                .order_by('-timestamp', '-accident_prob_score_id').first()
+        cls.objects.update_or_create(camera_id=camera_id, defaults={
+            'accident_prob_score': latest.accident_prob_score if latest else None,
+            'score_updated': latest.timestamp if latest else None,
+        })
+
+    @classmethod
+    def refresh_open_incidents(cls, camera_id):
+        count = Incident.objects.filter(camera_id=camera_id, response_times__isnull=True).count()
+        cls.objects.update_or_create(camera_id=camera_id, defaults={'open_incidents': count})
+
+    @classmethod
+    def refresh(cls, camera_id):
+        """Rebuild the row from the time-series tables."""
+        with transaction.atomic():
+            cls.refresh_weather(camera_id)
+            cls.refresh_score(camera_id)
+            cls.refresh_open_incidents(camera_id)
+
+    def __str__(self):
+        return f"State of camera {self.camera_id}"
+
+# Change Log Model
+class ChangeLog(models.Model):
+    """
+    Append-only record of changes to the live map layers. change_id is the
+    cursor live maps poll with; rows older than CHANGE_LOG_RETENTION are
+    pruned as new ones arrive.
+
+    Ids are allocated before commit, so on most backends a lower id can
+    become visible after a higher one. Cursors stop at a missing id until
+    CHANGE_LOG_GAP_GRACE has passed since the change after it; gaps older
+    than that are ids of rolled-back writes.
+    """
+    LAYER_CHOICES = [
+        ('incident', 'Incident'),
+        ('score', 'Accident probability score'),
+        ('weather', 'Weather'),
+    ]
+
+    # Prune on every Nth change rather than on each write
+    PRUNE_EVERY = 1000
+
+    change_id = models.BigAutoField(primary_key=True)
+    layer = models.CharField(max_length=10, choices=LAYER_CHOICES)
+    object_id = models.IntegerField()
+    camera_id = models.IntegerField()  # no foreign key: rows outlive deleted cameras to report removals
+    timestamp = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['layer', 'change_id'], name='changelog_layer_idx'),
+        ]
+
+    @classmethod
+    def record(cls, layer, object_id, camera_id):
+        change = cls.objects.create(layer=layer, object_id=object_id, camera_id=camera_id)
+        if change.change_id % cls.PRUNE_EVERY == 0:
+            cutoff = timezone.now() - timedelta(seconds=settings.CHANGE_LOG_RETENTION)
+            cls.objects.filter(timestamp__lt=cutoff).delete()
+        return change
+
+    @classmethod
+    def since(cls, cursor, limit=None):
+        """
+        Up to limit changes after cursor, oldest first, as (change_id, layer,
+        object_id, camera_id), stopping at a gap that may still fill. Returns
+        the changes, the cursor to poll from next and whether more remain.
+        """
+        rows = cls.objects.filter(change_id__gt=cursor).order_by('change_id').values_list(
+            'change_id', 'layer', 'object_id', 'camera_id', 'timestamp'
+        )
+        rows = list(rows if limit is None else rows[:limit + 1])
+        settled = timezone.now() - timedelta(seconds=settings.CHANGE_LOG_GAP_GRACE)
+        changes = []
+        for change_id, layer, object_id, camera_id, timestamp in rows[:limit]:
+            if change_id != cursor + 1 and timestamp >= settled:
+                return changes, cursor, False
+            changes.append((change_id, layer, object_id, camera_id))
+            cursor = change_id
+        return changes, cursor, limit is not None and len(rows) > limit
+
+    @classmethod
+    def cursor(cls):
+        """Cursor a new client starts from: the newest change with no gap before it that may still fill."""
+        settled = timezone.now() - timedelta(seconds=settings.CHANGE_LOG_GAP_GRACE)
+        start = cls.objects.filter(timestamp__lt=settled).order_by('-change_id').values_list('change_id', flat=True).first()
+        if start is None:
+            start = (cls.objects.order_by('change_id').values_list('change_id', flat=True).first() or 1) - 1
+        return cls.since(start)[1]
+
+    def __str__(self):
+        return f"{self.layer} {self.object_id} changed at {self.timestamp}"
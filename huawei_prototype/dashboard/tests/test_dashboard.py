@@ -297,5 +297,134 @@ class DashboardAlertRedirectTests(TestCase):
         response = self.client.get(reverse('dashboard'))
         self.assertContains(response, '/cameras/view/61/', msg_prefix="Alert button should link to the correct camera feed for AYE-01")
 
+class CameraCoordinateTests(TestCase):
+    def test_coordinates_follow_location(self):
+        """Latitude/longitude columns are filled from the location string when empty"""
+        from dashboard.models import Camera
+        camera = Camera.objects.create(camera_name="PIE-01", location="1.3347,103.7775", road_name="Pan Island Expressway", feed_url="https://example.com/feed/pie01")
+        self.assertEqual((camera.latitude, camera.longitude), (1.3347, 103.7775))
+        self.assertEqual(camera.location, "1.3347,103.7775")
+
+        camera.latitude, camera.longitude = 1.34, 103.78
+        camera.save(update_fields=['latitude', 'longitude'])
+        camera.refresh_from_db()
+        self.assertEqual((camera.latitude, camera.longitude), (1.34, 103.78))
+
+        # Bounding-box queries run on the indexed columns
+        inside = Camera.objects.filter(latitude__range=(1.33, 1.35), longitude__range=(103.77, 103.79))
+        self.assertEqual(list(inside), [camera])
+
+    def test_updated_coordinates_win_over_location(self):
+        """Moving an existing camera by its columns rewrites the location string instead of being reverted"""
+        from dashboard.models import Camera
+        camera = Camera.objects.create(camera_name="AYE-01", location="1.3145,103.7650", road_name="Ayer Rajah Expressway", feed_url="https://example.com/feed/aye01")
+        camera = Camera.objects.get(pk=camera.pk)
+        camera.latitude, camera.longitude = 1.3, 103.7
+        camera.save()
+        camera.refresh_from_db()
+        self.assertEqual((camera.latitude, camera.longitude), (1.3, 103.7))
+        self.assertEqual(camera.location, "1.300000,103.700000")
+
+        # A stale location string left on the instance doesn't move it back
+        camera.location = "1.3145,103.7650"
+        camera.save()
+        camera.refresh_from_db()
+        self.assertEqual((camera.latitude, camera.longitude), (1.3, 103.7))
+        self.assertEqual(camera.location, "1.300000,103.700000")
+
+    def test_location_filled_from_coordinates(self):
+        """Cameras created from coordinates still get a location string"""
+        from dashboard.models import Camera
+        camera = Camera.objects.create(camera_name="CTE-01", location="", latitude=1.3545, longitude=103.839, road_name="Central Expressway", feed_url="https://example.com/feed/cte01")
+        self.assertEqual(camera.location, "1.354500,103.839000")
+
+class CameraStateTests(TestCase):
+    def setUp(self):
+        from dashboard.models import Camera
+        self.camera = Camera.objects.create(camera_name="ECP-01", location="1.3099,103.9053", road_name="East Coast Parkway", feed_url="https://example.com/feed/ecp01")
+
+    def test_latest_readings_follow_writes(self):
+        """The state row always holds the newest weather and risk score"""
+        from dashboard.models import Weather, AccidentProbabilityScore, CameraState
+        Weather.objects.create(temperature=30.0, conditions="Sunny", camera=self.camera)
+        latest = Weather.objects.create(temperature=26.5, conditions="Rain", camera=self.camera)
+        AccidentProbabilityScore.objects.create(area_geometry="POINT(1.3099 103.9053)", accident_prob_score=0.2, camera=self.camera)
+        AccidentProbabilityScore.objects.create(area_geometry="POINT(1.3099 103.9053)", accident_prob_score=0.75, camera=self.camera)
+
+        state = CameraState.objects.get(camera=self.camera)
+        self.assertEqual((state.temperature, state.conditions), (26.5, "Rain"))
+        self.assertEqual(state.accident_prob_score, 0.75)
+
+        # Deleting the newest reading falls back to the one before it
+        latest.delete()
+        state.refresh_from_db()
+        self.assertEqual((state.temperature, state.conditions), (30.0, "Sunny"))
+
+    def test_older_reading_does_not_overwrite(self):
+        """Saving an old row again leaves the newer reading in place"""
+        from dashboard.models import Weather, CameraState
+        old = Weather.objects.create(temperature=30.0, conditions="Sunny", camera=self.camera)
+        Weather.objects.create(temperature=26.5, conditions="Rain", camera=self.camera)
+        old.conditions = "Hazy"
+        old.save()
+        self.assertEqual(CameraState.objects.get(camera=self.camera).conditions, "Rain")
+
+    def test_open_incidents_count(self):
+        """Incidents count as open until a response time is recorded"""
+        from datetime import timedelta
+        from dashboard.models import Incident, ResponseTime, CameraState
+        first = Incident.objects.create(incident_type="Vehicular accident", severity="medium", camera=self.camera)
+        Incident.objects.create(incident_type="Vehicle fire", severity="high", camera=self.camera)
+        self.assertEqual(CameraState.objects.get(camera=self.camera).open_incidents, 2)
+
+        ResponseTime.objects.create(incident=first, response_time=timedelta(minutes=7))
+        self.assertEqual(CameraState.objects.get(camera=self.camera).open_incidents, 1)
+
+        first.delete()
+        self.assertEqual(CameraState.objects.get(camera=self.camera).open_incidents, 1)
+
+    def test_refresh_rebuilds_from_tables(self):
+        """refresh() recovers the row after bulk writes that skip save()"""
+        from dashboard.models import Weather, CameraState
+        Weather.objects.bulk_create([Weather(temperature=29.0, conditions="Cloudy", camera=self.camera)])
+        self.assertFalse(CameraState.objects.filter(camera=self.camera, conditions="Cloudy").exists())
+        CameraState.refresh(self.camera.camera_id)
+        self.assertEqual(CameraState.objects.get(camera=self.camera).conditions, "Cloudy")
+
+class ScoreGeometryTests(TestCase):
+    def setUp(self):
+        from dashboard.models import Camera
+        self.camera = Camera.objects.create(camera_name="CTE-02", location="1.3545,103.839", road_name="Central Expressway", feed_url="https://example.com/feed/cte02")
+
+    def test_geometry_stored_as_wkb_with_bbox(self):
+        """WKT or shapely areas are stored as WKB with their bounding box and read back as shapely"""
+        from shapely.geometry import Point
+        from dashboard.models import AccidentProbabilityScore
+        AccidentProbabilityScore.objects.create(area_geometry="POLYGON((1.35 103.83, 1.35 103.85, 1.36 103.85, 1.35 103.83))", accident_prob_score=0.5, camera=self.camera)
+        AccidentProbabilityScore.objects.create(geometry=Point(1.3545, 103.839), accident_prob_score=0.6, camera=self.camera)
+
+        area, point = AccidentProbabilityScore.objects.order_by('pk')
+        self.assertIsInstance(bytes(area.area_wkb), bytes)
+        self.assertEqual((area.min_lat, area.min_lng, area.max_lat, area.max_lng), (1.35, 103.83, 1.36, 103.85))
+        self.assertEqual(area.geometry.geom_type, "Polygon")
+        self.assertIs(area.geometry, area.geometry)
+        self.assertEqual(point.area_geometry, "POINT (1.3545 103.839)")
+
+        point.geometry = Point(1.30, 103.90)
+        self.assertEqual(point.geometry.coords[0], (1.30, 103.90))
+        self.assertEqual(point.max_lng, 103.90)
+
+    def test_intersecting(self):
+        """intersecting() pre-filters on the bounding box and then tests the exact shape"""
+        from shapely.geometry import Point, box
+        from dashboard.models import AccidentProbabilityScore
+        triangle = AccidentProbabilityScore.objects.create(area_geometry="POLYGON((1.30 103.80, 1.30 103.90, 1.40 103.90, 1.30 103.80))", accident_prob_score=0.5, camera=self.camera)
+        AccidentProbabilityScore.objects.create(geometry=Point(1.45, 103.95), accident_prob_score=0.6, camera=self.camera)
+
+        self.assertEqual(AccidentProbabilityScore.intersecting(box(1.32, 103.88, 1.33, 103.89)), [triangle])
+        # Inside the triangle's bounding box but outside the triangle
+        self.assertEqual(AccidentProbabilityScore.intersecting(Point(1.38, 103.81)), [])
+        self.assertEqual(AccidentProbabilityScore.intersecting(box(1.0, 103.0, 2.0, 104.0), AccidentProbabilityScore.objects.filter(accident_prob_score__gt=0.55))[0].accident_prob_score, 0.6)
+
 if __name__ == '__main__':
     unittest.main() 
\ No newline at end of file
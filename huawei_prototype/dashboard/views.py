@@ -36,11 +36,10 @@ def dashboard(request):
     high_risk_count = recent_probs.filter(accident_prob_score__gte=0.7).count()
 
     total_infractions = low_risk_count
-    # Count distinct areas (cameras) with moderate/high risk in past 24h
-    moderate_risk_areas_count = recent_probs.filter(accident_prob_score__gte=0.4, accident_prob_score__lt=0.7) \
-                                           .values('camera').distinct().count()
-    high_risk_areas_count = recent_probs.filter(accident_prob_score__gte=0.7) \
-                                       .values('camera').distinct().count()
+    # Count areas (cameras) whose current risk, updated in the past 24h, is moderate/high
+    current_states = CameraState.objects.filter(score_updated__gte=since)
+    moderate_risk_areas_count = current_states.filter(accident_prob_score__gte=0.4, accident_prob_score__lt=0.7).count()
+    high_risk_areas_count = current_states.filter(accident_prob_score__gte=0.7).count()
 
     # Assemble notifications from past 24h (incidents or high-risk alerts)
     notifications = []
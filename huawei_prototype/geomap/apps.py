@@ -4,3 +4,7 @@ from django.apps import AppConfig
 class GeomapConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'geomap'
+
+    def ready(self):
+        from geomap import signals
+        signals.connect()
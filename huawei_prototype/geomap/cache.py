@@ -0,0 +1,75 @@
+import time
+import hashlib
+import logging
+from django.conf import settings
+from django.core.cache import caches
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+CACHE_ALIAS = "geomap"
+
+
+def map_cache():
+    return caches[CACHE_ALIAS]
+
+
+def _version_key(model):
+    # A model's table, or a name for data kept outside the database
+    return f"version:{model if isinstance(model, str) else model._meta.label_lower}"
+
+
+def data_version(model):
+    """
+    Current data version of a model's table (or of a named data source, see
+    _version_key).
+
+    Versions are time-based tokens rather than small integers, so a version
+    lost from the cache (eviction, wiped cache dir) can never come back as a
+    number that already keyed HTML for different data.
+    """
+    cache = map_cache()
+    version = cache.get(_version_key(model))
+    if version is None:
+        version = time.time_ns()
+        # add() so concurrent first readers agree on one version
+        if not cache.add(_version_key(model), version, None):
+            version = cache.get(_version_key(model), version)
+    return version
+
+
+def bump_version(model):
+    """Invalidate every cached map built from this model's table (or named data source)."""
+    map_cache().set(_version_key(model), time.time_ns(), None)
+
+
+def map_cache_key(name, models, params=""):
+    versions = ":".join(str(data_version(m)) for m in models)
+    digest = hashlib.md5(f"{params}|{versions}".encode()).hexdigest()
+    return f"map:{name}:{digest}"
+
+
+def cached_by_version(name, models, build, params=""):
+    """
+    Value of build() for name and params, rebuilt only when one of the
+    given models has changed since it was cached.
+    """
+    cache = map_cache()
+    key = map_cache_key(name, models, params)
+    value = cache.get(key)
+    if value is None:
+        value = build()
+        try:
+            cache.set(key, value, settings.MAP_CACHE_TIMEOUT)
+        except Exception as e:
+            logger.error(f"Error caching {name}: {e}")
+    return value
+
+
+def cached_map_html(name, request, models, build, extra=""):
+    """
+    Rendered map HTML for a view and its GET parameters (see cached_by_version).
+    extra adds anything else the map depends on, such as a resolved time window.
+    """
+    params = "&".join(f"{k}={v}" for k, v in sorted(request.GET.items()))
+    return cached_by_version(name, models, build, f"{params}|{extra}")
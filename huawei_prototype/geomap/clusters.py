@@ -0,0 +1,106 @@
+import math
+import numpy as np
+from django.conf import settings
+
+
+def mercator(lat, lng):
+    """Web Mercator position of each point, as fractions (0-1) of the world map."""
+    lat = np.clip(np.asarray(lat, dtype=np.float64), -85.0511, 85.0511)
+    x = (np.asarray(lng, dtype=np.float64) + 180.0) / 360.0
+    phi = np.radians(lat)
+    y = (1.0 - np.log(np.tan(phi) + 1.0 / np.cos(phi)) / math.pi) / 2.0
+    return x, y
+
+
+class ClusterIndex:
+    """
+    Grid clusters of a point layer for every zoom level up to CLUSTER_MAX_ZOOM.
+
+    At each zoom the map is cut into square cells CLUSTER_CELL_PIXELS wide on
+    screen; points sharing a cell become one cluster placed at their mean
+    position, with a count per category (e.g. severity). Everything is
+    computed up front with np.unique/np.bincount so a request only slices
+    arrays. Picklable, so it can be kept in the map cache.
+    """
+
+    def __init__(self, lat, lng, categories=None, properties=None):
+        self.lat = np.asarray(lat, dtype=np.float64)
+        self.lng = np.asarray(lng, dtype=np.float64)
+        self.properties = list(properties) if properties is not None else [{} for _ in range(len(self.lat))]
+
+        categories = list(categories) if categories is not None else []
+        self.category_names = sorted(set(categories))
+        self.category = np.array(
+            [self.category_names.index(c) for c in categories], dtype=np.intp
+        ) if categories else np.zeros(len(self.lat), dtype=np.intp)
+
+        x, y = mercator(self.lat, self.lng)
+        self.levels = {z: self._cluster(x, y, z) for z in range(settings.CLUSTER_MAX_ZOOM + 1)}
+
+    def _cluster(self, x, y, zoom):
+        if not len(x):
+            return None
+        cells_per_side = 256 * 2 ** zoom / settings.CLUSTER_CELL_PIXELS
+        col = np.floor(x * cells_per_side).astype(np.int64)
+        row = np.floor(y * cells_per_side).astype(np.int64)
+        _, first, cell = np.unique(row * (int(cells_per_side) + 1) + col, return_index=True, return_inverse=True)
+
+        n = len(first)
+        counts = np.bincount(cell, minlength=n)
+        level = {
+            "lat": np.bincount(cell, weights=self.lat, minlength=n) / counts,
+            "lng": np.bincount(cell, weights=self.lng, minlength=n) / counts,
+            "count": counts,
+            "first": first,  # a point in the cell, used as-is for single-point cells
+        }
+        if self.category_names:
+            breakdown = np.zeros((n, len(self.category_names)), dtype=np.int64)
+            np.add.at(breakdown, (cell, self.category), 1)
+            level["breakdown"] = breakdown
+        return level
+
+    def features(self, zoom, viewport=None):
+        """GeoJSON features for a zoom level: clusters, and plain points for single-point cells."""
+        zoom = max(0, zoom)
+        if zoom > settings.CLUSTER_MAX_ZOOM:
+            return self._points(viewport)
+        level = self.levels[zoom]
+        if level is None:
+            return []
+
+        mask = np.ones(len(level["count"]), dtype=bool)
+        if viewport is not None:
+            mask &= (level["lat"] >= viewport.south) & (level["lat"] <= viewport.north)
+            mask &= (level["lng"] >= viewport.west) & (level["lng"] <= viewport.east)
+
+        features = []
+        for i in np.flatnonzero(mask):
+            count = int(level["count"][i])
+            if count == 1:
+                features.append(self._point(level["first"][i]))
+                continue
+            properties = {"cluster": True, "count": count}
+            if self.category_names:
+                properties["breakdown"] = {
+                    name: int(n) for name, n in zip(self.category_names, level["breakdown"][i]) if n
+                }
+            features.append({
+                "type": "Feature",
+                "geometry": {"type": "Point", "coordinates": [float(level["lng"][i]), float(level["lat"][i])]},
+                "properties": properties,
+            })
+        return features
+
+    def _points(self, viewport):
+        mask = np.ones(len(self.lat), dtype=bool)
+        if viewport is not None:
+            mask &= (self.lat >= viewport.south) & (self.lat <= viewport.north)
+            mask &= (self.lng >= viewport.west) & (self.lng <= viewport.east)
+        return [self._point(i) for i in np.flatnonzero(mask)]
+
+    def _point(self, i):
+        return {
+            "type": "Feature",
+            "geometry": {"type": "Point", "coordinates": [float(self.lng[i]), float(self.lat[i])]},
+            "properties": dict(self.properties[i], cluster=False),
+        }
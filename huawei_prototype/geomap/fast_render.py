@@ -0,0 +1,161 @@
+import json
+from folium.elements import MacroElement, Template
+
+
+def awesome_icon(color, icon, prefix="fa"):
+    """Marker style drawn like folium.Icon (Leaflet.awesome-markers)."""
+    return {"icon": {"markerColor": color, "iconColor": "white", "icon": icon, "prefix": prefix, "extraClasses": "fa-rotate-0"}}
+
+
+def circle(color, radius, **options):
+    """Marker style drawn like folium.CircleMarker with fill."""
+    return {"circle": dict({"color": color, "fill": True, "fillColor": color, "fillOpacity": 0.7, "radius": radius}, **options)}
+
+
+class StyleTable:
+    """Shared marker styles: each distinct style is sent once and rows refer to it by index."""
+
+    def __init__(self):
+        self.styles = []
+        self._index = {}
+
+    def index(self, key, make):
+        """Index of the style for key, creating it with make() the first time."""
+        i = self._index.get(key)
+        if i is None:
+            i = self._index[key] = len(self.styles)
+            self.styles.append(make())
+        return i
+
+
+class FastMarkerLayer(MacroElement):
+    """
+    Every marker of a layer as one columnar JSON payload, drawn by a single
+    JS loop instead of one folium Marker/Popup/Icon element per row.
+
+    lat, lng and style are parallel lists (style indexes into styles). The
+    popup is an HTML template whose {name} placeholders are filled, escaped,
+    when a marker is clicked: from the parallel lists in fields, or, with
+    ids and popup_url, from the JSON fetched from popup_url with {id}
+    replaced by the marker's id, so the page only carries the ids.
+
+    With live_url the layer polls it with ?since=<cursor> (see views.changes)
+    and replaces, adds or removes markers by key: keys is parallel to lat
+    and defaults to ids. polled is the server time the markers were read at.
+    """
+
+    _template = Template("""
+        {% macro script(this, kwargs) %}
+        (function() {
+            var data = {{ this.payload }};
+            var map = {{ this._parent.get_name() }};
+            var icons = data.styles.map(function(style) {
+                return style.icon ? L.AwesomeMarkers.icon(style.icon) : null;
+            });
+            function escapeHtml(value) {
+                return String(value == null ? '' : value).replace(/[&<>"']/g, function(c) {
+                    return {'&': '&amp;', '<': '&lt;', '>': '&gt;', '"': '&quot;', "'": '&#39;'}[c];
+                });
+            }
+            function fill(values) {
+                return data.popup.replace(/\\{(\\w+)\\}/g, function(match, name) {
+                    return name in values ? escapeHtml(values[name]) : match;
+                });
+            }
+            function inlinePopup(i) {
+                return function() {
+                    var values = {};
+                    Object.keys(data.fields).forEach(function(name) { values[name] = data.fields[name][i]; });
+                    return fill(values);
+                };
+            }
+            function lazyPopup(marker, id) {
+                marker.bindPopup('Loading…', {maxWidth: 300});
+                marker.on('popupopen', function() {
+                    fetch(data.popupUrl.replace('{id}', id), {credentials: 'same-origin'})
+                        .then(function(response) {
+                            if (!response.ok) { throw new Error(response.status); }
+                            return response.json();
+                        })
+                        .then(function(values) { marker.setPopupContent(fill(values)); })
+                        .catch(function() { marker.setPopupContent('Details unavailable'); });
+                });
+            }
+            function createMarker(lat, lng, style, icon) {
+                return icon ? L.marker([lat, lng], {icon: icon}) : L.circleMarker([lat, lng], style.circle);
+            }
+            var live = {};
+            for (var i = 0; i < data.lat.length; i++) {
+                var style = data.style[i];
+                var marker = createMarker(data.lat[i], data.lng[i], data.styles[style], icons[style]);
+                if (data.popupUrl) {
+                    lazyPopup(marker, data.ids[i]);
+                } else if (data.popup) {
+                    marker.bindPopup(inlinePopup(i), {maxWidth: 300});
+                }
+                marker.addTo(map);
+                if (data.keys) { live[data.keys[i]] = marker; }
+            }
+            function remove(key) {
+                if (live[key]) {
+                    map.removeLayer(live[key]);
+                    delete live[key];
+                }
+            }
+            function poll() {
+                var url = data.liveUrl + (data.liveUrl.indexOf('?') < 0 ? '?' : '&') + 'since=' + data.cursor
+                    + (data.polled ? '&polled=' + encodeURIComponent(data.polled) : '');
+                fetch(url, {credentials: 'same-origin'})
+                    .then(function(response) {
+                        if (!response.ok) { throw new Error(response.status); }
+                        return response.json();
+                    })
+                    .then(function(delta) {
+                        if (delta.reset) {
+                            // Changes were pruned past our cursor; the page has to start over
+                            window.parent.location.reload();
+                            return;
+                        }
+                        delta.removed.forEach(remove);
+                        delta.changed.forEach(function(item) {
+                            remove(item.key);
+                            var marker = createMarker(
+                                item.lat, item.lng, item.style, item.style.icon ? L.AwesomeMarkers.icon(item.style.icon) : null
+                            );
+                            lazyPopup(marker, item.id);
+                            live[item.key] = marker.addTo(map);
+                        });
+                        data.cursor = delta.cursor;
+                        data.polled = delta.time;
+                        setTimeout(poll, delta.more ? 0 : data.pollMs);
+                    })
+                    .catch(function() { setTimeout(poll, data.pollMs); });
+            }
+            if (data.liveUrl) { setTimeout(poll, data.pollMs); }
+        })();
+        {% endmacro %}
+    """)
+
+    def __init__(self, lat, lng, style, styles, popup=None, fields=None, ids=None, popup_url=None,
+                 keys=None, live_url=None, cursor=0, polled=None, poll_seconds=15):
+        super().__init__()
+        self._name = "FastMarkerLayer"
+        payload = {
+            "lat": list(lat),
+            "lng": list(lng),
+            "style": list(style),
+            "styles": styles,
+            "popup": popup,
+            "fields": fields or {},
+        }
+        if popup_url:
+            payload["ids"] = list(ids)
+            payload["popupUrl"] = popup_url
+        if live_url:
+            payload["keys"] = list(ids if keys is None else keys)
+            payload["liveUrl"] = live_url
+            payload["cursor"] = cursor
+            payload["polled"] = polled
+            payload["pollMs"] = poll_seconds * 1000
+        # "</" would end the surrounding <script> block
+        self.payload = json.dumps(payload, separators=(",", ":")).replace("</", "<\\/")
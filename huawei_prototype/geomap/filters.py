@@ -0,0 +1,146 @@
+from datetime import timedelta
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+from django.db.models import Avg, Max, OuterRef, Subquery
+from dashboard.models import AccidentProbabilityScore, Camera, Incident
+from geomap.spatial import filter_viewport
+
+# Time windows offered on the incident map, newest incidents first
+INCIDENT_WINDOWS = {
+    "1h": ("Last hour", timedelta(hours=1)),
+    "24h": ("Last 24 hours", timedelta(hours=24)),
+    "7d": ("Last 7 days", timedelta(days=7)),
+    "30d": ("Last 30 days", timedelta(days=30)),
+    "custom": ("Custom range", None),
+}
+DEFAULT_INCIDENT_WINDOW = "24h"
+
+# Accident probability bands of the probability map's ?type= filter: [low, high)
+RISK_BANDS = {"high risk": (0.7, None), "medium risk": (0.4, 0.7), "low risk": (None, 0.4)}
+
+# How the probability map reduces each camera's scores to one: the latest,
+# or an aggregate over one of the relative incident windows
+SCORE_AGGREGATES = {"latest": ("Latest", None), "avg": ("Average", Avg), "max": ("Peak", Max)}
+SCORE_WINDOWS = [key for key, (_, length) in INCIDENT_WINDOWS.items() if length]
+
+
+class IncidentFilter:
+    """Incident time window and attribute filters from the request."""
+
+    def __init__(self, window, start, end=None, severity="", incident_type=""):
+        self.window = window
+        self.start, self.end = start, end
+        self.severity = severity
+        self.incident_type = incident_type
+
+    def query_string(self):
+        end = self.end.isoformat() if self.end else ""
+        return f"start={self.start.isoformat()}&end={end}&severity={self.severity}&type={self.incident_type}"
+
+
+class ScoreFilter:
+    """Probability map risk band and per-camera score reduction from the request."""
+
+    def __init__(self, band, aggregate="latest", window=DEFAULT_INCIDENT_WINDOW, start=None):
+        self.band = band
+        self.aggregate = aggregate
+        self.window = window
+        self.start = start
+
+    def query_string(self):
+        start = self.start.isoformat() if self.start else ""
+        return f"type={self.band}&score={self.aggregate}&start={start}"
+
+
+def _window_start(window, now):
+    # Relative windows start on a whole minute so repeat loads share a cache entry
+    return (now - INCIDENT_WINDOWS[window][1]).replace(second=0, microsecond=0)
+
+
+def _parse_time(value):
+    """Aware datetime from an ISO / datetime-local string, or None."""
+    try:
+        parsed = parse_datetime(value or "")
+    except ValueError:
+        return None
+    if parsed is not None and timezone.is_naive(parsed):
+        parsed = timezone.make_aware(parsed)
+    return parsed
+
+
+def parse_incident_filter(request, now=None):
+    """
+    Read ?window=1h|24h|7d|30d or ?window=custom&start=...&end=..., plus
+    ?severity= and ?incident_type=. Unknown or incomplete values fall back to
+    the default window and no attribute filter, so history is never unbounded.
+    """
+    now = now or timezone.now()
+    window = request.GET.get('window', DEFAULT_INCIDENT_WINDOW)
+    if window not in INCIDENT_WINDOWS:
+        window = DEFAULT_INCIDENT_WINDOW
+
+    start = end = None
+    if window == "custom":
+        start = _parse_time(request.GET.get('start'))
+        end = _parse_time(request.GET.get('end'))
+        if start is None or (end is not None and end <= start):
+            window, start, end = DEFAULT_INCIDENT_WINDOW, None, None
+    if start is None:
+        start = _window_start(window, now)
+
+    severity = request.GET.get('severity', '')
+    if severity not in dict(Incident.SEVERITY_CHOICES):
+        severity = ''
+    incident_type = request.GET.get('incident_type', '')[:100]
+    return IncidentFilter(window, start, end, severity, incident_type)
+
+
+def filter_incidents(queryset, incident_filter):
+    """Restrict an Incident queryset to the filter; each part is served by an index on timestamp."""
+    queryset = queryset.filter(timestamp__gte=incident_filter.start)
+    if incident_filter.end is not None:
+        queryset = queryset.filter(timestamp__lt=incident_filter.end)
+    if incident_filter.severity:
+        queryset = queryset.filter(severity=incident_filter.severity)
+    if incident_filter.incident_type:
+        queryset = queryset.filter(incident_type=incident_filter.incident_type)
+    return queryset
+
+
+def parse_score_filter(request, now=None):
+    """
+    Read ?type=<band> (see RISK_BANDS; anything else is every band) and
+    ?score=latest|avg|max with ?window= for the aggregates.
+    """
+    band = request.GET.get('type', 'all')
+    aggregate = request.GET.get('score', 'latest')
+    if aggregate not in SCORE_AGGREGATES:
+        aggregate = 'latest'
+    window = request.GET.get('window', DEFAULT_INCIDENT_WINDOW)
+    if window not in SCORE_WINDOWS:
+        window = DEFAULT_INCIDENT_WINDOW
+    start = None if aggregate == 'latest' else _window_start(window, now or timezone.now())
+    return ScoreFilter(band, aggregate, window, start)
+
+
+def filter_risk_band(queryset, band, field='accident_prob_score'):
+    """Restrict scores (or a score annotation) to a RISK_BANDS band; other values leave it as is."""
+    low, high = RISK_BANDS.get(band, (None, None))
+    if low is not None:
+        queryset = queryset.filter(**{f"{field}__gte": low})
+    if high is not None:
+        queryset = queryset.filter(**{f"{field}__lt": high})
+    return queryset
+
+
+def latest_scores(viewport, band, camera_ids=None):
+    """
+    The latest score of each camera in the viewport (or of camera_ids),
+    with the risk band applied in the query.
+    """
+    cameras = filter_viewport(Camera.objects.exclude(latitude=None), viewport)
+    if camera_ids is not None:
+        cameras = cameras.filter(pk__in=camera_ids)
+    latest = AccidentProbabilityScore.objects.filter(camera=OuterRef('pk')).order_by('-timestamp', '-pk')
+    latest_ids = cameras.annotate(score_id=Subquery(latest.values('pk')[:1])).values('score_id')
+    return filter_risk_band(AccidentProbabilityScore.objects.filter(pk__in=latest_ids), band)
@@ -0,0 +1,79 @@
+import math
+import logging
+import numpy as np
+from geomap.spatial import local_metres, lng_lat
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+SQRT3 = math.sqrt(3)
+
+
+def hex_cells(x, y, size):
+    """
+    Axial (q, r) of the pointy-top hexagon of circumradius size metres
+    holding each x/y point, by cube rounding.
+    """
+    q = (SQRT3 / 3 * x - y / 3) / size
+    r = (2 / 3 * y) / size
+    s = -q - r
+    rq, rr, rs = np.round(q), np.round(r), np.round(s)
+    dq, dr, ds = np.abs(rq - q), np.abs(rr - r), np.abs(rs - s)
+    # The coordinate with the largest rounding error is rebuilt from the other two
+    fix_q = (dq > dr) & (dq > ds)
+    fix_r = ~fix_q & (dr > ds)
+    rq = np.where(fix_q, -rr - rs, rq)
+    rr = np.where(fix_r, -rq - rs, rr)
+    return rq.astype(np.int64), rr.astype(np.int64)
+
+
+def hex_center(q, r, size):
+    """x/y metres of the centre of hexagon (q, r)."""
+    return size * SQRT3 * (q + r / 2), size * 1.5 * r
+
+
+def hex_outline(q, r, size):
+    """Closed [lng, lat] ring of hexagon (q, r)."""
+    cx, cy = hex_center(q, r, size)
+    angles = np.radians(np.arange(30, 390, 60))
+    ring = lng_lat(np.column_stack([cx + size * np.cos(angles), cy + size * np.sin(angles)]))
+    ring = np.round(ring, 6).tolist()
+    return ring + ring[:1]
+
+
+def hexbin(lat, lng, values, size):
+    """
+    Hexagons of size metres with at least one point, as parallel arrays
+    (q, r, count, mean, max) of the values falling in each. Points are
+    grouped by sorting their cell keys, so the cost is one argsort.
+    """
+    lat, lng, values = (np.asarray(a, dtype=np.float64) for a in (lat, lng, values))
+    if not len(lat):
+        empty = np.zeros(0)
+        return empty.astype(np.int64), empty.astype(np.int64), empty.astype(np.int64), empty, empty
+    xy = local_metres(lat, lng)
+    q, r = hex_cells(xy[:, 0], xy[:, 1], size)
+    # Axial coordinates stay far below 2**31 for any city-sized map
+    keys = (q << 32) + r
+    order = np.argsort(keys, kind='stable')
+    keys, values = keys[order], values[order]
+    starts = np.flatnonzero(np.r_[True, keys[1:] != keys[:-1]])
+
+    counts = np.diff(np.r_[starts, len(keys)])
+    means = np.add.reduceat(values, starts) / counts
+    peaks = np.maximum.reduceat(values, starts)
+    cell_q, cell_r = q[order][starts], r[order][starts]
+    return cell_q, cell_r, counts, means, peaks
+
+
+def hexbin_features(lat, lng, values, size):
+    """GeoJSON Polygon features of hexbin(), with count, mean and max."""
+    q, r, counts, means, peaks = hexbin(lat, lng, values, size)
+    return [
+        {
+            "type": "Feature",
+            "geometry": {"type": "Polygon", "coordinates": [hex_outline(cq, cr, size)]},
+            "properties": {"count": int(count), "mean": round(float(mean), 4), "max": float(peak)},
+        }
+        for cq, cr, count, mean, peak in zip(q.tolist(), r.tolist(), counts, means, peaks)
+    ]
@@ -0,0 +1,86 @@
+from django.core.management.base import BaseCommand
+from datetime import datetime, timedelta
+import random
+import time
+import folium
+
+from geomap.spatial import create_map
+from geomap.views.incident_map import add_incident_markers, INCIDENT_POPUP
+
+ICONS = {"accident": "ambulance", "fire": "fire", "infraction": "exclamation-triangle"}
+COLORS = {"high": "red", "medium": "orange", "low": "blue"}
+
+
+def synthetic_rows(count, seed=0):
+    """Incident rows shaped like incident_map's values_list, spread over Singapore."""
+    rng = random.Random(seed)
+    start = datetime(2025, 4, 13)
+    return [
+        (
+            rng.choice(["Accident", "Fire", "Infraction", "Vehicular accident"]),
+            rng.choice(["high", "medium", "low"]),
+            start + timedelta(seconds=rng.randint(0, 86400)),
+            f"CAM-{rng.randint(1, 120):03d}",
+            rng.choice(["Pan Island Expressway", "East Coast Parkway", "Central Expressway"]),
+            rng.uniform(1.25, 1.45),
+            rng.uniform(103.65, 104.0),
+        )
+        for _ in range(count)
+    ]
+
+
+def render_folium(rows):
+    """The per-object approach: one folium Marker, Popup and Icon per row."""
+    map_sg = create_map(None)
+    for incident_type, severity, timestamp, camera_name, road_name, lat, lng in rows:
+        popup_content = INCIDENT_POPUP.format(
+            type=incident_type, severity=severity.title(), road=road_name, camera=camera_name,
+            time=timestamp.strftime("%Y-%m-%d %H:%M:%S"),
+        )
+        folium.Marker(
+            location=[lat, lng],
+            popup=folium.Popup(popup_content, max_width=300),
+            icon=folium.Icon(color=COLORS.get(severity, "blue"), icon=ICONS.get(incident_type.lower(), "exclamation-triangle"), prefix="fa"),
+        ).add_to(map_sg)
+    return map_sg._repr_html_()
+
+
+def render_fast(rows):
+    """The single JSON layer: only ids, positions and styles; popups are fetched on click."""
+    map_sg = create_map(None)
+    add_incident_markers(
+        map_sg, [(i, row[0], row[1], row[5], row[6]) for i, row in enumerate(rows, 1)], ICONS, COLORS
+    )
+    return map_sg._repr_html_()
+
+
+class Command(BaseCommand):
+    help = "Compare incident map render time and size for folium per-object markers vs the single JSON marker layer"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--counts", type=int, nargs="+", default=[100, 1000, 5000])
+        parser.add_argument("--repeat", type=int, default=3, help="Runs per measurement; the fastest is reported")
+        parser.add_argument("--skip-folium-above", type=int, default=20000,
+                            help="Skip the per-object renderer for marker counts above this")
+
+    def time_render(self, render, rows, repeat):
+        best, html = float("inf"), ""
+        for _ in range(repeat):
+            started = time.perf_counter()
+            html = render(rows)
+            best = min(best, time.perf_counter() - started)
+        return best, len(html)
+
+    def handle(self, *args, **options):
+        self.stdout.write(f"{'markers':>8} {'folium s':>10} {'folium KB':>10} {'fast s':>8} {'fast KB':>8} {'speedup':>8}")
+        for count in options["counts"]:
+            rows = synthetic_rows(count)
+            fast_time, fast_size = self.time_render(render_fast, rows, options["repeat"])
+            if count > options["skip_folium_above"]:
+                self.stdout.write(f"{count:>8} {'-':>10} {'-':>10} {fast_time:>8.3f} {fast_size / 1024:>8.0f} {'-':>8}")
+                continue
+            folium_time, folium_size = self.time_render(render_folium, rows, options["repeat"])
+            self.stdout.write(
+                f"{count:>8} {folium_time:>10.3f} {folium_size / 1024:>10.0f} "
+                f"{fast_time:>8.3f} {fast_size / 1024:>8.0f} {folium_time / fast_time:>7.1f}x"
+            )
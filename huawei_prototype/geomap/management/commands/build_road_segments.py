@@ -0,0 +1,27 @@
+from django.core.management.base import BaseCommand
+import logging
+
+from geomap.roads import load_expressway_lines, build_segments, replace_segments, snap_cameras
+
+logger = logging.getLogger(__name__)
+
+class Command(BaseCommand):
+    help = "Cut the OSM expressways into road segments with simplified polylines per zoom tier and snap cameras to them"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--graph", help="GraphML of the Singapore drive network (default: settings.OSM_GRAPH_PATH, downloaded if missing)")
+        parser.add_argument("--snap-only", action="store_true", help="Keep the stored segments and only re-snap the cameras")
+
+    def handle(self, *args, **options):
+        if options["snap_only"]:
+            snapped = snap_cameras()
+            self.stdout.write(self.style.SUCCESS(f"Snapped {snapped} cameras"))
+            return
+
+        self.stdout.write("Loading Singapore road network…")
+        roads = load_expressway_lines(options["graph"])
+        segments = build_segments(roads)
+        snapped = replace_segments(segments)
+        self.stdout.write(self.style.SUCCESS(
+            f"Built {len(segments)} segments on {len(roads)} expressways; snapped {snapped} cameras"
+        ))
@@ -0,0 +1,39 @@
+from django.core.management.base import BaseCommand
+from django.conf import settings
+import time
+import logging
+
+from geomap.tiles import TileRenderer
+
+logger = logging.getLogger(__name__)
+
+class Command(BaseCommand):
+    help = "Render the accident probability heatmap into z/x/y PNG tiles, redrawing only tiles whose scores changed"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--full", action="store_true", help="Redraw every tile instead of only changed ones")
+        parser.add_argument("--loop", action="store_true", help="Keep running, updating every --interval seconds")
+        parser.add_argument("--interval", type=int, default=settings.RISK_TILE_INTERVAL)
+        parser.add_argument("--min-zoom", type=int, default=settings.RISK_TILE_MIN_ZOOM)
+        parser.add_argument("--max-zoom", type=int, default=settings.RISK_TILE_MAX_ZOOM)
+
+    def handle(self, *args, **options):
+        renderer = TileRenderer(min_zoom=options["min_zoom"], max_zoom=options["max_zoom"])
+
+        full = options["full"]
+        while True:
+            started = time.monotonic()
+            try:
+                written, removed = renderer.run(full=full)
+                self.stdout.write(self.style.SUCCESS(
+                    f"Risk tiles: {written} written, {removed} removed in {time.monotonic() - started:.1f}s"
+                ))
+            except Exception as e:
+                if not options["loop"]:
+                    raise
+                logger.error(f"Error rendering risk tiles: {e}")
+
+            if not options["loop"]:
+                return
+            full = False
+            time.sleep(options["interval"])
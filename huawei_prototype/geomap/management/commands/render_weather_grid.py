@@ -0,0 +1,37 @@
+from django.core.management.base import BaseCommand
+from django.conf import settings
+import time
+import logging
+
+from geomap.weather_grid import WeatherGrid
+
+logger = logging.getLogger(__name__)
+
+class Command(BaseCommand):
+    help = "Interpolate the current weather readings into temperature and rain overlays, only when readings changed"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--force", action="store_true", help="Redraw even if the readings are unchanged")
+        parser.add_argument("--loop", action="store_true", help="Keep running, checking for new readings every --interval seconds")
+        parser.add_argument("--interval", type=int, default=settings.WEATHER_GRID_INTERVAL)
+
+    def handle(self, *args, **options):
+        grid = WeatherGrid()
+
+        force = options["force"]
+        while True:
+            started = time.monotonic()
+            try:
+                if grid.run(force=force):
+                    self.stdout.write(self.style.SUCCESS(f"Weather grid redrawn in {time.monotonic() - started:.1f}s"))
+                else:
+                    self.stdout.write("Weather grid up to date")
+            except Exception as e:
+                if not options["loop"]:
+                    raise
+                logger.error(f"Error rendering weather grid: {e}")
+
+            if not options["loop"]:
+                return
+            force = False
+            time.sleep(options["interval"])
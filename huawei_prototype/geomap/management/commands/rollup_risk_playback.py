@@ -0,0 +1,32 @@
+from django.core.management.base import BaseCommand
+from django.conf import settings
+import time
+import logging
+
+from geomap.playback import run_rollup
+
+logger = logging.getLogger(__name__)
+
+class Command(BaseCommand):
+    help = "Roll accident probability scores up into per-camera time buckets for the playback slider"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--loop", action="store_true", help="Keep running, rolling up every --interval seconds")
+        parser.add_argument("--interval", type=int, default=settings.PLAYBACK_INTERVAL)
+
+    def handle(self, *args, **options):
+        while True:
+            started = time.monotonic()
+            try:
+                cameras, buckets = run_rollup()
+                self.stdout.write(self.style.SUCCESS(
+                    f"Risk playback: {cameras} cameras x {buckets} buckets in {time.monotonic() - started:.1f}s"
+                ))
+            except Exception as e:
+                if not options["loop"]:
+                    raise
+                logger.error(f"Error rolling up risk playback: {e}")
+
+            if not options["loop"]:
+                return
+            time.sleep(options["interval"])
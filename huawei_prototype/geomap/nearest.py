@@ -0,0 +1,91 @@
+import time
+import logging
+import threading
+import numpy as np
+from scipy.spatial import cKDTree
+from django.conf import settings
+from dashboard.models import Camera
+from geomap.cache import data_version
+from geomap.spatial import local_metres
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+# values_list() columns of the cameras in the index
+NEAREST_FIELDS = ('camera_id', 'camera_name', 'road_name', 'latitude', 'longitude')
+
+
+class CameraIndex:
+    """
+    KD-tree over camera positions in local metres (see geomap.spatial), for
+    the k nearest cameras to a point or every camera within a radius.
+    rows are NEAREST_FIELDS tuples; version is the Camera data version the
+    index was built at.
+    """
+
+    def __init__(self, rows, version=None):
+        self.rows = list(rows)
+        self.version = version
+        self.tree = cKDTree(local_metres([r[-2] for r in self.rows], [r[-1] for r in self.rows])) if self.rows else None
+
+    def nearest(self, lat, lng, k=None, radius=None):
+        """
+        [(row, distance in metres)] nearest first: the k nearest, limited to
+        radius metres when given. ValueError unless k or radius is given,
+        with k at least 1 and radius not negative.
+        """
+        if k is None and radius is None:
+            raise ValueError("nearest() needs k, radius or both")
+        if (k is not None and k < 1) or (radius is not None and radius < 0):
+            raise ValueError(f"k must be at least 1 and radius not negative, got k={k}, radius={radius}")
+        if self.tree is None:
+            return []
+        point = local_metres([lat], [lng])[0]
+        if k is None:
+            indexes = self.tree.query_ball_point(point, radius)
+            distances = np.hypot(*(self.tree.data[indexes] - point).T) if indexes else []
+            found = sorted(zip(distances, indexes))
+        else:
+            k = min(k, len(self.rows))
+            distances, indexes = self.tree.query(point, k=k, distance_upper_bound=np.inf if radius is None else radius)
+            # Missing neighbours beyond the radius come back as index n and distance inf
+            found = [(d, i) for d, i in zip(np.atleast_1d(distances), np.atleast_1d(indexes)) if i < len(self.rows)]
+        return [(self.rows[i], float(d)) for d, i in found]
+
+
+_index = None
+_checked = 0.0
+_lock = threading.Lock()
+
+
+def camera_index():
+    """
+    The process's CameraIndex. Camera saves in this process drop it on commit
+    (see invalidate_camera_index); other workers' saves are noticed from the
+    Camera data version, read from the file cache at most every
+    NEAREST_CAMERAS_VERSION_CHECK seconds rather than on every query.
+    """
+    global _index, _checked
+    index = _index
+    if index is not None and time.monotonic() - _checked < settings.NEAREST_CAMERAS_VERSION_CHECK:
+        return index
+    version = data_version(Camera)
+    with _lock:
+        if _index is None or _index.version != version:
+            rows = Camera.objects.exclude(latitude=None).exclude(longitude=None).values_list(*NEAREST_FIELDS)
+            _index = CameraIndex(rows, version)
+            logger.info(f"Camera index rebuilt with {len(_index.rows)} cameras")
+        _checked = time.monotonic()
+        index = _index
+    return index
+
+
+def invalidate_camera_index():
+    """Drop the process's CameraIndex so the next query rebuilds it."""
+    global _index
+    _index = None
+
+
+def nearest_cameras(lat, lng, k=None, radius=None):
+    """The k nearest cameras to a point and/or those within radius metres, as [(row, distance)]; see CameraIndex.nearest."""
+    return camera_index().nearest(lat, lng, k, radius)
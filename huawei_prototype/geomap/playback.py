@@ -0,0 +1,137 @@
+import os
+import logging
+from datetime import datetime, timezone as dt_timezone
+import numpy as np
+from django.conf import settings
+from django.db.models import OuterRef, Subquery
+from django.utils import timezone
+from dashboard.models import Camera, AccidentProbabilityScore
+from geomap.filters import INCIDENT_WINDOWS
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+ROLLUP_FILE = "risk_rollup.npz"
+
+# Scores are kept as uint8 0-254 (score * 254); NO_SCORE marks a camera without a reading yet
+NO_SCORE = 255
+
+# Spans the slider can replay, as the newest buckets of the rollup
+PLAYBACK_WINDOWS = ["24h", "7d"]
+DEFAULT_PLAYBACK_WINDOW = "24h"
+
+
+def rollup_path():
+    return os.path.join(settings.PLAYBACK_DIR, ROLLUP_FILE)
+
+
+def bucket_scores(camera_index, buckets, scores, n_cameras, n_buckets):
+    """
+    (n_cameras, n_buckets) grid of each camera's latest score by the end of
+    every bucket. Rows must be in time order; bucket -1 holds readings from
+    before the window, which only seed the first buckets.
+    """
+    grid = np.full((n_cameras, n_buckets + 1), np.nan)
+    if len(scores):
+        # The last reading of each (camera, bucket) cell wins
+        cell = camera_index * (n_buckets + 1) + buckets + 1
+        _, last = np.unique(cell[::-1], return_index=True)
+        last = len(cell) - 1 - last
+        grid.flat[cell[last]] = scores[last]
+
+    # Carry each camera's last known score forward into the buckets without readings
+    filled = np.where(np.isnan(grid), 0, np.arange(n_buckets + 1))
+    np.maximum.accumulate(filled, axis=1, out=filled)
+    grid = grid[np.arange(n_cameras)[:, None], filled]
+    return grid[:, 1:]
+
+
+def build_rollup(now=None, days=None, bucket_minutes=None):
+    """
+    Risk history of every located camera over the last `days`, in buckets
+    of `bucket_minutes`, as the arrays saved by save_rollup.
+    """
+    days = settings.PLAYBACK_HISTORY_DAYS if days is None else days
+    bucket_seconds = 60 * (settings.PLAYBACK_BUCKET_MINUTES if bucket_minutes is None else bucket_minutes)
+    now = now or timezone.now()
+    # Buckets end on a whole bucket, so the newest one is complete
+    end = int(now.timestamp()) // bucket_seconds * bucket_seconds
+    n_buckets = days * 86400 // bucket_seconds
+    start = end - n_buckets * bucket_seconds
+    start_time = datetime.fromtimestamp(start, dt_timezone.utc)
+
+    cameras = list(Camera.objects.exclude(latitude=None).order_by('camera_id').values_list('camera_id', 'latitude', 'longitude'))
+    camera_ids = np.array([c[0] for c in cameras], dtype=np.int64)
+
+    # Each camera's last score before the window, then every score inside it
+    before = AccidentProbabilityScore.objects.filter(camera=OuterRef('pk'), timestamp__lt=start_time).order_by('-timestamp')
+    seeds = Camera.objects.exclude(latitude=None).annotate(
+        score=Subquery(before.values('accident_prob_score')[:1])
+    ).exclude(score=None).values_list('camera_id', 'score')
+    inside = AccidentProbabilityScore.objects.filter(
+        camera__latitude__isnull=False, timestamp__gte=start_time, timestamp__lt=datetime.fromtimestamp(end, dt_timezone.utc),
+    ).order_by('timestamp', 'accident_prob_score_id').values_list('camera_id', 'timestamp', 'accident_prob_score')
+
+    rows = [(camera_id, -1, score) for camera_id, score in seeds]
+    rows += [(camera_id, (int(t.timestamp()) - start) // bucket_seconds, score) for camera_id, t, score in inside]
+    if rows:
+        ids, buckets, scores = (np.array(column) for column in zip(*rows))
+        camera_index = np.searchsorted(camera_ids, ids)
+    else:
+        camera_index = buckets = np.zeros(0, dtype=np.int64)
+        scores = np.zeros(0)
+
+    grid = bucket_scores(camera_index, buckets.astype(np.int64), scores.astype(np.float64), len(cameras), n_buckets)
+    quantised = np.where(np.isnan(grid), NO_SCORE, np.round(np.clip(np.nan_to_num(grid), 0, 1) * 254)).astype(np.uint8)
+    return {
+        "camera_ids": camera_ids,
+        "lat": np.array([c[1] for c in cameras], dtype=np.float64),
+        "lng": np.array([c[2] for c in cameras], dtype=np.float64),
+        "start": np.int64(start),
+        "bucket_seconds": np.int64(bucket_seconds),
+        # Bucket-major, so one frame of the slider is one contiguous row
+        "scores": np.ascontiguousarray(quantised.T),
+    }
+
+
+def save_rollup(rollup):
+    os.makedirs(settings.PLAYBACK_DIR, exist_ok=True)
+    path = rollup_path()
+    with open(path + ".tmp", "wb") as f:
+        np.savez_compressed(f, **rollup)
+    os.replace(path + ".tmp", path)
+
+
+_loaded = (None, None)
+
+
+def load_rollup():
+    """The saved rollup arrays, or None before rollup_risk_playback has run. Re-read only when the file changes."""
+    global _loaded
+    path = rollup_path()
+    try:
+        version = (path, os.stat(path).st_mtime_ns)
+    except OSError:
+        return None
+    if _loaded[0] != version:
+        with np.load(path) as data:
+            _loaded = (version, {name: data[name] for name in data.files})
+    return _loaded[1]
+
+
+def run_rollup(now=None):
+    """Rebuild and save the rollup; returns (cameras, buckets)."""
+    rollup = build_rollup(now)
+    save_rollup(rollup)
+    n_buckets, n_cameras = rollup["scores"].shape
+    logger.info(f"Risk playback rolled up: {n_cameras} cameras x {n_buckets} buckets")
+    return n_cameras, n_buckets
+
+
+def window_frames(rollup, window):
+    """(start, scores) of the newest buckets covering a PLAYBACK_WINDOWS span."""
+    bucket_seconds = int(rollup["bucket_seconds"])
+    count = int(INCIDENT_WINDOWS[window][1].total_seconds()) // bucket_seconds
+    scores = rollup["scores"][-count:]
+    start = int(rollup["start"]) + (len(rollup["scores"]) - len(scores)) * bucket_seconds
+    return start, scores
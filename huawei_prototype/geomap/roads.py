@@ -0,0 +1,187 @@
+import os
+import logging
+import shapely
+from shapely.geometry import LineString, MultiLineString
+from shapely.ops import linemerge, unary_union, substring
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Avg, Max, Count
+from dashboard.models import Camera, CameraState, RoadSegment
+from geomap.cache import bump_version
+from geomap.spatial import local_metres, lng_lat
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+# Expressways built into segments, by their OSM name (same as seed_network_with_osm)
+EXPRESSWAYS = [
+    "Pan Island Expressway",
+    "East Coast Parkway",
+    "Central Expressway",
+    "Ayer Rajah Expressway",
+    "Tampines Expressway",
+    "Kallang-Paya Lebar Expressway",
+]
+
+
+def to_metres(geometry):
+    """Geometry in (lng, lat) degrees to SVY21 metres (see geomap.spatial)."""
+    return shapely.transform(geometry, lambda coords: local_metres(coords[:, 1], coords[:, 0]))
+
+
+def to_degrees(geometry):
+    """Inverse of to_metres."""
+    return shapely.transform(geometry, lng_lat)
+
+
+def tiers():
+    """Minimum zoom of each simplification tier, coarsest first."""
+    return sorted(settings.ROAD_SIMPLIFY_TOLERANCES)
+
+
+def segment_tier(zoom):
+    """The most detailed tier whose minimum zoom is at or below zoom."""
+    return max([t for t in tiers() if t <= zoom] or [tiers()[0]])
+
+
+def tier_key(tier):
+    """Key of a tier in RoadSegment.polylines; not a bare number, which JSON lookups read as an array index."""
+    return f"z{tier}"
+
+
+def split_line(line, length):
+    """Cut a line (in metres) into stretches of about length metres."""
+    pieces = max(1, round(line.length / length))
+    step = line.length / pieces
+    return [substring(line, i * step, (i + 1) * step) for i in range(pieces)]
+
+
+def _lines(geometry):
+    if isinstance(geometry, LineString):
+        return [geometry]
+    if isinstance(geometry, MultiLineString):
+        return list(geometry.geoms)
+    return []
+
+
+def build_segments(roads, length=None):
+    """
+    Unsaved RoadSegments from {road name: [LineString in (lng, lat)]}.
+
+    Each road's edges are merged into continuous lines, cut into stretches
+    of ROAD_SEGMENT_LENGTH metres and simplified once per tier of
+    ROAD_SIMPLIFY_TOLERANCES, so requests only pick a stored polyline.
+    """
+    length = length or settings.ROAD_SEGMENT_LENGTH
+    segments = []
+    for name, geometries in roads.items():
+        merged = linemerge(unary_union([to_metres(g) for g in geometries]))
+        # Longest lines first, so sequence 0 is the main carriageway
+        lines = sorted(_lines(merged), key=lambda line: -line.length)
+        for sequence, piece in enumerate(p for line in lines for p in split_line(line, length)):
+            polylines = {}
+            for tier in tiers():
+                simplified = to_degrees(piece.simplify(settings.ROAD_SIMPLIFY_TOLERANCES[tier], preserve_topology=False))
+                polylines[tier_key(tier)] = [[round(lat, 6), round(lng, 6)] for lng, lat in simplified.coords]
+            min_lng, min_lat, max_lng, max_lat = to_degrees(piece).bounds
+            segments.append(RoadSegment(
+                road_name=name, sequence=sequence, length_m=piece.length, polylines=polylines,
+                min_lat=min_lat, min_lng=min_lng, max_lat=max_lat, max_lng=max_lng,
+            ))
+    return segments
+
+
+def load_drive_graph(graph_path=None):
+    """
+    Singapore's OSM drive network, downloaded once and then read from the
+    GraphML copy at graph_path (OSM_GRAPH_PATH).
+    """
+    import osmnx as ox
+
+    graph_path = graph_path or settings.OSM_GRAPH_PATH
+    if os.path.exists(graph_path):
+        return ox.load_graphml(graph_path)
+    graph = ox.graph_from_place("Singapore", network_type="drive")
+    os.makedirs(os.path.dirname(graph_path), exist_ok=True)
+    ox.save_graphml(graph, graph_path)
+    return graph
+
+
+def load_expressway_lines(graph_path=None):
+    """{expressway name: [edge LineString]} from the OSM drive network (see load_drive_graph)."""
+    import osmnx as ox
+
+    edges = ox.graph_to_gdfs(load_drive_graph(graph_path), nodes=False, edges=True)
+
+    roads = {}
+    for name in EXPRESSWAYS:
+        # Same case-insensitive match on the OSM name tag as the seed command
+        mask = edges["name"].apply(
+            lambda x: (
+                any(name.lower() in n.lower() for n in x) if isinstance(x, list)
+                else (isinstance(x, str) and name.lower() in x.lower())
+            )
+        )
+        if mask.any():
+            roads[name] = list(edges[mask].geometry.values)
+        else:
+            logger.warning(f"No OSM edges found for {name}")
+    return roads
+
+
+def snap_cameras(max_distance=None):
+    """
+    Point every camera at its nearest road segment within max_distance
+    metres (ROAD_SNAP_DISTANCE), using an STRtree over the most detailed
+    polylines. Cameras further from every segment are unsnapped.
+    Returns the number of cameras snapped.
+    """
+    max_distance = settings.ROAD_SNAP_DISTANCE if max_distance is None else max_distance
+    finest = tier_key(tiers()[-1])
+    rows = list(RoadSegment.objects.values_list('pk', 'polylines'))
+    cameras = list(Camera.objects.all())
+
+    snapped = {}
+    located = [c for c in cameras if c.latitude is not None and c.longitude is not None]
+    if rows and located:
+        ids = [pk for pk, _ in rows]
+        tree = shapely.STRtree([
+            to_metres(LineString([(lng, lat) for lat, lng in polylines[finest]])) for _, polylines in rows
+        ])
+        points = to_metres(shapely.points([(c.longitude, c.latitude) for c in located]))
+        (point_index, segment_index), distances = tree.query_nearest(
+            points, max_distance=max_distance, return_distance=True, all_matches=False
+        )
+        for p, s, distance in zip(point_index, segment_index, distances):
+            snapped[located[p].pk] = (ids[s], float(distance))
+
+    for camera in cameras:
+        camera.road_segment_id, camera.snap_distance_m = snapped.get(camera.pk, (None, None))
+    Camera.objects.bulk_update(cameras, ['road_segment', 'snap_distance_m'], batch_size=500)
+    bump_version(Camera)
+    logger.info(f"Snapped {len(snapped)} of {len(cameras)} cameras to road segments")
+    return len(snapped)
+
+
+def replace_segments(segments):
+    """Swap the stored segments for new ones and snap the cameras to them."""
+    with transaction.atomic():
+        RoadSegment.objects.all().delete()
+        RoadSegment.objects.bulk_create(segments, batch_size=500)
+        snapped = snap_cameras()
+    bump_version(RoadSegment)
+    return snapped
+
+
+def segment_risk(segment_ids=None):
+    """
+    {segment id: (average, peak, cameras)} over the current score of the
+    cameras snapped to each segment, aggregated in SQL.
+    """
+    states = CameraState.objects.filter(camera__road_segment__isnull=False, accident_prob_score__isnull=False)
+    if segment_ids is not None:
+        states = states.filter(camera__road_segment__in=segment_ids)
+    rows = states.values('camera__road_segment').annotate(
+        average=Avg('accident_prob_score'), peak=Max('accident_prob_score'), cameras=Count('pk')
+    ).values_list('camera__road_segment', 'average', 'peak', 'cameras')
+    return {segment_id: (average, peak, cameras) for segment_id, average, peak, cameras in rows}
@@ -0,0 +1,143 @@
+import os
+import logging
+import threading
+import numpy as np
+import shapely
+from scipy.sparse import csr_matrix
+from scipy.sparse.csgraph import dijkstra
+from scipy.spatial import cKDTree
+from shapely.geometry import LineString
+from django.conf import settings
+from dashboard.models import CameraState
+from geomap.spatial import local_metres
+from geomap.nearest import camera_index
+from geomap.roads import to_metres, load_drive_graph
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+
+class RouteGraph:
+    """
+    Directed road graph as a sparse matrix of edge lengths, with a KD-tree
+    of its nodes to start and end routes at the nearest junction.
+
+    lat and lng are per node; edges are (u, v, length in metres, [(lng, lat)]
+    or None) with u and v indexes into the nodes. Of parallel edges the
+    shortest is kept, with its geometry.
+    """
+
+    def __init__(self, lat, lng, edges):
+        self.lat = np.asarray(lat, dtype=np.float64)
+        self.lng = np.asarray(lng, dtype=np.float64)
+        self.tree = cKDTree(local_metres(self.lat, self.lng))
+
+        shortest = {}
+        for u, v, length, coords in edges:
+            if (u, v) not in shortest or length < shortest[(u, v)][0]:
+                shortest[(u, v)] = (length, coords)
+        self.geometry = {key: coords for key, (_, coords) in shortest.items() if coords}
+        n = len(self.lat)
+        if shortest:
+            (u, v), lengths = zip(*shortest.keys()), [length for length, _ in shortest.values()]
+            # Zero-length edges would vanish from a sparse matrix
+            self.matrix = csr_matrix((np.maximum(lengths, 1e-3), (u, v)), shape=(n, n))
+        else:
+            self.matrix = csr_matrix((n, n))
+
+    @classmethod
+    def from_osm(cls, graph):
+        """From an OSMnx MultiDiGraph (nodes with x/y, edges with length and optional geometry)."""
+        index = {node: i for i, node in enumerate(graph.nodes)}
+        lat = [data['y'] for _, data in graph.nodes(data=True)]
+        lng = [data['x'] for _, data in graph.nodes(data=True)]
+        edges = [
+            (index[u], index[v], float(data.get('length', 0)),
+             list(data['geometry'].coords) if 'geometry' in data else None)
+            for u, v, data in graph.edges(data=True)
+        ]
+        return cls(lat, lng, edges)
+
+    def nearest_node(self, lat, lng):
+        """(node index, distance in metres) of the junction nearest a point."""
+        distance, node = self.tree.query(local_metres([lat], [lng])[0])
+        return int(node), float(distance)
+
+    def route(self, origin, destination):
+        """
+        Shortest path between two (lat, lng) points as (LineString of
+        (lng, lat), length in metres), or None when no path connects them.
+        """
+        start, _ = self.nearest_node(*origin)
+        end, _ = self.nearest_node(*destination)
+        distances, predecessors = dijkstra(self.matrix, indices=start, return_predecessors=True)
+        if not np.isfinite(distances[end]):
+            return None
+
+        nodes = [end]
+        while nodes[-1] != start:
+            nodes.append(int(predecessors[nodes[-1]]))
+        nodes.reverse()
+
+        coords = [(self.lng[start], self.lat[start])]
+        for u, v in zip(nodes, nodes[1:]):
+            coords.extend(self.geometry.get((u, v), [(self.lng[u], self.lat[u]), (self.lng[v], self.lat[v])])[1:])
+        if len(coords) == 1:
+            coords.append(coords[0])
+        return LineString(coords), float(distances[end])
+
+
+_graph = None
+_lock = threading.Lock()
+
+
+def route_graph():
+    """
+    The process's RouteGraph, read once from the cached OSM drive graph
+    (OSM_GRAPH_PATH). None until seed_network_with_osm or
+    build_road_segments has saved that graph; requests never download it.
+    """
+    global _graph
+    if _graph is None:
+        with _lock:
+            if _graph is None and os.path.exists(settings.OSM_GRAPH_PATH):
+                _graph = RouteGraph.from_osm(load_drive_graph(settings.OSM_GRAPH_PATH))
+                logger.info(f"Route graph loaded with {len(_graph.lat)} nodes")
+    return _graph
+
+
+def cameras_along(path, buffer):
+    """
+    [(camera row, distance in metres)] of the cameras within buffer metres
+    of a (lng, lat) path: the camera KD-tree is queried around points
+    every buffer metres along it, then candidates are measured exactly.
+    """
+    index = camera_index()
+    if index.tree is None:
+        return []
+    path = to_metres(path)
+    samples = shapely.get_coordinates(shapely.segmentize(path, max(buffer, 1)))
+    # Every point within buffer of the path is within buffer * 1.12 of a sample
+    candidates = sorted({i for near in index.tree.query_ball_point(samples, buffer * 1.5) for i in near})
+    if not candidates:
+        return []
+    distances = shapely.distance(path, shapely.points(index.tree.data[candidates]))
+    return sorted(
+        ((index.rows[i], float(d)) for i, d in zip(candidates, distances) if d <= buffer),
+        key=lambda found: found[1],
+    )
+
+
+def route_risk(path, buffer):
+    """
+    Cameras within buffer metres of a path with their current accident
+    probability score, and the sum and max of those scores.
+    """
+    cameras = cameras_along(path, buffer)
+    scores = dict(
+        CameraState.objects.filter(camera_id__in=[row[0] for row, _ in cameras])
+        .exclude(accident_prob_score=None).values_list('camera_id', 'accident_prob_score')
+    )
+    found = [(row, distance, scores.get(row[0])) for row, distance in cameras]
+    scored = [score for _, _, score in found if score is not None]
+    return found, sum(scored), max(scored, default=None)
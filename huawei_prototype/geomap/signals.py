@@ -0,0 +1,30 @@
+from django.db import transaction
+from django.db.models.signals import post_save, post_delete
+from dashboard.models import Camera, Incident, AccidentProbabilityScore, Weather, ChangeLog
+from geomap.cache import bump_version
+from geomap.nearest import invalidate_camera_index
+
+# Tables the maps are drawn from. Bulk queryset.update()/bulk_create() send no
+# signals, so code using them must call bump_version() itself.
+MAP_MODELS = [Camera, Incident, AccidentProbabilityScore, Weather]
+
+# Live map layers patched from the change log (see views.changes)
+CHANGE_LAYERS = {Incident: 'incident', AccidentProbabilityScore: 'score', Weather: 'weather'}
+
+
+def data_changed(sender, instance, **kwargs):
+    # After commit, so a map rebuilt under the new version can't be drawn from
+    # the old rows, and a change log entry never points at uncommitted data
+    transaction.on_commit(lambda: bump_version(sender))
+    if sender is Camera:
+        # This worker's nearest-camera index; the others see the version bump
+        transaction.on_commit(invalidate_camera_index)
+    if sender in CHANGE_LAYERS:
+        layer, object_id, camera_id = CHANGE_LAYERS[sender], instance.pk, instance.camera_id
+        transaction.on_commit(lambda: ChangeLog.record(layer, object_id, camera_id))
+
+
+def connect():
+    for model in MAP_MODELS:
+        post_save.connect(data_changed, sender=model, dispatch_uid=f"geomap_save_{model.__name__}")
+        post_delete.connect(data_changed, sender=model, dispatch_uid=f"geomap_delete_{model.__name__}")
@@ -0,0 +1,145 @@
+import math
+import numpy as np
+import folium
+from pyproj import Transformer
+from folium.elements import MacroElement, Template
+from dashboard.models import GRID_CELL_DEGREES, GRID_CELL_COLUMNS
+
+# Singapore's coordinates
+SINGAPORE_CENTER = [1.3521, 103.8198]
+DEFAULT_ZOOM = 12
+
+# Metres for distances, snapping and binning come from SVY21 / Singapore TM
+# (EPSG:3414), the national grid, which keeps scale error across the island
+# to a few parts per million
+METRIC_CRS = "EPSG:3414"
+_to_metres = Transformer.from_crs("EPSG:4326", METRIC_CRS, always_xy=True)
+_to_degrees = Transformer.from_crs(METRIC_CRS, "EPSG:4326", always_xy=True)
+
+# Above this many grid cells a viewport is queried on the lat/lng index alone;
+# a long IN list stops paying off once the box covers most of the island
+MAX_VIEWPORT_CELLS = 400
+
+
+class Viewport:
+    """Map viewport from the request: bounding box (degrees) and zoom level."""
+
+    def __init__(self, west, south, east, north, zoom=DEFAULT_ZOOM):
+        self.west, self.south, self.east, self.north = west, south, east, north
+        self.zoom = zoom
+
+    @property
+    def center(self):
+        return [(self.south + self.north) / 2, (self.west + self.east) / 2]
+
+    def grid_cells(self):
+        """Ids of every grid cell the box touches, or None if there are too many."""
+        row0 = int((self.south + 90) // GRID_CELL_DEGREES)
+        row1 = int((self.north + 90) // GRID_CELL_DEGREES)
+        col0 = int((self.west + 180) // GRID_CELL_DEGREES)
+        col1 = int((self.east + 180) // GRID_CELL_DEGREES)
+        if (row1 - row0 + 1) * (col1 - col0 + 1) > MAX_VIEWPORT_CELLS:
+            return None
+        return [r * GRID_CELL_COLUMNS + c for r in range(row0, row1 + 1) for c in range(col0, col1 + 1)]
+
+    def query_string(self):
+        return f"bbox={self.west},{self.south},{self.east},{self.north}&zoom={self.zoom}"
+
+
+def parse_viewport(request):
+    """
+    Read ?bbox=west,south,east,north&zoom=z (Leaflet's toBBoxString order).
+    Returns None when no valid bbox is given, meaning "everything".
+    """
+    bbox = request.GET.get('bbox')
+    if not bbox:
+        return None
+    try:
+        west, south, east, north = map(float, bbox.split(','))
+    except ValueError:
+        return None
+    if not all(math.isfinite(v) for v in (west, south, east, north)) or south > north or west > east:
+        return None
+
+    try:
+        zoom = int(request.GET.get('zoom', DEFAULT_ZOOM))
+    except ValueError:
+        zoom = DEFAULT_ZOOM
+    return Viewport(west, south, east, north, max(0, min(zoom, 20)))
+
+
+def local_metres(lat, lng):
+    """(n, 2) array of SVY21 x/y metres of the points."""
+    x, y = _to_metres.transform(np.asarray(lng, dtype=np.float64), np.asarray(lat, dtype=np.float64))
+    return np.column_stack([x, y])
+
+
+def lng_lat(xy):
+    """(n, 2) array of (lng, lat) of SVY21 x/y metres; the inverse of local_metres."""
+    xy = np.asarray(xy, dtype=np.float64).reshape(-1, 2)
+    lng, lat = _to_degrees.transform(xy[:, 0], xy[:, 1])
+    return np.column_stack([lng, lat])
+
+
+def filter_viewport(queryset, viewport, camera_field=None):
+    """
+    Restrict a queryset to rows whose camera lies inside the viewport.
+    camera_field is the path to the Camera (e.g. 'camera') for related models.
+    """
+    if viewport is None:
+        return queryset
+    prefix = f"{camera_field}__" if camera_field else ""
+
+    filters = {
+        f"{prefix}latitude__gte": viewport.south,
+        f"{prefix}latitude__lte": viewport.north,
+        f"{prefix}longitude__gte": viewport.west,
+        f"{prefix}longitude__lte": viewport.east,
+    }
+    cells = viewport.grid_cells()
+    if cells is not None:
+        # Index lookup on the cells first; the exact range then trims the edge cells
+        filters[f"{prefix}grid_cell__in"] = cells
+    return queryset.filter(**filters)
+
+
+def create_map(viewport):
+    """folium map centred on the viewport (or Singapore) with a "Search this area" button."""
+    if viewport is None:
+        map_sg = folium.Map(location=SINGAPORE_CENTER, zoom_start=DEFAULT_ZOOM)
+    else:
+        map_sg = folium.Map(location=viewport.center, zoom_start=viewport.zoom)
+    ViewportSearch().add_to(map_sg)
+    return map_sg
+
+
+class ViewportSearch(MacroElement):
+    """Leaflet button that reloads the page with the current bbox and zoom."""
+
+    _template = Template("""
+        {% macro script(this, kwargs) %}
+        (function() {
+            var map = {{ this._parent.get_name() }};
+            var control = L.control({position: 'topright'});
+            control.onAdd = function() {
+                var button = L.DomUtil.create('button', 'btn btn-light btn-sm');
+                button.innerHTML = 'Search this area';
+                L.DomEvent.on(button, 'click', function(e) {
+                    L.DomEvent.stop(e);
+                    // The map lives in an iframe; reload the page that embeds it
+                    var page = window.parent.location;
+                    var params = new URLSearchParams(page.search);
+                    params.set('bbox', map.getBounds().toBBoxString());
+                    params.set('zoom', map.getZoom());
+                    page.search = params.toString();
+                });
+                return button;
+            };
+            control.addTo(map);
+        })();
+        {% endmacro %}
+    """)
+
+    def __init__(self):
+        super().__init__()
+        self._name = "ViewportSearch"
@@ -1,7 +1,50 @@
-from django.test import TestCase, Client
+import os
+import re
+import base64
+import shutil
+import tempfile
+import numpy as np
+import cv2
+from datetime import datetime, timedelta, timezone as dt_timezone
+from django.utils import timezone
+from django.test import TestCase, Client, RequestFactory, override_settings
+from django.core.management import call_command
 from django.urls import reverse
-from dashboard.models import Camera, Incident, Weather, AccidentProbabilityScore
+from django.contrib.auth import get_user_model
+from django.conf import settings
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from unittest.mock import patch
+from geomap.spatial import parse_viewport, filter_viewport, create_map, local_metres
+from geomap.filters import parse_incident_filter, filter_incidents
+from geomap.fast_render import FastMarkerLayer, circle
+from geomap.cache import map_cache, data_version, bump_version
+from geomap.clusters import ClusterIndex
+from geomap.tiles import TileRenderer, RISK_TILES
+from geomap.roads import build_segments, replace_segments, split_line, to_metres, segment_tier
+from geomap.nearest import CameraIndex, nearest_cameras, camera_index, invalidate_camera_index
+from geomap.hexbin import hexbin, hex_cells, hex_center
+from geomap import routes
+from geomap.routes import RouteGraph, cameras_along
+from geomap.weather_grid import WeatherGrid, idw, rain_likelihood, load_manifest, overlay_path
+from geomap.playback import bucket_scores, build_rollup, run_rollup, load_rollup, NO_SCORE
+from shapely.geometry import LineString
+from dashboard.models import Camera, Incident, Weather, AccidentProbabilityScore, ChangeLog, RoadSegment
 
+# The map cache outlives each test's rolled-back data, so view tests render uncached
+NO_MAP_CACHE = {
+    "default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"},
+    "geomap": {"BACKEND": "django.core.cache.backends.dummy.DummyCache"},
+}
+
+
+def marker_ids(map_html):
+    """Ids in a rendered map's marker payload; popup details are fetched by these."""
+    match = re.search(r'&quot;ids&quot;:\[([\d,]*)\]', map_html)
+    return [int(i) for i in match.group(1).split(',') if i] if match else []
+
+
+@override_settings(CACHES=NO_MAP_CACHE)
 class MapHomeViewTests(TestCase):
     """Tests for the map home view."""
     
@@ -22,6 +65,7 @@ class MapHomeViewTests(TestCase):
         self.assertContains(response, reverse('weather_map'))
 
 
+@override_settings(CACHES=NO_MAP_CACHE)
 class CameraMapViewTests(TestCase):
     """Tests for the camera map view."""
     
@@ -54,18 +98,19 @@ class CameraMapViewTests(TestCase):
         
         # Check for camera data in the map HTML
         map_html = response.context['map_html']
-        self.assertIn("TEST-CAM-01", map_html)
-        self.assertIn("TEST-CAM-02", map_html)
-        self.assertIn("Test Road A", map_html)
-        self.assertIn("Test Road B", map_html)
+        self.assertEqual(marker_ids(map_html), [1, 2])
         
         # Check for correct coordinates
         self.assertIn("1.3099", map_html)
         self.assertIn("103.9053", map_html)
         
+        # Camera details are loaded into the popup when a marker is clicked
+        popup = self.client.get(reverse('api_popup', args=['camera', 2])).json()
+        self.assertEqual(popup['name'], "TEST-CAM-02")
+        self.assertEqual(popup['road'], "Test Road B")
+        
         # Check for feed links
-        self.assertIn('/cameras/view/1/', map_html)
-        self.assertIn('/cameras/view/2/', map_html)
+        self.assertIn('/cameras/view/{id}/', map_html)
     
     def test_camera_map_no_cameras(self):
         """Test the camera map view with no cameras (demo data)."""
@@ -82,6 +127,7 @@ class CameraMapViewTests(TestCase):
         self.assertIn("Demo data", map_html)
 
 
+@override_settings(CACHES=NO_MAP_CACHE)
 class IncidentMapViewTests(TestCase):
     """Tests for the incident map view."""
     
@@ -119,13 +165,17 @@ class IncidentMapViewTests(TestCase):
         
         # Check for incident data in the map HTML
         map_html = response.context['map_html']
-        self.assertIn("Traffic Accident", map_html)
-        self.assertIn("Vehicle Fire", map_html)
-        self.assertIn("Test Road A", map_html)
+        self.assertCountEqual(marker_ids(map_html), [self.incident1.pk, self.incident2.pk])
         
         # Check for severity levels
-        self.assertIn("high", map_html.lower())
-        self.assertIn("medium", map_html.lower())
+        self.assertIn("red", map_html.lower())
+        self.assertIn("orange", map_html.lower())
+        
+        # Incident details are loaded into the popup when a marker is clicked
+        popup = self.client.get(reverse('api_popup', args=['incident', self.incident2.pk])).json()
+        self.assertEqual(popup['type'], "Vehicle Fire")
+        self.assertEqual(popup['severity'], "Medium")
+        self.assertEqual(popup['road'], "Test Road A")
         
         # Check for the correct coordinates
         self.assertIn("1.3099", map_html)
@@ -150,6 +200,7 @@ class IncidentMapViewTests(TestCase):
         self.assertIn("low", map_html.lower())
 
 
+@override_settings(CACHES=NO_MAP_CACHE)
 class ProbabilityMapViewTests(TestCase):
     """Tests for the probability map view."""
     
@@ -166,6 +217,23 @@ class ProbabilityMapViewTests(TestCase):
             feed_url="https://example.com/test01"
         )
         
+        # The map shows each camera's latest score, so each risk level gets its own camera
+        self.camera2 = Camera.objects.create(
+            camera_id=2,
+            camera_name="TEST-CAM-02",
+            location="1.3347,103.7775",
+            road_name="Test Road B",
+            feed_url="https://example.com/test02"
+        )
+        
+        self.camera3 = Camera.objects.create(
+            camera_id=3,
+            camera_name="TEST-CAM-03",
+            location="1.3545,103.8390",
+            road_name="Test Road C",
+            feed_url="https://example.com/test03"
+        )
+        
         # Create test probability scores of different risk levels
         self.high_risk = AccidentProbabilityScore.objects.create(
             area_geometry="POINT(1.3099 103.9053)",
@@ -174,15 +242,15 @@ class ProbabilityMapViewTests(TestCase):
         )
         
         self.medium_risk = AccidentProbabilityScore.objects.create(
-            area_geometry="POINT(1.3099 103.9053)",
+            area_geometry="POINT(1.3347 103.7775)",
             accident_prob_score=0.55,  # Medium risk
-            camera=self.camera
+            camera=self.camera2
         )
         
         self.low_risk = AccidentProbabilityScore.objects.create(
-            area_geometry="POINT(1.3099 103.9053)",
+            area_geometry="POINT(1.3545 103.8390)",
             accident_prob_score=0.25,  # Low risk
-            camera=self.camera
+            camera=self.camera3
         )
         
     def test_probability_map_all_risks(self):
@@ -195,14 +263,17 @@ class ProbabilityMapViewTests(TestCase):
         self.assertEqual(response.context['selected_type'], 'all')
         self.assertIn('map_html', response.context)
         
-        # Check that all risk levels are in the HTML
+        # Check that all risk levels are on the map
         map_html = response.context['map_html']
-        self.assertIn("High Risk Area", map_html)
-        self.assertIn("Medium Risk Area", map_html)
-        self.assertIn("Low Risk Area", map_html)
-        self.assertIn("0.85", map_html)  # High risk score
-        self.assertIn("0.55", map_html)  # Medium risk score
-        self.assertIn("0.25", map_html)  # Low risk score
+        self.assertCountEqual(marker_ids(map_html), [self.high_risk.pk, self.medium_risk.pk, self.low_risk.pk])
+        
+        # Score details are loaded into the popup when a marker is clicked
+        for score, title, value in [(self.high_risk, "High Risk Area", "0.85"),
+                                    (self.medium_risk, "Medium Risk Area", "0.55"),
+                                    (self.low_risk, "Low Risk Area", "0.25")]:
+            popup = self.client.get(reverse('api_popup', args=['score', score.pk])).json()
+            self.assertEqual(popup['title'], title)
+            self.assertEqual(popup['score'], value)
     
     def test_probability_map_high_risk_filter(self):
         """Test the probability map filtered to high risk only."""
@@ -212,14 +283,9 @@ class ProbabilityMapViewTests(TestCase):
         # Check that context contains expected variables
         self.assertEqual(response.context['selected_type'], 'high risk')
         
-        # Check that only high risk is in the HTML
+        # Check that only high risk is on the map
         map_html = response.context['map_html']
-        self.assertIn("High Risk Area", map_html)
-        self.assertNotIn("Medium Risk Area", map_html)
-        self.assertNotIn("Low Risk Area", map_html)
-        self.assertIn("0.85", map_html)  # High risk score
-        self.assertNotIn("0.55", map_html)  # Medium risk score
-        self.assertNotIn("0.25", map_html)  # Low risk score
+        self.assertEqual(marker_ids(map_html), [self.high_risk.pk])
     
     def test_probability_map_no_markers_filter(self):
         """Test the probability map with no markers filter."""
@@ -253,6 +319,7 @@ class ProbabilityMapViewTests(TestCase):
         self.assertIn("Low Risk Area", map_html)
 
 
+@override_settings(CACHES=NO_MAP_CACHE)
 class WeatherMapViewTests(TestCase):
     """Tests for the weather map view."""
     
@@ -298,12 +365,16 @@ class WeatherMapViewTests(TestCase):
         
         # Check for weather data in the map HTML
         map_html = response.context['map_html']
-        self.assertIn("32.5°C", map_html)
-        self.assertIn("26.7°C", map_html)
-        self.assertIn("Sunny", map_html)
-        self.assertIn("Light Rain", map_html)
-        self.assertIn("TEST-CAM-01", map_html)
-        self.assertIn("TEST-CAM-02", map_html)
+        self.assertEqual(marker_ids(map_html), [1, 2])
+        self.assertIn("/geomap/api/popup/weather/{id}/", map_html)
+        
+        # Readings are loaded into the popup when a marker is clicked
+        popup = self.client.get(reverse('api_popup', args=['weather', 1])).json()
+        self.assertEqual(popup['temperature'], 32.5)
+        self.assertEqual(popup['conditions'], "Sunny")
+        self.assertEqual(popup['camera'], "TEST-CAM-01")
+        popup = self.client.get(reverse('api_popup', args=['weather', 2])).json()
+        self.assertEqual(popup['conditions'], "Light Rain")
         
         # Check for proper coordinates
         self.assertIn("1.3099", map_html)
@@ -343,6 +414,7 @@ class WeatherMapViewTests(TestCase):
         self.assertIn("Demo data", map_html)
 
 
+@override_settings(CACHES=NO_MAP_CACHE)
 class MapIntegrationTests(TestCase):
     """Integration tests for maps working together."""
     
@@ -381,20 +453,1308 @@ class MapIntegrationTests(TestCase):
         """Test that a camera appears consistently on all maps."""
         # Check camera map
         camera_response = self.client.get(reverse('camera_map'))
-        self.assertIn("TEST-CAM-01", camera_response.context['map_html'])
+        self.assertEqual(marker_ids(camera_response.context['map_html']), [1])
         
         # Check incident map
         incident_response = self.client.get(reverse('incident_map'))
-        self.assertIn("TEST-CAM-01", incident_response.context['map_html'])
-        self.assertIn("Traffic Accident", incident_response.context['map_html'])
+        self.assertEqual(marker_ids(incident_response.context['map_html']), [self.incident.pk])
+        popup = self.client.get(reverse('api_popup', args=['incident', self.incident.pk])).json()
+        self.assertEqual(popup['camera'], "TEST-CAM-01")
+        self.assertEqual(popup['type'], "Traffic Accident")
         
         # Check weather map
         weather_response = self.client.get(reverse('weather_map'))
-        self.assertIn("TEST-CAM-01", weather_response.context['map_html'])
-        self.assertIn("28.5°C", weather_response.context['map_html'])
-        self.assertIn("Sunny", weather_response.context['map_html'])
+        self.assertEqual(marker_ids(weather_response.context['map_html']), [1])
+        popup = self.client.get(reverse('api_popup', args=['weather', 1])).json()
+        self.assertEqual(popup['camera'], "TEST-CAM-01")
+        self.assertEqual(popup['temperature'], 28.5)
+        self.assertEqual(popup['conditions'], "Sunny")
         
         # Check probability map
         probability_response = self.client.get(reverse('probability_map'))
-        self.assertIn("TEST-CAM-01", probability_response.context['map_html'])
-        self.assertIn("0.85", probability_response.context['map_html'])
\ No newline at end of file
+        self.assertEqual(marker_ids(probability_response.context['map_html']), [self.risk_score.pk])
+        popup = self.client.get(reverse('api_popup', args=['score', self.risk_score.pk])).json()
+        self.assertEqual(popup['camera'], "TEST-CAM-01")
+        self.assertEqual(popup['score'], "0.85")
+
+
+@override_settings(CACHES=NO_MAP_CACHE)
+class ViewportTests(TestCase):
+    """Tests for restricting the maps to the requested bounding box."""
+
+    def setUp(self):
+        self.client = Client()
+        get_user_model().objects.create_user(username="viewportuser", password="testpass")
+        self.client.login(username="viewportuser", password="testpass")
+
+        self.east = Camera.objects.create(
+            camera_id=1, camera_name="EAST-CAM", location="1.3099,103.9053",
+            road_name="Test Road A", feed_url="https://example.com/east"
+        )
+        self.west = Camera.objects.create(
+            camera_id=2, camera_name="WEST-CAM", location="1.3329,103.7436",
+            road_name="Test Road B", feed_url="https://example.com/west"
+        )
+        self.bbox = {'bbox': '103.88,1.29,103.93,1.33', 'zoom': '14'}
+
+    def test_grid_cell_set_on_save(self):
+        """Test that cameras get a grid cell from their coordinates."""
+        self.assertIsNotNone(self.east.grid_cell)
+        self.assertNotEqual(self.east.grid_cell, self.west.grid_cell)
+
+    def test_parse_viewport(self):
+        """Test bbox parsing and rejection of malformed input."""
+        factory = RequestFactory()
+        viewport = parse_viewport(factory.get('/', self.bbox))
+        self.assertEqual((viewport.west, viewport.south, viewport.east, viewport.north), (103.88, 1.29, 103.93, 1.33))
+        self.assertEqual(viewport.zoom, 14)
+        self.assertIsNone(parse_viewport(factory.get('/')))
+        self.assertIsNone(parse_viewport(factory.get('/', {'bbox': '1,2,3'})))
+        self.assertIsNone(parse_viewport(factory.get('/', {'bbox': '103.93,1.29,103.88,1.33'})))
+
+    def test_filter_viewport(self):
+        """Test that only cameras inside the box are returned, with and without the cell lookup."""
+        viewport = parse_viewport(RequestFactory().get('/', self.bbox))
+        self.assertEqual(list(filter_viewport(Camera.objects.all(), viewport)), [self.east])
+
+        # A box too large for the cell list falls back to the coordinate range
+        large = parse_viewport(RequestFactory().get('/', {'bbox': '100,-5,110,5'}))
+        self.assertIsNone(large.grid_cells())
+        self.assertEqual(filter_viewport(Camera.objects.all(), large).count(), 2)
+
+    def test_maps_filtered_by_viewport(self):
+        """Test that every map only shows data inside the viewport."""
+        east_ids = {}
+        for camera in (self.east, self.west):
+            incident = Incident.objects.create(incident_type="Traffic Accident", severity="high", camera=camera)
+            Weather.objects.create(temperature=28.5, conditions="Sunny", camera=camera)
+            score = AccidentProbabilityScore.objects.create(
+                area_geometry=f"POINT({camera.location.replace(',', ' ')})",
+                accident_prob_score=0.85, camera=camera
+            )
+            if camera == self.east:
+                east_ids = {'camera_map': camera.pk, 'incident_map': incident.pk,
+                            'weather_map': camera.pk, 'probability_map': score.pk}
+
+        for name in ('camera_map', 'incident_map', 'weather_map', 'probability_map'):
+            response = self.client.get(reverse(name), self.bbox)
+            map_html = response.context['map_html']
+            self.assertEqual(marker_ids(map_html), [east_ids[name]], name)
+            self.assertNotIn("Demo data", map_html, name)
+            self.assertIn("Search this area", map_html, name)
+
+    def test_empty_viewport_shows_no_demo_data(self):
+        """Test that an empty viewport over real data doesn't fall back to demo data."""
+        response = self.client.get(reverse('camera_map'), {'bbox': '103.6,1.2,103.61,1.21'})
+        map_html = response.context['map_html']
+        self.assertEqual(marker_ids(map_html), [])
+        self.assertNotIn("Demo data", map_html)
+
+
+@override_settings(CACHES=NO_MAP_CACHE)
+class LayerApiTests(TestCase):
+    """Tests for the GeoJSON layer endpoints behind the live map."""
+
+    def setUp(self):
+        self.client = Client()
+        get_user_model().objects.create_user(username="apiuser", password="testpass")
+        self.client.login(username="apiuser", password="testpass")
+
+        self.camera = Camera.objects.create(
+            camera_id=1, camera_name="TEST-CAM-01", location="1.3099,103.9053",
+            road_name="Test Road A", feed_url="https://example.com/test01"
+        )
+        Incident.objects.create(incident_type="Traffic Accident", severity="high", camera=self.camera)
+        Weather.objects.create(temperature=28.5, conditions="Sunny", camera=self.camera)
+        AccidentProbabilityScore.objects.create(area_geometry="POINT(1.3099 103.9053)", accident_prob_score=0.85, camera=self.camera)
+        AccidentProbabilityScore.objects.create(area_geometry="POINT(1.3099 103.9053)", accident_prob_score=0.2, camera=self.camera)
+
+    def test_layers_are_geojson(self):
+        """Test that every layer returns points in [lng, lat] order."""
+        for name in ('api_cameras', 'api_incidents', 'api_probability', 'api_weather'):
+            data = self.client.get(reverse(name)).json()
+            self.assertEqual(data['type'], 'FeatureCollection', name)
+            self.assertEqual(data['features'][0]['geometry']['coordinates'], [103.9053, 1.3099], name)
+
+    def test_layer_properties(self):
+        """Test the properties the client renders popups from."""
+        incident = self.client.get(reverse('api_incidents')).json()['features'][0]['properties']
+        self.assertEqual(incident['type'], "Traffic Accident")
+        self.assertEqual(incident['camera'], "TEST-CAM-01")
+        weather = self.client.get(reverse('api_weather')).json()['features'][0]['properties']
+        self.assertEqual((weather['temperature'], weather['conditions']), (28.5, "Sunny"))
+
+    def test_weather_shows_current_reading_only(self):
+        """Test that the weather layer and map show one reading per camera, the latest."""
+        Weather.objects.create(temperature=25.0, conditions="Thunderstorm", camera=self.camera)
+        features = self.client.get(reverse('api_weather')).json()['features']
+        self.assertEqual([f['properties']['conditions'] for f in features], ["Thunderstorm"])
+
+        map_html = self.client.get(reverse('weather_map')).context['map_html']
+        self.assertEqual(marker_ids(map_html), [self.camera.pk])
+        self.assertIn("bolt", map_html)
+        self.assertNotIn("sun-o", map_html)
+
+    def test_probability_risk_filter(self):
+        """Test that the risk filter is applied in the query."""
+        camera = Camera.objects.create(
+            camera_id=2, camera_name="TEST-CAM-02", location="1.3521,103.8198",
+            road_name="Test Road B", feed_url="https://example.com/test02"
+        )
+        AccidentProbabilityScore.objects.create(area_geometry="POINT(1.3521 103.8198)", accident_prob_score=0.9, camera=camera)
+        data = self.client.get(reverse('api_probability'), {'type': 'high risk'}).json()
+        self.assertEqual([f['properties']['camera'] for f in data['features']], ["TEST-CAM-02"])
+        self.assertEqual(len(self.client.get(reverse('api_probability')).json()['features']), 2)
+
+    def test_probability_shows_latest_score_only(self):
+        """Test that the layer has one point per camera, its newest score, like the probability map."""
+        newest = AccidentProbabilityScore.objects.filter(camera=self.camera).latest('timestamp', 'pk')
+        AccidentProbabilityScore.objects.filter(camera=self.camera).exclude(pk=newest.pk).update(
+            timestamp=timezone.now() - timedelta(hours=1)
+        )
+        features = self.client.get(reverse('api_probability')).json()['features']
+        self.assertEqual([f['properties']['id'] for f in features], [newest.pk])
+        self.assertEqual(features[0]['properties']['score'], 0.2)
+
+    def test_layers_respect_viewport(self):
+        """Test that layers outside the bbox are empty."""
+        data = self.client.get(reverse('api_cameras'), {'bbox': '103.6,1.2,103.7,1.25'}).json()
+        self.assertEqual(data['features'], [])
+
+    def test_layer_query_count(self):
+        """Test that a layer is served from a single query."""
+        with self.assertNumQueries(3):  # session + user + the layer itself
+            self.client.get(reverse('api_incidents'))
+
+    def test_live_map_shell(self):
+        """Test that the shell page loads without any map data in it."""
+        response = self.client.get(reverse('live_map'))
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, reverse('api_clusters', args=['cameras']))
+        self.assertNotContains(response, "TEST-CAM-01")
+
+
+@override_settings(CACHES={
+    "default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"},
+    "geomap": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache", "LOCATION": "geomap-tests"},
+})
+class MapCacheTests(TestCase):
+    """Tests for the version-keyed rendered map cache."""
+
+    def setUp(self):
+        map_cache().clear()
+        self.client = Client()
+        get_user_model().objects.create_user(username="cacheuser", password="testpass")
+        self.client.login(username="cacheuser", password="testpass")
+
+        self.camera = Camera.objects.create(
+            camera_id=1, camera_name="TEST-CAM-01", location="1.3099,103.9053",
+            road_name="Test Road A", feed_url="https://example.com/test01"
+        )
+        self.score = AccidentProbabilityScore.objects.create(area_geometry="POINT(1.3099 103.9053)", accident_prob_score=0.85, camera=self.camera)
+
+    def test_repeat_load_is_cached(self):
+        """Test that a second load reuses the HTML without querying the scores again."""
+        first = self.client.get(reverse('probability_map')).context['map_html']
+        with self.assertNumQueries(2):  # session + user only
+            second = self.client.get(reverse('probability_map')).context['map_html']
+        self.assertEqual(first, second)
+
+    def test_filter_parameters_cached_separately(self):
+        """Test that each filter gets its own entry."""
+        high = self.client.get(reverse('probability_map'), {'type': 'high risk'}).context['map_html']
+        low = self.client.get(reverse('probability_map'), {'type': 'low risk'}).context['map_html']
+        self.assertEqual(marker_ids(high), [self.score.pk])
+        self.assertEqual(marker_ids(low), [])
+
+    def test_save_and_delete_invalidate(self):
+        """Test that saving or deleting a row bumps the version and rebuilds the map."""
+        self.client.get(reverse('probability_map'))
+        version = data_version(AccidentProbabilityScore)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            score = AccidentProbabilityScore.objects.create(area_geometry="POINT(1.3 103.9)", accident_prob_score=0.55, camera=self.camera)
+        self.assertNotEqual(data_version(AccidentProbabilityScore), version)
+        self.assertIn(score.pk, marker_ids(self.client.get(reverse('probability_map')).context['map_html']))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            score.delete()
+        self.assertNotIn(score.pk, marker_ids(self.client.get(reverse('probability_map')).context['map_html']))
+
+    def test_version_bumped_after_commit(self):
+        """Test that a map rebuilt before the write commits is keyed by the old version, not the new one."""
+        version = data_version(AccidentProbabilityScore)
+        cursor = ChangeLog.cursor()
+        with self.captureOnCommitCallbacks() as callbacks:
+            score = AccidentProbabilityScore.objects.create(area_geometry="POINT(1.3 103.9)", accident_prob_score=0.55, camera=self.camera)
+            # Other requests still read the committed rows here, so nothing may move yet
+            self.assertEqual(data_version(AccidentProbabilityScore), version)
+            self.assertEqual(ChangeLog.cursor(), cursor)
+
+        for callback in callbacks:
+            callback()
+        self.assertNotEqual(data_version(AccidentProbabilityScore), version)
+        self.assertEqual(ChangeLog.objects.get(change_id__gt=cursor).object_id, score.pk)
+
+    def test_camera_change_invalidates_dependent_maps(self):
+        """Test that moving a camera shows up on maps drawn from other tables."""
+        self.client.get(reverse('probability_map'))
+        self.camera.latitude, self.camera.longitude = 1.3215, 103.8123
+        with self.captureOnCommitCallbacks(execute=True):
+            self.camera.save()
+        self.assertIn("1.3215", self.client.get(reverse('probability_map')).context['map_html'])
+
+
+@override_settings(CACHES={
+    "default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"},
+    "geomap": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache", "LOCATION": "geomap-cluster-tests"},
+}, CLUSTER_MAX_ZOOM=15, CLUSTER_CELL_PIXELS=60)
+class ClusterTests(TestCase):
+    """Tests for server-side marker clustering."""
+
+    def setUp(self):
+        map_cache().clear()
+        self.client = Client()
+        get_user_model().objects.create_user(username="clusteruser", password="testpass")
+        self.client.login(username="clusteruser", password="testpass")
+
+        # Three cameras a few hundred metres apart in the east, one far west
+        for i, location in enumerate(["1.3099,103.9053", "1.3110,103.9070", "1.3085,103.9040", "1.3329,103.7436"], start=1):
+            camera = Camera.objects.create(
+                camera_id=i, camera_name=f"CAM-{i}", location=location,
+                road_name="Test Road", feed_url=f"https://example.com/{i}"
+            )
+            Incident.objects.create(incident_type="Traffic Accident", severity="high" if i % 2 else "low", camera=camera)
+
+    def test_index_merges_nearby_points_at_low_zoom(self):
+        """Test that nearby points cluster when zoomed out and separate when zoomed in."""
+        index = ClusterIndex([1.3099, 1.3110, 1.3085, 1.3329], [103.9053, 103.9070, 103.9040, 103.7436],
+                             categories=["high", "low", "high", "low"])
+        counts = sorted(f["properties"].get("count", 1) for f in index.features(11))
+        self.assertEqual(counts, [1, 3])
+        cluster = next(f for f in index.features(11) if f["properties"]["cluster"])
+        self.assertEqual(cluster["properties"]["breakdown"], {"high": 2, "low": 1})
+        self.assertEqual(len(index.features(16)), 4)
+
+    def test_cluster_api(self):
+        """Test that the API returns clusters with a severity breakdown."""
+        data = self.client.get(reverse('api_clusters', args=['incidents']), {'zoom': 11}).json()
+        clusters = [f['properties'] for f in data['features'] if f['properties']['cluster']]
+        self.assertEqual(len(clusters), 1)
+        self.assertEqual(clusters[0]['count'], 3)
+        self.assertEqual(sum(clusters[0]['breakdown'].values()), 3)
+
+        singles = [f['properties'] for f in data['features'] if not f['properties']['cluster']]
+        self.assertEqual([p['camera'] for p in singles], ["CAM-4"])
+
+    def test_high_zoom_returns_points_in_viewport(self):
+        """Test that zooming past CLUSTER_MAX_ZOOM returns individual markers inside the bbox."""
+        data = self.client.get(reverse('api_clusters', args=['cameras']), {'bbox': '103.88,1.29,103.93,1.33', 'zoom': 17}).json()
+        self.assertEqual(sorted(f['properties']['name'] for f in data['features']), ["CAM-1", "CAM-2", "CAM-3"])
+
+    def test_incidents_limited_to_window(self):
+        """Test that incidents outside the selected window are left out of the index."""
+        Incident.objects.filter(camera_id=4).update(timestamp=timezone.now() - timedelta(days=3))
+        url = reverse('api_clusters', args=['incidents'])
+        recent = self.client.get(url, {'zoom': 17}).json()['features']
+        self.assertEqual(sorted(f['properties']['camera'] for f in recent), ["CAM-1", "CAM-2", "CAM-3"])
+        self.assertEqual(len(self.client.get(url, {'zoom': 17, 'window': '7d'}).json()['features']), 4)
+        self.assertEqual(len(self.client.get(url, {'zoom': 17, 'severity': 'low'}).json()['features']), 1)
+
+    def test_index_is_cached_until_data_changes(self):
+        """Test that the precomputed clusters are reused and rebuilt after a write."""
+        self.client.get(reverse('api_clusters', args=['cameras']), {'zoom': 17})
+        with self.assertNumQueries(2):  # session + user only
+            self.client.get(reverse('api_clusters', args=['cameras']), {'zoom': 11})
+
+        with self.captureOnCommitCallbacks(execute=True):
+            Camera.objects.create(camera_name="CAM-5", location="1.35,103.85", road_name="New Road", feed_url="https://example.com/5")
+        data = self.client.get(reverse('api_clusters', args=['cameras']), {'zoom': 17}).json()
+        self.assertEqual(len(data['features']), 5)
+
+    def test_unknown_layer(self):
+        """Test that unknown layers are a 404."""
+        self.assertEqual(self.client.get(reverse('api_clusters', args=['nope'])).status_code, 404)
+
+
+@override_settings(CACHES=NO_MAP_CACHE, RISK_TILE_MIN_ZOOM=10, RISK_TILE_MAX_ZOOM=12, RISK_TILE_RADIUS=15)
+class RiskTileTests(TestCase):
+    """Tests for the pre-rendered accident risk tile pyramid."""
+
+    def setUp(self):
+        self.tile_dir = tempfile.mkdtemp()
+        self.override = override_settings(RISK_TILE_DIR=self.tile_dir)
+        self.override.enable()
+        self.client = Client()
+        get_user_model().objects.create_user(username="tileuser", password="testpass")
+        self.client.login(username="tileuser", password="testpass")
+
+        self.east = Camera.objects.create(
+            camera_id=1, camera_name="EAST-CAM", location="1.3099,103.9053",
+            road_name="Test Road A", feed_url="https://example.com/east"
+        )
+        self.west = Camera.objects.create(
+            camera_id=2, camera_name="WEST-CAM", location="1.3329,103.7436",
+            road_name="Test Road B", feed_url="https://example.com/west"
+        )
+        for camera in (self.east, self.west):
+            AccidentProbabilityScore.objects.create(area_geometry="POINT(0 0)", accident_prob_score=0.8, camera=camera)
+
+    def tearDown(self):
+        self.override.disable()
+        shutil.rmtree(self.tile_dir, ignore_errors=True)
+
+    def tile_files(self):
+        return {
+            os.path.relpath(os.path.join(root, f), self.tile_dir)
+            for root, _, files in os.walk(self.tile_dir) for f in files if f.endswith(".png")
+        }
+
+    def test_full_render_writes_coloured_tiles(self):
+        """Test that a full run draws a heat spot with the gradient's colours."""
+        written, _ = TileRenderer().run()
+        self.assertGreater(written, 0)
+        self.assertEqual(len(self.tile_files()), written)
+
+        tiles = [cv2.imread(os.path.join(self.tile_dir, p), cv2.IMREAD_UNCHANGED) for p in self.tile_files()]
+        self.assertEqual(tiles[0].shape, (256, 256, 4))
+        tile = max(tiles, key=lambda t: t[:, :, 3].max())
+        # The centre of a 0.8 spot sits between the orange and red stops
+        b, g, r, a = tile.reshape(-1, 4)[tile[:, :, 3].argmax()]
+        self.assertEqual((r, b), (255, 0))
+        self.assertLess(g, 165)
+
+    def test_incremental_render_only_touches_changed_tiles(self):
+        """Test that unchanged scores redraw nothing and one changed score redraws only its tiles."""
+        written, _ = TileRenderer().run()
+        self.assertEqual(TileRenderer().run(), (0, 0))
+
+        west_tiles = {p for p in self.tile_files()}
+        mtimes = {p: os.stat(os.path.join(self.tile_dir, p)).st_mtime_ns for p in west_tiles}
+        AccidentProbabilityScore.objects.create(area_geometry="POINT(0 0)", accident_prob_score=0.3, camera=self.east)
+        rewritten, removed = TileRenderer().run()
+        self.assertEqual(removed, 0)
+        self.assertGreater(rewritten, 0)
+        self.assertLess(rewritten, written)
+        unchanged = [p for p in west_tiles if os.stat(os.path.join(self.tile_dir, p)).st_mtime_ns == mtimes[p]]
+        self.assertEqual(len(unchanged), written - rewritten)
+
+    def test_removed_scores_remove_tiles(self):
+        """Test that tiles left empty are deleted."""
+        TileRenderer().run()
+        before = len(self.tile_files())
+        AccidentProbabilityScore.objects.filter(camera=self.west).delete()
+        _, removed = TileRenderer().run()
+        self.assertGreater(removed, 0)
+        self.assertEqual(len(self.tile_files()), before - removed)
+
+    def test_command(self):
+        """Test the render_risk_tiles command."""
+        call_command('render_risk_tiles', '--full', stdout=open(os.devnull, 'w'))
+        self.assertTrue(self.tile_files())
+
+    def test_tile_view_caching_headers(self):
+        """Test that tiles are served with Cache-Control and revalidate with an ETag."""
+        TileRenderer().run()
+        z, x, name = sorted(self.tile_files())[0].split(os.sep)
+        url = reverse('risk_tile', args=[int(z), int(x), int(name[:-4])])
+
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], 'image/png')
+        self.assertIn('max-age', response['Cache-Control'])
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=response['ETag']).status_code, 304)
+
+        blank = self.client.get(reverse('risk_tile', args=[12, 0, 0]))
+        self.assertEqual(blank.status_code, 200)
+        image = cv2.imdecode(np.frombuffer(b"".join(blank), np.uint8), cv2.IMREAD_UNCHANGED)
+        self.assertEqual(image[:, :, 3].max(), 0)
+
+    @override_settings(CACHES={
+        "default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"},
+        "geomap": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache", "LOCATION": "geomap-tile-tests"},
+    })
+    def test_unchanged_run_keeps_cached_maps(self):
+        """Test that a run with nothing to redraw leaves the tile and score versions alone."""
+        TileRenderer().run()
+        versions = data_version(RISK_TILES), data_version(AccidentProbabilityScore)
+        TileRenderer().run()
+        self.assertEqual((data_version(RISK_TILES), data_version(AccidentProbabilityScore)), versions)
+
+        AccidentProbabilityScore.objects.create(area_geometry="POINT(0 0)", accident_prob_score=0.3, camera=self.east)
+        TileRenderer().run()
+        self.assertNotEqual(data_version(RISK_TILES), versions[0])
+
+    def test_probability_map_uses_tiles(self):
+        """Test that the map switches from the browser heatmap to the tile layer once tiles exist."""
+        self.assertNotIn("/geomap/tiles/risk/", self.client.get(reverse('probability_map')).context['map_html'])
+        TileRenderer().run()
+        map_html = self.client.get(reverse('probability_map')).context['map_html']
+        self.assertIn("/geomap/tiles/risk/{z}/{x}/{y}.png", map_html)
+
+
+@override_settings(CACHES=NO_MAP_CACHE)
+class FastMarkerLayerTests(TestCase):
+    """Tests for drawing map markers from one JSON payload."""
+
+    def setUp(self):
+        self.client = Client()
+        get_user_model().objects.create_user(username="fastuser", password="testpass")
+        self.client.login(username="fastuser", password="testpass")
+        self.camera = Camera.objects.create(
+            camera_id=1, camera_name="TEST-CAM-01", location="1.3099,103.9053",
+            road_name="Test Road A", feed_url="https://example.com/test01"
+        )
+
+    def test_incident_markers_share_styles(self):
+        """Test that many incidents become one layer with one style per icon/colour pair."""
+        for i in range(30):
+            Incident.objects.create(incident_type="Fire", severity="high" if i % 2 else "low", camera=self.camera)
+        map_html = self.client.get(reverse('incident_map')).context['map_html']
+        self.assertEqual(map_html.count("L.AwesomeMarkers.icon(style.icon)"), 1)
+        self.assertNotIn("L.marker(\n", map_html)
+        self.assertEqual(len(marker_ids(map_html)), 30)
+        self.assertEqual(map_html.count("markerColor"), 2)
+
+    def test_probability_markers(self):
+        """Test that score markers carry only ids, with the popup template to fill."""
+        score = AccidentProbabilityScore.objects.create(area_geometry="POINT(1.3099 103.9053)", accident_prob_score=0.85, camera=self.camera)
+        map_html = self.client.get(reverse('probability_map')).context['map_html']
+        self.assertEqual(marker_ids(map_html), [score.pk])
+        self.assertIn("Accident Probability Score:", map_html)
+        self.assertIn("/geomap/api/popup/score/{id}/", map_html)
+
+    def test_payload_cannot_close_script(self):
+        """Test that text from the database can't end the script block early."""
+        map_sg = create_map(None)
+        FastMarkerLayer([1.3], [103.9], [0], [circle("red", 4)], "{name}", {"name": ["</script><b>x"]}).add_to(map_sg)
+        map_html = map_sg._repr_html_()
+        self.assertNotIn("&lt;/script&gt;&lt;b&gt;x", map_html)
+        self.assertIn("&lt;\\/script&gt;&lt;b&gt;x", map_html)
+
+    def test_benchmark_command(self):
+        """Test that the benchmark prints a row per marker count."""
+        from io import StringIO
+        out = StringIO()
+        call_command('benchmark_map_render', '--counts', '5', '10', '--repeat', '1', stdout=out)
+        self.assertEqual(len(out.getvalue().strip().splitlines()), 3)
+
+
+@override_settings(CACHES=NO_MAP_CACHE)
+class PopupApiTests(TestCase):
+    """Tests for the marker popup details fetched on click."""
+
+    def setUp(self):
+        self.client = Client()
+        get_user_model().objects.create_user(username="popupuser", password="testpass")
+        self.client.login(username="popupuser", password="testpass")
+        self.camera = Camera.objects.create(
+            camera_id=1, camera_name="TEST-CAM-01", location="1.3099,103.9053",
+            road_name="Test Road A", feed_url="https://example.com/test01"
+        )
+
+    def test_popup_details(self):
+        """Test that each marker type returns the fields its popup template uses."""
+        incident = Incident.objects.create(incident_type="Traffic Accident", severity="high", camera=self.camera)
+        score = AccidentProbabilityScore.objects.create(area_geometry="POINT(1.3099 103.9053)", accident_prob_score=0.55, camera=self.camera)
+        Weather.objects.create(temperature=27.0, conditions="Cloudy", camera=self.camera)
+
+        camera = self.client.get(reverse('api_popup', args=['camera', 1])).json()
+        self.assertEqual(camera, {"id": 1, "name": "TEST-CAM-01", "location": "1.3099,103.9053", "road": "Test Road A"})
+        incident = self.client.get(reverse('api_popup', args=['incident', incident.pk])).json()
+        self.assertEqual((incident['type'], incident['severity']), ("Traffic Accident", "High"))
+        score = self.client.get(reverse('api_popup', args=['score', score.pk])).json()
+        self.assertEqual((score['title'], score['level'], score['score']), ("Medium Risk Area", "Medium", "0.55"))
+        weather = self.client.get(reverse('api_popup', args=['weather', 1])).json()
+        self.assertEqual((weather['temperature'], weather['conditions']), (27.0, "Cloudy"))
+
+    def test_popup_is_cacheable_by_browser(self):
+        """Test that popups may be reused briefly by the browser that fetched them."""
+        response = self.client.get(reverse('api_popup', args=['camera', 1]))
+        self.assertIn("private", response["Cache-Control"])
+        self.assertIn("max-age=", response["Cache-Control"])
+
+    def test_unknown_marker(self):
+        """Test that unknown types and missing rows are 404s."""
+        self.assertEqual(self.client.get(reverse('api_popup', args=['bogus', 1])).status_code, 404)
+        self.assertEqual(self.client.get(reverse('api_popup', args=['incident', 999])).status_code, 404)
+        self.assertEqual(self.client.get(reverse('api_popup', args=['weather', 1])).status_code, 404)
+
+    def test_login_required(self):
+        """Test that popup details need a logged-in user."""
+        self.client.logout()
+        self.assertEqual(self.client.get(reverse('api_popup', args=['camera', 1])).status_code, 302)
+
+
+@override_settings(CACHES=NO_MAP_CACHE)
+class IncidentFilterTests(TestCase):
+    """Tests for the incident map's time window, filters and result cap."""
+
+    def setUp(self):
+        self.client = Client()
+        get_user_model().objects.create_user(username="filteruser", password="testpass")
+        self.client.login(username="filteruser", password="testpass")
+        self.camera = Camera.objects.create(
+            camera_id=1, camera_name="TEST-CAM-01", location="1.3099,103.9053",
+            road_name="Test Road A", feed_url="https://example.com/test01"
+        )
+        now = timezone.now()
+        self.recent = Incident.objects.create(incident_type="Traffic Accident", severity="high", camera=self.camera)
+        self.fire = Incident.objects.create(incident_type="Vehicle Fire", severity="low", camera=self.camera)
+        self.old = Incident.objects.create(incident_type="Traffic Accident", severity="high", camera=self.camera)
+        # timestamp is auto_now_add, so backdate with update()
+        Incident.objects.filter(pk=self.fire.pk).update(timestamp=now - timedelta(hours=3))
+        Incident.objects.filter(pk=self.old.pk).update(timestamp=now - timedelta(days=3))
+
+    def ids(self, params=None):
+        return sorted(marker_ids(self.client.get(reverse('incident_map'), params or {}).context['map_html']))
+
+    def test_default_window_excludes_old_history(self):
+        """Test that the map shows the last 24 hours unless asked otherwise."""
+        self.assertEqual(self.ids(), sorted([self.recent.pk, self.fire.pk]))
+        self.assertEqual(self.ids({'window': '1h'}), [self.recent.pk])
+        self.assertEqual(self.ids({'window': '7d'}), sorted([self.recent.pk, self.fire.pk, self.old.pk]))
+
+    def test_custom_range(self):
+        """Test an explicit start/end range, and that a bad range falls back to the default window."""
+        start = (timezone.now() - timedelta(days=4)).strftime('%Y-%m-%dT%H:%M')
+        end = (timezone.now() - timedelta(days=1)).strftime('%Y-%m-%dT%H:%M')
+        self.assertEqual(self.ids({'window': 'custom', 'start': start, 'end': end}), [self.old.pk])
+        self.assertEqual(self.ids({'window': 'custom', 'start': end, 'end': start}), sorted([self.recent.pk, self.fire.pk]))
+
+    def test_severity_and_type_filters(self):
+        """Test that severity and type narrow the results."""
+        self.assertEqual(self.ids({'severity': 'low'}), [self.fire.pk])
+        self.assertEqual(self.ids({'incident_type': 'Traffic Accident'}), [self.recent.pk])
+        self.assertEqual(self.ids({'severity': 'low', 'incident_type': 'Traffic Accident'}), [])
+
+    @override_settings(INCIDENT_MAP_LIMIT=1)
+    def test_results_capped_with_more_flag(self):
+        """Test that only the newest incidents are drawn and the page says more exist."""
+        response = self.client.get(reverse('incident_map'))
+        self.assertEqual(marker_ids(response.context['map_html']), [self.recent.pk])
+        self.assertTrue(response.context['more_available'])
+        self.assertContains(response, "More incidents are available")
+
+        response = self.client.get(reverse('incident_map'), {'window': '1h'})
+        self.assertFalse(response.context['more_available'])
+
+        data = self.client.get(reverse('api_incidents')).json()
+        self.assertEqual([f['properties']['id'] for f in data['features']], [self.recent.pk])
+        self.assertTrue(data['more'])
+
+    def test_window_query_uses_index(self):
+        """Test that the time window is answered from the timestamp index."""
+        request = RequestFactory().get('/', {'window': '1h'})
+        incidents = filter_incidents(Incident.objects.all(), parse_incident_filter(request)).order_by('-timestamp')
+        self.assertIn("incident_time_idx", incidents.explain())
+
+
+@override_settings(CACHES=NO_MAP_CACHE)
+class ProbabilityQueryTests(TestCase):
+    """Tests for the probability map's latest-score and aggregate queries."""
+
+    def setUp(self):
+        self.client = Client()
+        get_user_model().objects.create_user(username="scoreuser", password="testpass")
+        self.client.login(username="scoreuser", password="testpass")
+        self.camera = Camera.objects.create(
+            camera_id=1, camera_name="TEST-CAM-01", location="1.3099,103.9053",
+            road_name="Test Road A", feed_url="https://example.com/test01"
+        )
+        self.other = Camera.objects.create(
+            camera_id=2, camera_name="TEST-CAM-02", location="1.3347,103.7775",
+            road_name="Test Road B", feed_url="https://example.com/test02"
+        )
+        now = timezone.now()
+        scores = []
+        for camera, value, hours_ago in [(self.camera, 0.9, 30), (self.camera, 0.5, 2), (self.camera, 0.3, 1), (self.other, 0.6, 1)]:
+            score = AccidentProbabilityScore.objects.create(area_geometry="POINT(1.3 103.9)", accident_prob_score=value, camera=camera)
+            AccidentProbabilityScore.objects.filter(pk=score.pk).update(timestamp=now - timedelta(hours=hours_ago))
+            scores.append(score)
+        self.old_peak, self.earlier, self.latest, self.other_latest = scores
+
+    def get(self, **params):
+        return self.client.get(reverse('probability_map'), params).context['map_html']
+
+    def test_latest_score_per_camera(self):
+        """Test that each camera shows only its newest score, banded in the query."""
+        self.assertCountEqual(marker_ids(self.get()), [self.latest.pk, self.other_latest.pk])
+        self.assertEqual(marker_ids(self.get(type='medium risk')), [self.other_latest.pk])
+        # A camera's older high score doesn't make it a high risk area now
+        self.assertEqual(marker_ids(self.get(type='high risk')), [])
+
+    def test_aggregates_over_window(self):
+        """Test average and peak scores per camera over a window."""
+        average = self.get(score='avg', window='24h')
+        self.assertIn("0.40", average)  # (0.5 + 0.3) / 2, the 30h-old score is outside the window
+        self.assertIn("0.60", average)
+        self.assertIn("0.90", self.get(score='max', window='7d'))
+        self.assertNotIn("0.90", self.get(score='max', window='24h'))
+        peak_high = self.get(score='max', window='7d', type='high risk')
+        self.assertIn("TEST-CAM-01", peak_high)
+        self.assertNotIn("TEST-CAM-02", peak_high)
+
+    def test_no_markers_with_tiles_skips_scores(self):
+        """Test that tiles plus no markers doesn't read any score rows."""
+        with self.settings(RISK_TILE_DIR=tempfile.mkdtemp()):
+            self.addCleanup(shutil.rmtree, settings.RISK_TILE_DIR, True)
+            TileRenderer(min_zoom=10, max_zoom=10).run()
+            with CaptureQueriesContext(connection) as queries:
+                map_html = self.get(type='no markers')
+        self.assertIn("/geomap/tiles/risk/", map_html)
+        # Only the exists() check for demo data touches the scores table
+        self.assertFalse([q for q in queries if 'accident_prob_score"' in q['sql'] and 'LIMIT 1' not in q['sql']])
+
+
+@override_settings(CACHES=NO_MAP_CACHE)
+class MapChangesTests(TestCase):
+    """Tests for the change log and the delta endpoint live maps poll."""
+
+    def setUp(self):
+        self.client = Client()
+        get_user_model().objects.create_user(username="liveuser", password="testpass")
+        self.client.login(username="liveuser", password="testpass")
+        self.camera = Camera.objects.create(
+            camera_id=1, camera_name="TEST-CAM-01", location="1.3099,103.9053",
+            road_name="Test Road A", feed_url="https://example.com/test01"
+        )
+        self.cursor = ChangeLog.cursor()
+
+    def committed(self):
+        """Writes inside this block are logged as if committed (the change log is written on commit)."""
+        return self.captureOnCommitCallbacks(execute=True)
+
+    def changes(self, layer, **params):
+        return self.client.get(reverse('api_changes', args=[layer]), dict(params, since=self.cursor)).json()
+
+    def test_new_incident_is_sent_once(self):
+        """Test that a new incident comes back with its marker style and moves the cursor on."""
+        with self.committed():
+            incident = Incident.objects.create(incident_type="Fire", severity="high", camera=self.camera)
+        delta = self.changes('incident')
+        self.assertEqual([(c['key'], c['id']) for c in delta['changed']], [(incident.pk, incident.pk)])
+        self.assertEqual(delta['changed'][0]['style']['icon']['icon'], "fire")
+        self.assertEqual(delta['changed'][0]['style']['icon']['markerColor'], "red")
+        self.assertGreater(delta['cursor'], self.cursor)
+
+        self.cursor = delta['cursor']
+        self.assertEqual(self.changes('incident')['changed'], [])
+
+    def test_changes_follow_map_filters(self):
+        """Test that changes outside the map's filters or deleted rows are removals."""
+        with self.committed():
+            incident = Incident.objects.create(incident_type="Fire", severity="high", camera=self.camera)
+        self.assertEqual(self.changes('incident', severity='low')['removed'], [incident.pk])
+        incident_id = incident.pk
+        with self.committed():
+            incident.delete()
+        self.assertEqual(self.changes('incident')['removed'], [incident_id])
+
+    def test_scores_and_weather_keyed_by_camera(self):
+        """Test that a new score or reading replaces its camera's marker."""
+        with self.committed():
+            AccidentProbabilityScore.objects.create(area_geometry="POINT(1.3 103.9)", accident_prob_score=0.9, camera=self.camera)
+            latest = AccidentProbabilityScore.objects.create(area_geometry="POINT(1.3 103.9)", accident_prob_score=0.2, camera=self.camera)
+        delta = self.changes('score')
+        self.assertEqual([(c['key'], c['id']) for c in delta['changed']], [(1, latest.pk)])
+        self.assertEqual(delta['changed'][0]['style']['circle']['color'], "green")
+        self.assertEqual(self.changes('score', type='high risk')['removed'], [1])
+
+        with self.committed():
+            Weather.objects.create(temperature=25.0, conditions="Thunderstorm", camera=self.camera)
+        delta = self.changes('weather')
+        self.assertEqual([c['key'] for c in delta['changed']], [1])
+        self.assertEqual(delta['changed'][0]['style']['icon']['icon'], "bolt")
+
+    @override_settings(MAP_CHANGES_LIMIT=1)
+    def test_more_changes_than_limit(self):
+        """Test that a long backlog is paged through the cursor."""
+        with self.committed():
+            first = Incident.objects.create(incident_type="Fire", severity="high", camera=self.camera)
+            second = Incident.objects.create(incident_type="Fire", severity="low", camera=self.camera)
+        delta = self.changes('incident')
+        self.assertTrue(delta['more'])
+        self.assertEqual([c['key'] for c in delta['changed']], [first.pk])
+        self.cursor = delta['cursor']
+        delta = self.changes('incident')
+        self.assertFalse(delta['more'])
+        self.assertEqual([c['key'] for c in delta['changed']], [second.pk])
+
+    @override_settings(INCIDENT_MAP_LIMIT=2)
+    def test_incident_changes_keep_map_limit(self):
+        """Test that a new incident pushes the oldest drawn one off the map, and one past the cap is not drawn."""
+        with self.committed():
+            old, older, oldest = [Incident.objects.create(incident_type="Fire", severity="high", camera=self.camera) for _ in range(3)]
+        for minutes, incident in enumerate([old, older, oldest], 1):
+            Incident.objects.filter(pk=incident.pk).update(timestamp=timezone.now() - timedelta(minutes=minutes))
+        self.cursor = ChangeLog.cursor()
+
+        with self.committed():
+            new = Incident.objects.create(incident_type="Fire", severity="high", camera=self.camera)
+        delta = self.changes('incident')
+        self.assertEqual(sorted(c['key'] for c in delta['changed']), sorted([new.pk, old.pk]))
+        self.assertEqual(delta['removed'], [older.pk])
+
+        self.cursor = delta['cursor']
+        oldest.refresh_from_db()
+        with self.committed():
+            oldest.severity = "medium"
+            oldest.save()
+        delta = self.changes('incident')
+        self.assertNotIn(oldest.pk, [c['key'] for c in delta['changed']])
+        self.assertIn(oldest.pk, delta['removed'])
+
+    def test_incidents_aging_out_of_window_are_removed(self):
+        """Test that an incident older than the window since the last poll is removed without a change."""
+        incident = Incident.objects.create(incident_type="Fire", severity="high", camera=self.camera)
+        Incident.objects.filter(pk=incident.pk).update(timestamp=timezone.now() - timedelta(minutes=70))
+        self.cursor = ChangeLog.cursor()
+
+        polled = (timezone.now() - timedelta(minutes=20)).isoformat()
+        delta = self.changes('incident', window='1h', polled=polled)
+        self.assertEqual(delta['removed'], [incident.pk])
+        self.assertEqual(self.changes('incident', window='24h', polled=polled)['removed'], [])
+        self.assertEqual(self.changes('incident', window='1h', polled=delta['time'])['removed'], [])
+
+    def test_cursor_waits_at_recent_gap(self):
+        """Test that the cursor stops before an id that may still commit, and passes it once it has settled."""
+        with self.committed():
+            incidents = [Incident.objects.create(incident_type="Fire", severity="high", camera=self.camera) for _ in range(3)]
+        # The middle id is still in flight in another transaction
+        ChangeLog.objects.filter(object_id=incidents[1].pk).delete()
+        delta = self.changes('incident')
+        self.assertEqual([c['key'] for c in delta['changed']], [incidents[0].pk])
+        self.assertEqual(ChangeLog.cursor(), delta['cursor'])
+
+        # Past the grace period the gap is a rolled-back write
+        ChangeLog.objects.update(timestamp=timezone.now() - timedelta(seconds=settings.CHANGE_LOG_GAP_GRACE + 1))
+        self.cursor = delta['cursor']
+        self.assertEqual([c['key'] for c in self.changes('incident')['changed']], [incidents[2].pk])
+
+    def test_cursor_start_and_reset(self):
+        """Test the first poll without a cursor, pruned cursors and unknown layers."""
+        with self.committed():
+            Incident.objects.create(incident_type="Fire", severity="high", camera=self.camera)
+        start = self.client.get(reverse('api_changes', args=['incident'])).json()
+        self.assertEqual((start['cursor'], start['changed'], start['reset']), (ChangeLog.cursor(), [], False))
+
+        with self.committed():
+            Incident.objects.create(incident_type="Fire", severity="high", camera=self.camera)
+        ChangeLog.objects.filter(change_id__lt=ChangeLog.cursor()).delete()
+        self.assertTrue(self.changes('incident')['reset'])
+        self.assertEqual(self.client.get(reverse('api_changes', args=['bogus'])).status_code, 404)
+
+    def test_maps_poll_with_their_filters(self):
+        """Test that the maps embed the delta URL with their own parameters and the cursor they were drawn at."""
+        with self.committed():
+            Incident.objects.create(incident_type="Fire", severity="high", camera=self.camera)
+        map_html = self.client.get(reverse('incident_map'), {'severity': 'high'}).context['map_html']
+        self.assertIn("/geomap/api/changes/incident/?severity=high", map_html)
+        self.assertIn(f"&quot;cursor&quot;:{ChangeLog.cursor()}", map_html)
+        # Empty maps still poll, so the first reading appears without a reload
+        self.assertIn("/geomap/api/changes/weather/", self.client.get(reverse('weather_map')).context['map_html'])
+
+
+@override_settings(CACHES=NO_MAP_CACHE, ROAD_SEGMENT_LENGTH=1000, ROAD_SNAP_DISTANCE=150,
+                   ROAD_SIMPLIFY_TOLERANCES={0: 150, 12: 40, 14: 8})
+class RoadSegmentTests(TestCase):
+    """Tests for building road segments, snapping cameras and the segment risk layer."""
+
+    def setUp(self):
+        self.client = Client()
+        get_user_model().objects.create_user(username="roaduser", password="testpass")
+        self.client.login(username="roaduser", password="testpass")
+        # A 3.3 km road along 1.30N with a 30 m wiggle every few hundred metres, split over two edges
+        points = [(103.80 + i * 0.001, 1.30 + (0.0003 if i % 3 == 1 else 0)) for i in range(31)]
+        self.roads = {"Test Expressway": [LineString(points[:16]), LineString(points[15:])]}
+        self.near = Camera.objects.create(
+            camera_id=1, camera_name="NEAR", location="1.3005,103.805",
+            road_name="Test Expressway", feed_url="https://example.com/near"
+        )
+        self.far = Camera.objects.create(
+            camera_id=2, camera_name="FAR", location="1.3100,103.805",
+            road_name="Elsewhere", feed_url="https://example.com/far"
+        )
+
+    def test_split_line(self):
+        """Test that lines are cut into stretches of about the requested length."""
+        pieces = split_line(to_metres(LineString([(103.80, 1.30), (103.83, 1.30)])), 1000)
+        self.assertEqual(len(pieces), 3)
+        self.assertAlmostEqual(pieces[0].length, pieces[2].length)
+
+    def test_build_segments(self):
+        """Test that edges are merged, cut in order and simplified more for lower zooms."""
+        segments = build_segments(self.roads)
+        self.assertEqual([s.sequence for s in segments], [0, 1, 2])
+        self.assertAlmostEqual(sum(s.length_m for s in segments), to_metres(LineString(
+            [c for line in self.roads["Test Expressway"] for c in line.coords]
+        )).length, delta=1)
+        coarse, fine = segments[0].polylines["z0"], segments[0].polylines["z14"]
+        self.assertLess(len(coarse), len(fine))
+        self.assertEqual(coarse[0], fine[0])
+        self.assertEqual((segment_tier(10), segment_tier(13), segment_tier(18)), (0, 12, 14))
+
+    def test_snap_cameras(self):
+        """Test that cameras snap to the nearest segment within the snap distance only."""
+        self.assertEqual(replace_segments(build_segments(self.roads)), 1)
+        self.near.refresh_from_db()
+        self.far.refresh_from_db()
+        self.assertEqual(self.near.road_segment.sequence, 0)
+        self.assertLess(self.near.snap_distance_m, 100)
+        self.assertIsNone(self.far.road_segment)
+
+        # Rebuilding replaces the segments and re-snaps
+        replace_segments(build_segments(self.roads))
+        self.near.refresh_from_db()
+        self.assertEqual(RoadSegment.objects.count(), 3)
+        self.assertIsNotNone(self.near.road_segment)
+
+    def test_segment_layer(self):
+        """Test the segment GeoJSON: bbox filter, zoom tier and aggregated camera scores."""
+        replace_segments(build_segments(self.roads))
+        AccidentProbabilityScore.objects.create(area_geometry="POINT(1.3 103.8)", accident_prob_score=0.2, camera=self.near)
+        AccidentProbabilityScore.objects.create(area_geometry="POINT(1.3 103.8)", accident_prob_score=0.9, camera=self.near)
+
+        url = reverse('api_segments')
+        features = self.client.get(url, {'bbox': '103.80,1.29,103.81,1.31', 'zoom': 15}).json()['features']
+        self.assertEqual(len(features), 2)
+        hot = next(f for f in features if f['properties']['cameras'])
+        self.assertEqual(hot['geometry']['type'], "LineString")
+        self.assertEqual((hot['properties']['peak'], hot['properties']['level']), (0.9, "high"))
+        self.assertIsNone(next(f for f in features if not f['properties']['cameras'])['properties']['level'])
+
+        segment = RoadSegment.objects.get(pk=hot['properties']['id'])
+        self.assertEqual(hot['geometry']['coordinates'], [[lng, lat] for lat, lng in segment.polylines["z14"]])
+        zoomed_out = self.client.get(url, {'bbox': '103.80,1.29,103.81,1.31', 'zoom': 10}).json()['features']
+        self.assertEqual(
+            next(f for f in zoomed_out if f['properties']['id'] == segment.pk)['geometry']['coordinates'],
+            [[lng, lat] for lat, lng in segment.polylines["z0"]]
+        )
+        self.assertEqual(len(self.client.get(url).json()['features']), 3)
+
+
+@override_settings(CACHES={
+    "default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"},
+    "geomap": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache", "LOCATION": "nearest-tests"},
+})
+class NearestCameraTests(TestCase):
+    """Tests for the KD-tree nearest-camera lookup and its endpoint."""
+
+    def setUp(self):
+        map_cache().clear()
+        self.client = Client()
+        get_user_model().objects.create_user(username="nearuser", password="testpass")
+        self.client.login(username="nearuser", password="testpass")
+        # The index is per process; drop one built from another test's cameras
+        invalidate_camera_index()
+        # Cameras 0, 110.6 m, 221 m and 1.1 km north of a point
+        for i, offset in enumerate([0, 0.001, 0.002, 0.01], 1):
+            Camera.objects.create(
+                camera_id=i, camera_name=f"CAM-{i}", location=f"{1.30 + offset},103.85",
+                road_name="Test Road", feed_url=f"https://example.com/{i}"
+            )
+
+    def test_matches_brute_force(self):
+        """Test that the k nearest and radius queries agree with a full scan."""
+        rng = np.random.default_rng(0)
+        rows = [(i, f"CAM-{i}", "Road", lat, lng) for i, (lat, lng) in
+                enumerate(zip(rng.uniform(1.25, 1.45, 2000), rng.uniform(103.65, 104.0, 2000)))]
+        index = CameraIndex(rows)
+        lat, lng = 1.35, 103.82
+        distances = np.hypot(*(local_metres([r[3] for r in rows], [r[4] for r in rows]) - local_metres([lat], [lng])[0]).T)
+        order = np.argsort(distances)
+
+        nearest = index.nearest(lat, lng, k=10)
+        self.assertEqual([row[0] for row, _ in nearest], list(order[:10]))
+        self.assertAlmostEqual(nearest[0][1], distances[order[0]])
+        within = index.nearest(lat, lng, radius=2000)
+        self.assertEqual([row[0] for row, _ in within], list(order[:(distances <= 2000).sum()]))
+        self.assertEqual(len(index.nearest(lat, lng, k=10, radius=1)), 0)
+
+    def test_k_and_radius(self):
+        """Test the k nearest, radius and combined queries with distances in metres."""
+        found = nearest_cameras(1.30, 103.85, k=2)
+        self.assertEqual([row[0] for row, _ in found], [1, 2])
+        self.assertAlmostEqual(found[1][1], 110.6, delta=0.1)
+        self.assertEqual([row[0] for row, _ in nearest_cameras(1.30, 103.85, radius=500)], [1, 2, 3])
+        self.assertEqual([row[0] for row, _ in nearest_cameras(1.30, 103.85, k=10, radius=150)], [1, 2])
+
+    def test_needs_k_or_radius(self):
+        """Test that a query without k or radius, or with invalid ones, is a ValueError even with no cameras."""
+        for kwargs in ({}, {'k': 0}, {'radius': -1}):
+            with self.assertRaises(ValueError):
+                nearest_cameras(1.30, 103.85, **kwargs)
+            with self.assertRaises(ValueError):
+                CameraIndex([]).nearest(1.30, 103.85, **kwargs)
+
+    def test_rebuilt_when_cameras_change(self):
+        """Test that the in-memory index is reused until a camera is saved."""
+        first = camera_index()
+        self.assertIs(camera_index(), first)
+        with self.captureOnCommitCallbacks(execute=True):
+            Camera.objects.create(
+                camera_id=5, camera_name="CAM-5", location="1.2995,103.85",
+                road_name="Test Road", feed_url="https://example.com/5"
+            )
+        self.assertIsNot(camera_index(), first)
+        self.assertEqual(nearest_cameras(1.2995, 103.85, k=1)[0][0][0], 5)
+
+    def test_version_checked_at_most_every_interval(self):
+        """Test that queries don't read the file cache each time, and other workers' saves are seen after the interval."""
+        first = camera_index()
+        with patch('geomap.nearest.data_version', wraps=data_version) as version:
+            for _ in range(3):
+                nearest_cameras(1.30, 103.85, k=1)
+            self.assertEqual(version.call_count, 0)
+            # Another worker saved a camera: only its version bump reaches this process
+            bump_version(Camera)
+            self.assertIs(camera_index(), first)
+            with self.settings(NEAREST_CAMERAS_VERSION_CHECK=0):
+                self.assertIsNot(camera_index(), first)
+
+    def test_endpoint(self):
+        """Test the nearest-camera GeoJSON and its parameter checks."""
+        url = reverse('api_nearest')
+        features = self.client.get(url, {'lat': 1.30, 'lng': 103.85, 'k': 2}).json()['features']
+        self.assertEqual([f['properties']['id'] for f in features], [1, 2])
+        self.assertEqual(features[0]['geometry']['coordinates'], [103.85, 1.30])
+        self.assertEqual(features[1]['properties']['distance'], 110.6)
+        self.assertEqual(len(self.client.get(url, {'lat': 1.30, 'lng': 103.85, 'radius': 500}).json()['features']), 3)
+        with self.settings(NEAREST_CAMERAS_DEFAULT_K=3):
+            self.assertEqual(len(self.client.get(url, {'lat': 1.30, 'lng': 103.85}).json()['features']), 3)
+        for params in ({}, {'lat': 'x', 'lng': 103.85}, {'lat': 1.3, 'lng': 103.85, 'k': 0}, {'lat': 91, 'lng': 0}):
+            self.assertEqual(self.client.get(url, params).status_code, 400)
+
+
+@override_settings(CACHES=NO_MAP_CACHE)
+class HexbinTests(TestCase):
+    """Tests for hex-bin aggregation and the density endpoint."""
+
+    def setUp(self):
+        self.client = Client()
+        get_user_model().objects.create_user(username="hexuser", password="testpass")
+        self.client.login(username="hexuser", password="testpass")
+        self.camera_a = Camera.objects.create(
+            camera_id=1, camera_name="CAM-A", location="1.3000,103.8000",
+            road_name="Test Road", feed_url="https://example.com/a"
+        )
+        self.camera_b = Camera.objects.create(
+            camera_id=2, camera_name="CAM-B", location="1.3500,103.9000",
+            road_name="Test Road", feed_url="https://example.com/b"
+        )
+
+    def test_points_fall_in_nearest_hexagon(self):
+        """Test that cube rounding picks the hexagon whose centre is nearest each point."""
+        rng = np.random.default_rng(0)
+        x, y = rng.uniform(0, 5000, 5000), rng.uniform(0, 5000, 5000)
+        q, r = hex_cells(x, y, 100)
+        cx, cy = hex_center(q, r, 100)
+        distance = np.hypot(x - cx, y - cy)
+        for dq, dr in [(1, 0), (-1, 0), (0, 1), (0, -1), (1, -1), (-1, 1)]:
+            nx, ny = hex_center(q + dq, r + dr, 100)
+            self.assertTrue((distance <= np.hypot(x - nx, y - ny) + 1e-9).all())
+
+    def test_count_mean_max(self):
+        """Test the per-cell aggregates."""
+        q, r, counts, means, peaks = hexbin([1.30, 1.30001, 1.35], [103.80, 103.80001, 103.90], [0.2, 0.6, 0.9], 500)
+        cells = sorted(zip(counts.tolist(), means.round(6).tolist(), peaks.tolist()))
+        self.assertEqual(cells, [(1, 0.9, 0.9), (2, 0.4, 0.6)])
+        self.assertEqual(len(hexbin([], [], [], 500)[0]), 0)
+
+    def test_endpoint(self):
+        """Test the GeoJSON cells for scores and incidents, the time window and resolution."""
+        AccidentProbabilityScore.objects.create(area_geometry="POINT(1.3 103.8)", accident_prob_score=0.2, camera=self.camera_a)
+        AccidentProbabilityScore.objects.create(area_geometry="POINT(1.3 103.8)", accident_prob_score=0.8, camera=self.camera_a)
+        AccidentProbabilityScore.objects.create(area_geometry="POINT(1.35 103.9)", accident_prob_score=0.5, camera=self.camera_b)
+        Incident.objects.create(incident_type="Fire", severity="high", camera=self.camera_a)
+        old = Incident.objects.create(incident_type="Fire", severity="low", camera=self.camera_b)
+        Incident.objects.filter(pk=old.pk).update(timestamp=timezone.now() - timedelta(days=3))
+
+        data = self.client.get(reverse('api_hexbin', args=['scores']), {'resolution': 1000}).json()
+        self.assertEqual(data['resolution'], 1000)
+        cells = sorted((f['properties']['count'], f['properties']['mean'], f['properties']['max']) for f in data['features'])
+        self.assertEqual(cells, [(1, 0.5, 0.5), (2, 0.5, 0.8)])
+        ring = data['features'][0]['geometry']['coordinates'][0]
+        self.assertEqual((len(ring), ring[0]), (7, ring[-1]))
+
+        incidents = self.client.get(reverse('api_hexbin', args=['incidents'])).json()
+        self.assertEqual([f['properties']['max'] for f in incidents['features']], [3.0])
+        self.assertEqual(incidents['resolution'], settings.HEXBIN_DEFAULT_SIZE)
+        weekly = self.client.get(reverse('api_hexbin', args=['incidents']), {'window': '7d'}).json()
+        self.assertEqual(len(weekly['features']), 2)
+        self.assertEqual(self.client.get(reverse('api_hexbin', args=['bogus'])).status_code, 404)
+
+    @override_settings(CACHES={
+        "default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"},
+        "geomap": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache", "LOCATION": "geomap-hexbin-tests"},
+    })
+    def test_cached_until_data_changes(self):
+        """Test that cells are cached per window and resolution and rebuilt after a write."""
+        Incident.objects.create(incident_type="Fire", severity="high", camera=self.camera_a)
+        url = reverse('api_hexbin', args=['incidents'])
+        self.client.get(url)
+        # Only the session and user lookups
+        with self.assertNumQueries(2):
+            self.client.get(url)
+        with self.captureOnCommitCallbacks(execute=True):
+            Incident.objects.create(incident_type="Fire", severity="low", camera=self.camera_b)
+        self.assertEqual(len(self.client.get(url).json()['features']), 2)
+
+
+@override_settings(CACHES=NO_MAP_CACHE, WEATHER_GRID_STEP=0.01)
+class WeatherGridTests(TestCase):
+    """Tests for the interpolated weather overlays."""
+
+    def setUp(self):
+        self.grid_dir = tempfile.mkdtemp()
+        self.override = override_settings(WEATHER_GRID_DIR=self.grid_dir)
+        self.override.enable()
+        self.client = Client()
+        get_user_model().objects.create_user(username="griduser", password="testpass")
+        self.client.login(username="griduser", password="testpass")
+        self.east = Camera.objects.create(
+            camera_id=1, camera_name="EAST-CAM", location="1.3099,103.9053",
+            road_name="Test Road A", feed_url="https://example.com/east"
+        )
+        self.west = Camera.objects.create(
+            camera_id=2, camera_name="WEST-CAM", location="1.3329,103.7436",
+            road_name="Test Road B", feed_url="https://example.com/west"
+        )
+
+    def tearDown(self):
+        self.override.disable()
+        shutil.rmtree(self.grid_dir, ignore_errors=True)
+
+    def test_idw(self):
+        """Test that IDW reproduces readings at their position and blends between them."""
+        points = np.array([[0.0, 0.0], [1000.0, 0.0]])
+        values, nearest = idw(points, np.array([20.0, 30.0]), np.array([[0.0, 0.0], [500.0, 0.0], [250.0, 0.0]]), 2, 8)
+        self.assertAlmostEqual(values[0], 20.0)
+        self.assertAlmostEqual(values[1], 25.0)
+        self.assertAlmostEqual(values[2], 21.0)
+        self.assertEqual(nearest.tolist(), [0.0, 500.0, 250.0])
+        self.assertEqual((rain_likelihood("Thunderstorm"), rain_likelihood("Sunny")), (1.0, 0.0))
+
+    def test_redrawn_only_for_new_readings(self):
+        """Test that overlays are written, skipped while readings are unchanged and redrawn after one."""
+        Weather.objects.create(temperature=33.0, conditions="Sunny", camera=self.east)
+        Weather.objects.create(temperature=25.0, conditions="Heavy Rain", camera=self.west)
+        grid = WeatherGrid()
+        self.assertTrue(grid.run())
+        fingerprint = load_manifest()["fingerprint"]
+        self.assertFalse(grid.run())
+
+        rain = cv2.imread(overlay_path("rain"), cv2.IMREAD_UNCHANGED)
+        temperature = cv2.imread(overlay_path("temperature"), cv2.IMREAD_UNCHANGED)
+        lat, lng = grid.cells()
+        self.assertEqual(rain.shape, lat.shape + (4,))
+
+        def cell(lat_, lng_):
+            return np.unravel_index(np.argmin(np.abs(lat - lat_) + np.abs(lng - lng_)), lat.shape)
+        east, west = cell(1.3099, 103.9053), cell(1.3329, 103.7436)
+        # Rain near the west camera only; red (hot) in the east, blue (cool) in the west
+        self.assertGreater(rain[west][3], 150)
+        self.assertLess(rain[east][3], 50)
+        self.assertGreater(temperature[east][2], temperature[east][0])
+        self.assertGreater(temperature[west][0], temperature[west][2])
+        # Cells far out at sea fade out
+        self.assertEqual(rain[0, 0][3], 0)
+
+        Weather.objects.create(temperature=26.0, conditions="Thunderstorm", camera=self.east)
+        self.assertTrue(grid.run())
+        self.assertNotEqual(load_manifest()["fingerprint"], fingerprint)
+
+    def test_weather_map_overlays(self):
+        """Test that the weather map links the overlays once drawn and that they are served."""
+        Weather.objects.create(temperature=30.0, conditions="Rain", camera=self.east)
+        self.assertNotIn("/geomap/overlays/weather/", self.client.get(reverse('weather_map')).context['map_html'])
+        self.assertEqual(self.client.get(reverse('weather_overlay', args=['rain'])).status_code, 404)
+
+        WeatherGrid().run()
+        response = self.client.get(reverse('weather_map'))
+        self.assertIn(f"/geomap/overlays/weather/rain.png?v={load_manifest()['fingerprint']}", response.context['map_html'])
+        self.assertTrue(response.context['weather_grid'])
+
+        overlay = self.client.get(reverse('weather_overlay', args=['temperature']))
+        self.assertEqual(overlay["Content-Type"], "image/png")
+        self.assertEqual(self.client.get(reverse('weather_overlay', args=['temperature']), HTTP_IF_NONE_MATCH=overlay["ETag"]).status_code, 304)
+        self.assertEqual(self.client.get(reverse('weather_overlay', args=['wind'])).status_code, 404)
+
+
+@override_settings(CACHES=NO_MAP_CACHE, ROUTE_BUFFER=200)
+class RouteRiskTests(TestCase):
+    """Tests for shortest routes on the road graph and the risk of cameras along them."""
+
+    def setUp(self):
+        self.client = Client()
+        get_user_model().objects.create_user(username="routeuser", password="testpass")
+        self.client.login(username="routeuser", password="testpass")
+        # A 3 x 3 grid of junctions 0.005 degrees (about 550 m) apart, two-way except
+        # the one-way 1 -> 0; the middle road (3-4-5) has a curve stored as geometry
+        lat = [1.30 + 0.005 * (i // 3) for i in range(9)]
+        lng = [103.80 + 0.005 * (i % 3) for i in range(9)]
+        edges = []
+        for a, b in [(0, 1), (1, 2), (3, 4), (4, 5), (6, 7), (7, 8), (0, 3), (3, 6), (1, 4), (4, 7), (2, 5), (5, 8)]:
+            edges.append((b, a, 556.0, None))
+            if (a, b) not in [(0, 1), (3, 4)]:
+                edges.append((a, b, 556.0, None))
+        edges.append((3, 4, 600.0, [(103.80, 1.305), (103.8025, 1.3055), (103.805, 1.305)]))
+        edges.append((3, 4, 900.0, None))  # a longer parallel edge is ignored
+        self.graph = RouteGraph(lat, lng, edges)
+        routes._graph = self.graph
+        invalidate_camera_index()
+
+        self.on_route = Camera.objects.create(
+            camera_id=1, camera_name="ON-ROUTE", location="1.3051,103.8030",
+            road_name="Middle Road", feed_url="https://example.com/on"
+        )
+        self.off_route = Camera.objects.create(
+            camera_id=2, camera_name="OFF-ROUTE", location="1.3100,103.8100",
+            road_name="Far Road", feed_url="https://example.com/off"
+        )
+        self.unscored = Camera.objects.create(
+            camera_id=3, camera_name="UNSCORED", location="1.3050,103.8090",
+            road_name="Middle Road", feed_url="https://example.com/unscored"
+        )
+        AccidentProbabilityScore.objects.create(area_geometry="POINT(1.3051 103.803)", accident_prob_score=0.6, camera=self.on_route)
+        AccidentProbabilityScore.objects.create(area_geometry="POINT(1.31 103.81)", accident_prob_score=0.9, camera=self.off_route)
+
+    def tearDown(self):
+        routes._graph = None
+
+    def test_shortest_route(self):
+        """Test that routes follow edge direction, prefer the shortest edge and use its geometry."""
+        path, length = self.graph.route((1.305, 103.80), (1.305, 103.81))
+        self.assertEqual(length, 600.0 + 556.0)
+        self.assertEqual(path.coords[1], (103.8025, 1.3055))
+        # 1 -> 0 is one-way, so 0 -> 1 detours through the middle road
+        self.assertEqual(self.graph.route((1.30, 103.805), (1.30, 103.80))[1], 556.0)
+        self.assertEqual(self.graph.route((1.30, 103.80), (1.30, 103.805))[1], 556.0 + 600.0 + 556.0)
+
+    def test_cameras_along(self):
+        """Test that only cameras within the buffer of the path are found, nearest first."""
+        path, _ = self.graph.route((1.305, 103.80), (1.305, 103.81))
+        self.assertEqual([row[0] for row, _ in cameras_along(path, 200)], [3, 1])
+        self.assertEqual([row[0] for row, _ in cameras_along(path, 20)], [3])
+
+    def test_endpoint(self):
+        """Test the route GeoJSON with summed and peak risk and the parameter checks."""
+        url = reverse('api_route')
+        data = self.client.get(url, {'origin': '1.305,103.80', 'destination': '1.305,103.81'}).json()
+        self.assertEqual(data['geometry']['type'], "LineString")
+        self.assertEqual(data['properties']['length'], 1156)
+        self.assertEqual((data['properties']['risk_sum'], data['properties']['risk_max']), (0.6, 0.6))
+        self.assertEqual([(c['id'], c['score']) for c in data['properties']['cameras']], [(3, None), (1, 0.6)])
+
+        wide = self.client.get(url, {'origin': '1.305,103.80', 'destination': '1.305,103.81', 'buffer': 1000}).json()
+        self.assertEqual((wide['properties']['risk_sum'], wide['properties']['risk_max']), (1.5, 0.9))
+
+        for params in ({}, {'origin': '1.3', 'destination': '1.305,103.81'},
+                       {'origin': '1.305,103.80', 'destination': '1.305,103.81', 'buffer': -1}):
+            self.assertEqual(self.client.get(url, params).status_code, 400)
+        # Far from any junction
+        self.assertEqual(self.client.get(url, {'origin': '1.40,103.90', 'destination': '1.305,103.81'}).status_code, 400)
+
+    def test_graph_not_downloaded(self):
+        """Test that requests never download the graph themselves."""
+        routes._graph = None
+        with self.settings(OSM_GRAPH_PATH=os.path.join(tempfile.gettempdir(), "missing", "graph.graphml")):
+            response = self.client.get(reverse('api_route'), {'origin': '1.305,103.80', 'destination': '1.305,103.81'})
+        self.assertEqual(response.status_code, 503)
+
+
+@override_settings(CACHES=NO_MAP_CACHE, PLAYBACK_HISTORY_DAYS=2, PLAYBACK_BUCKET_MINUTES=60)
+class RiskPlaybackTests(TestCase):
+    """Tests for the bucketed risk history behind the playback slider."""
+
+    def setUp(self):
+        self.playback_dir = tempfile.mkdtemp()
+        self.override = override_settings(PLAYBACK_DIR=self.playback_dir)
+        self.override.enable()
+        self.client = Client()
+        get_user_model().objects.create_user(username="playbackuser", password="testpass")
+        self.client.login(username="playbackuser", password="testpass")
+        self.now = datetime(2026, 10, 19, 12, 0, tzinfo=dt_timezone.utc)
+        self.east = Camera.objects.create(
+            camera_id=1, camera_name="EAST-CAM", location="1.3099,103.9053",
+            road_name="Test Road A", feed_url="https://example.com/east"
+        )
+        self.west = Camera.objects.create(
+            camera_id=2, camera_name="WEST-CAM", location="1.3329,103.7436",
+            road_name="Test Road B", feed_url="https://example.com/west"
+        )
+        # East: a score from before the window, then readings in the 24h window's first and sixth hours
+        self.score(self.east, 0.5, hours_ago=50)
+        self.score(self.east, 0.2, hours_ago=23.5)
+        self.score(self.east, 0.9, hours_ago=18.5)
+        self.score(self.east, 0.1, hours_ago=18.2)
+        # West: first scored two and a half hours ago
+        self.score(self.west, 1.0, hours_ago=2.5)
+
+    def tearDown(self):
+        self.override.disable()
+        shutil.rmtree(self.playback_dir, ignore_errors=True)
+
+    def score(self, camera, value, hours_ago):
+        score = AccidentProbabilityScore.objects.create(
+            area_geometry=f"POINT({camera.latitude} {camera.longitude})", accident_prob_score=value, camera=camera
+        )
+        # timestamp is auto_now_add, so it is moved back with an update
+        AccidentProbabilityScore.objects.filter(pk=score.pk).update(timestamp=self.now - timedelta(hours=hours_ago))
+
+    def test_bucket_scores(self):
+        """Test that the last reading of a bucket wins and scores carry forward into empty buckets."""
+        grid = bucket_scores(
+            np.array([0, 0, 0, 0]), np.array([-1, 2, 2, 3]), np.array([0.5, 0.9, 0.3, 0.6]), n_cameras=2, n_buckets=4
+        )
+        np.testing.assert_array_equal(grid[0], [0.5, 0.5, 0.3, 0.6])
+        self.assertTrue(np.isnan(grid[1]).all())
+
+    def test_build_rollup(self):
+        """Test that each bucket holds the camera's latest score by its end, seeded from before the window."""
+        rollup = build_rollup(self.now)
+        self.assertEqual(rollup["camera_ids"].tolist(), [1, 2])
+        self.assertEqual(rollup["scores"].shape, (48, 2))
+        self.assertEqual(int(rollup["start"]), int(self.now.timestamp()) - 48 * 3600)
+
+        east, west = rollup["scores"][:, 0], rollup["scores"][:, 1]
+        self.assertEqual(east[:24].tolist(), [127] * 24)
+        self.assertEqual(east[24:29].tolist(), [51] * 5)
+        self.assertEqual(east[29:].tolist(), [25] * 19)
+        self.assertEqual(west[:45].tolist(), [NO_SCORE] * 45)
+        self.assertEqual(west[45:].tolist(), [254] * 3)
+
+    def test_playback_data(self):
+        """Test that the endpoint serves the newest buckets of the window and revalidates by ETag."""
+        url = reverse('api_risk_playback')
+        self.assertEqual(self.client.get(url).status_code, 404)
+
+        self.assertEqual(run_rollup(self.now), (2, 48))
+        response = self.client.get(url, {'window': '24h'})
+        self.assertEqual(response.status_code, 200)
+        data = response.json()
+        self.assertEqual(data["buckets"], 24)
+        self.assertEqual(data["start"], int(self.now.timestamp()) - 24 * 3600)
+        self.assertEqual(data["cameras"]["id"], [1, 2])
+        frames = np.frombuffer(base64.b64decode(data["scores"]), dtype=np.uint8).reshape(24, 2)
+        np.testing.assert_array_equal(frames, load_rollup()["scores"][24:])
+        self.assertEqual(frames[0].tolist(), [51, NO_SCORE])
+
+        # The rollup is shorter than a week, so 7d replays all of it
+        self.assertEqual(self.client.get(url, {'window': '7d'}).json()["buckets"], 48)
+
+        cached = self.client.get(url, {'window': '24h'}, HTTP_IF_NONE_MATCH=response["ETag"])
+        self.assertEqual(cached.status_code, 304)
+
+    def test_playback_page(self):
+        """Test that the page asks for a rollup until one exists, then offers the slider."""
+        response = self.client.get(reverse('risk_playback'))
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, "rollup_risk_playback")
+        self.assertNotContains(response, 'id="playback-slider"')
+
+        call_command('rollup_risk_playback', stdout=open(os.devnull, 'w'))
+        response = self.client.get(reverse('risk_playback'), {'window': '7d'})
+        self.assertContains(response, 'id="playback-slider"')
+        self.assertContains(response, 'value="7d" selected')
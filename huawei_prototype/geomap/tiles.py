@@ -0,0 +1,199 @@
+import os
+import json
+import hashlib
+import logging
+import numpy as np
+import cv2
+from django.conf import settings
+from django.db.models import OuterRef, Subquery
+from dashboard.models import Camera, AccidentProbabilityScore
+from geomap.clusters import mercator
+from geomap.cache import bump_version
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+TILE_SIZE = 256
+
+# Same gradient as the HeatMap layer on the probability map
+HEAT_GRADIENT = {'0.1': 'green', '0.5': 'yellow', '0.7': 'orange', '1.0': 'red'}
+COLOUR_RGB = {'green': (0, 128, 0), 'yellow': (255, 255, 0), 'orange': (255, 165, 0), 'red': (255, 0, 0)}
+
+MANIFEST = "manifest.json"
+
+# Data version of the tile set on disk (see geomap.cache), for maps that draw it
+RISK_TILES = "risk_tiles"
+
+
+def gradient_palette():
+    """256 RGB entries interpolated between the gradient stops, like leaflet.heat's canvas gradient."""
+    stops = sorted((float(k), COLOUR_RGB[v]) for k, v in HEAT_GRADIENT.items())
+    positions = [p for p, _ in stops]
+    levels = np.linspace(0, 1, 256)
+    return np.stack(
+        [np.interp(levels, positions, [c[i] for _, c in stops]) for i in range(3)], axis=1
+    ).astype(np.uint8)
+
+
+def tile_path(z, x, y):
+    return os.path.join(settings.RISK_TILE_DIR, str(z), str(x), f"{y}.png")
+
+
+def tiles_ready():
+    """Whether render_risk_tiles has produced a tile set to serve."""
+    return os.path.exists(os.path.join(settings.RISK_TILE_DIR, MANIFEST))
+
+
+def current_points():
+    """Latest risk score per camera: {camera_id: (lat, lng, score)}."""
+    latest = AccidentProbabilityScore.objects.filter(camera=OuterRef('pk')).order_by('-timestamp')
+    rows = Camera.objects.exclude(latitude=None).annotate(
+        score=Subquery(latest.values('accident_prob_score')[:1])
+    ).exclude(score=None).values_list('camera_id', 'latitude', 'longitude', 'score')
+    return {str(camera_id): (lat, lng, score) for camera_id, lat, lng, score in rows}
+
+
+class TileRenderer:
+    """
+    Renders the accident probability heat surface into z/x/y PNG tiles.
+
+    Each point is drawn as a Gaussian spot of its score and spots are
+    composited as the browser's HeatMap does (alpha = 1 - prod(1 - a)), then
+    coloured through the same gradient. A manifest of the points drawn last
+    time lets later runs redraw only tiles within reach of a changed point.
+    """
+
+    def __init__(self, min_zoom=None, max_zoom=None, radius=None):
+        self.min_zoom = settings.RISK_TILE_MIN_ZOOM if min_zoom is None else min_zoom
+        self.max_zoom = settings.RISK_TILE_MAX_ZOOM if max_zoom is None else max_zoom
+        self.radius = settings.RISK_TILE_RADIUS if radius is None else radius
+        # Spots fade out over twice the radius, like HeatMap's radius + blur
+        self.reach = 2 * self.radius
+        self.sigma = self.radius / 1.5
+        self.palette = gradient_palette()
+
+    def style(self):
+        """Fingerprint of everything besides the points that changes the pixels."""
+        key = json.dumps([self.min_zoom, self.max_zoom, self.radius, HEAT_GRADIENT], sort_keys=True)
+        return hashlib.sha256(key.encode()).hexdigest()[:16]
+
+    def load_manifest(self):
+        try:
+            with open(os.path.join(settings.RISK_TILE_DIR, MANIFEST)) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def save_manifest(self, points, tiles):
+        os.makedirs(settings.RISK_TILE_DIR, exist_ok=True)
+        path = os.path.join(settings.RISK_TILE_DIR, MANIFEST)
+        with open(path + ".tmp", "w") as f:
+            json.dump({"style": self.style(), "points": points, "tiles": sorted(tiles)}, f)
+        os.replace(path + ".tmp", path)
+
+    def _pixels(self, points, zoom):
+        """Global pixel positions (x, y) and scores of points at a zoom level."""
+        if not points:
+            return np.zeros((0, 2)), np.zeros(0)
+        lat, lng, score = (np.array(v, dtype=np.float64) for v in zip(*points))
+        x, y = mercator(lat, lng)
+        world = TILE_SIZE * 2 ** zoom
+        return np.stack([x * world, y * world], axis=1), np.clip(score, 0, 1)
+
+    def _tiles_near(self, pixels):
+        """Tiles within reach of any of the pixel positions."""
+        tiles = set()
+        for px, py in pixels:
+            for tx in range(int((px - self.reach) // TILE_SIZE), int((px + self.reach) // TILE_SIZE) + 1):
+                for ty in range(int((py - self.reach) // TILE_SIZE), int((py + self.reach) // TILE_SIZE) + 1):
+                    tiles.add((tx, ty))
+        return tiles
+
+    def render_tile(self, tx, ty, pixels, scores):
+        """RGBA tile as PNG bytes, or None if nothing is drawn on it."""
+        r = self.reach
+        x0, y0 = tx * TILE_SIZE, ty * TILE_SIZE
+        near = (
+            (pixels[:, 0] > x0 - r) & (pixels[:, 0] < x0 + TILE_SIZE + r) &
+            (pixels[:, 1] > y0 - r) & (pixels[:, 1] < y0 + TILE_SIZE + r) & (scores > 0)
+        )
+        if not near.any():
+            return None
+
+        # Sum of log(1 - alpha) on a canvas padded so every spot fits whole
+        pad = 2 * r + 1
+        canvas = np.zeros((TILE_SIZE + 2 * pad, TILE_SIZE + 2 * pad), dtype=np.float64)
+        offsets = np.arange(-r, r + 1)
+        for (px, py), score in zip(pixels[near], scores[near]):
+            cx, cy = int(round(px - x0)), int(round(py - y0))
+            dx, dy = offsets + cx - (px - x0), offsets + cy - (py - y0)  # distances from the exact position
+            spot = score * np.exp(-(dy[:, None] ** 2 + dx[None, :] ** 2) / (2 * self.sigma ** 2))
+            canvas[cy + pad - r:cy + pad + r + 1, cx + pad - r:cx + pad + r + 1] += np.log1p(-np.minimum(spot, 0.999))
+
+        alpha = 1 - np.exp(canvas[pad:pad + TILE_SIZE, pad:pad + TILE_SIZE])
+        if alpha.max() < 1 / 255:
+            return None
+        level = np.clip((alpha * 255).astype(np.intp), 0, 255)
+        rgb = self.palette[level]
+        bgra = np.dstack([rgb[:, :, 2], rgb[:, :, 1], rgb[:, :, 0], level.astype(np.uint8)])
+        success, png = cv2.imencode(".png", bgra)
+        return png.tobytes() if success else None
+
+    def run(self, full=False):
+        """
+        Bring the tiles on disk up to date with the latest scores.
+        Returns (tiles written, tiles removed).
+        """
+        points = current_points()
+        manifest = self.load_manifest()
+        existing = {tuple(t) for t in manifest["tiles"]} if manifest else set()
+        if full or manifest is None or manifest.get("style") != self.style():
+            previous = {}
+            full = True
+        else:
+            previous = manifest["points"]
+
+        changed = [k for k in set(points) | set(previous) if tuple(points.get(k, ())) != tuple(previous.get(k, ()))]
+        if not full and not changed:
+            return 0, 0
+
+        written = removed = 0
+        tiles_now = set()
+        for z in range(self.min_zoom, self.max_zoom + 1):
+            pixels, scores = self._pixels(list(points.values()), z)
+
+            if full:
+                dirty = {(z, tx, ty) for tx, ty in self._tiles_near(pixels)}
+            else:
+                # Tiles around both the old and the new position of every changed point
+                moved = [points[k] for k in changed if k in points] + [previous[k] for k in changed if k in previous]
+                moved_pixels, _ = self._pixels(moved, z)
+                dirty = {(z, tx, ty) for tx, ty in self._tiles_near(moved_pixels)}
+            tiles_now |= {t for t in existing if t[0] == z} - dirty
+
+            for _, tx, ty in dirty:
+                png = self.render_tile(tx, ty, pixels, scores)
+                if png is None:
+                    continue
+                path = tile_path(z, tx, ty)
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                with open(path + ".tmp", "wb") as f:
+                    f.write(png)
+                os.replace(path + ".tmp", path)
+                written += 1
+                tiles_now.add((z, tx, ty))
+
+        # Tiles that no longer have anything on them, or belong to an old zoom range
+        for z, tx, ty in existing - tiles_now:
+            try:
+                os.remove(tile_path(z, tx, ty))
+                removed += 1
+            except FileNotFoundError:
+                pass
+
+        self.save_manifest(points, [list(t) for t in tiles_now])
+        if manifest is None or written or removed:
+            # Cached probability maps switch to the tile layer; score-keyed caches are left alone
+            bump_version(RISK_TILES)
+        logger.info(f"Risk tiles updated: {written} written, {removed} removed")
+        return written, removed
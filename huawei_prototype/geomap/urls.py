@@ -7,4 +7,20 @@ urlpatterns = [
     path("incident/", views.incident_map, name="incident_map"),
     path("probability/", views.probability_map, name="probability_map"),
     path("weather/", views.weather_map, name="weather_map"),
+    path("live/", views.live_map, name="live_map"),
+    path("playback/", views.risk_playback, name="risk_playback"),
+    path("api/cameras/", views.camera_layer, name="api_cameras"),
+    path("api/incidents/", views.incident_layer, name="api_incidents"),
+    path("api/probability/", views.probability_layer, name="api_probability"),
+    path("api/weather/", views.weather_layer, name="api_weather"),
+    path("api/segments/", views.segment_layer, name="api_segments"),
+    path("api/nearest/", views.nearest_layer, name="api_nearest"),
+    path("api/hexbin/<str:layer>/", views.hexbin_layer, name="api_hexbin"),
+    path("api/route/", views.route_layer, name="api_route"),
+    path("api/playback/risk/", views.risk_playback_data, name="api_risk_playback"),
+    path("api/clusters/<str:layer>/", views.cluster_layer, name="api_clusters"),
+    path("api/popup/<str:kind>/<int:pk>/", views.marker_popup, name="api_popup"),
+    path("api/changes/<str:layer>/", views.map_changes, name="api_changes"),
+    path("tiles/risk/<int:z>/<int:x>/<int:y>.png", views.risk_tile, name="risk_tile"),
+    path("overlays/weather/<str:name>.png", views.weather_overlay, name="weather_overlay"),
 ]
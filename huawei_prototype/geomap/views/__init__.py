@@ -2,4 +2,9 @@ from .map_home import map_home
 from .camera_map import camera_map
 from .incident_map import incident_map
 from .probability_map import probability_map
-from .weather_map import weather_map
\ No newline at end of file
+from .weather_map import weather_map
+from .live_map import live_map
+from .playback import risk_playback, risk_playback_data
+from .tiles import risk_tile, weather_overlay
+from .api import camera_layer, incident_layer, probability_layer, weather_layer, segment_layer, nearest_layer, hexbin_layer, route_layer, cluster_layer, marker_popup
+from .changes import map_changes
\ No newline at end of file
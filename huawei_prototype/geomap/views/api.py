@@ -0,0 +1,428 @@
+from django.http import JsonResponse, Http404
+from django.contrib.auth.decorators import login_required
+from django.views.decorators.cache import cache_control
+from django.urls import reverse
+from django.conf import settings
+from django.utils import timezone
+import logging
+import numpy as np
+from django.db.models import Case, When, Value, FloatField
+from dashboard.models import Camera, Incident, AccidentProbabilityScore, CameraState, ChangeLog, RoadSegment
+from geomap.spatial import parse_viewport, filter_viewport, DEFAULT_ZOOM
+from geomap.clusters import ClusterIndex
+from geomap.cache import cached_by_version
+from geomap.filters import parse_incident_filter, filter_incidents, latest_scores
+from geomap.roads import segment_tier, tier_key, segment_risk
+from geomap.nearest import nearest_cameras
+from geomap.hexbin import hexbin_features
+from geomap.routes import route_graph, route_risk
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+# Same thresholds as the folium probability map
+RISK_LEVELS = [(0.7, "high"), (0.4, "medium"), (0.0, "low")]
+
+
+def risk_level(score):
+    for threshold, level in RISK_LEVELS:
+        if score >= threshold:
+            return level
+    return "low"
+
+
+def feature_collection(rows, properties, **members):
+    """
+    GeoJSON FeatureCollection of points from value rows whose last two
+    columns are latitude and longitude; properties(row) gives the rest.
+    members are added to the top-level object.
+    """
+    features = [
+        {
+            "type": "Feature",
+            "geometry": {"type": "Point", "coordinates": [row[-1], row[-2]]},
+            "properties": properties(row),
+        }
+        for row in rows
+    ]
+    return JsonResponse({"type": "FeatureCollection", "features": features, **members})
+
+
+# values_list() columns and the GeoJSON properties built from them, shared with the clusters API
+CAMERA_FIELDS = ('camera_id', 'camera_name', 'road_name', 'latitude', 'longitude')
+INCIDENT_FIELDS = (
+    'incident_id', 'incident_type', 'severity', 'timestamp',
+    'camera__camera_name', 'camera__road_name', 'camera__latitude', 'camera__longitude'
+)
+
+
+def camera_properties(r):
+    return {"id": r[0], "name": r[1], "road": r[2]}
+
+
+def incident_properties(r):
+    return {
+        "id": r[0], "type": r[1], "severity": r[2], "timestamp": r[3].isoformat(),
+        "camera": r[4], "road": r[5],
+    }
+
+
+@login_required
+def camera_layer(request):
+    """GeoJSON of cameras inside the viewport."""
+    rows = filter_viewport(Camera.objects.exclude(latitude=None), parse_viewport(request)).values_list(*CAMERA_FIELDS)
+    return feature_collection(rows, camera_properties)
+
+
+@login_required
+def incident_layer(request):
+    """
+    GeoJSON of the newest incidents inside the viewport and time window
+    (see parse_incident_filter), placed at their camera. "more" is true when
+    INCIDENT_MAP_LIMIT cut the result short.
+    """
+    incidents = filter_incidents(
+        filter_viewport(Incident.objects.exclude(camera__latitude=None), parse_viewport(request), 'camera'),
+        parse_incident_filter(request),
+    )
+    limit = settings.INCIDENT_MAP_LIMIT
+    rows = list(incidents.order_by('-timestamp', '-pk').values_list(*INCIDENT_FIELDS)[:limit + 1])
+    return feature_collection(rows[:limit], incident_properties, more=len(rows) > limit)
+
+
+@login_required
+def probability_layer(request):
+    """
+    GeoJSON of the latest accident probability score of each camera inside
+    the viewport, optionally by ?type=<level> risk, as on the probability map.
+    """
+    scores = latest_scores(parse_viewport(request), request.GET.get('type', 'all'))
+    rows = scores.values_list(
+        'accident_prob_score_id', 'accident_prob_score', 'timestamp',
+        'camera__camera_name', 'camera__road_name', 'camera__latitude', 'camera__longitude'
+    )
+    return feature_collection(rows, lambda r: {
+        "id": r[0], "score": r[1], "level": risk_level(r[1]), "timestamp": r[2].isoformat(),
+        "camera": r[3], "road": r[4],
+    })
+
+
+@login_required
+def weather_layer(request):
+    """GeoJSON of the current weather reading of each camera inside the viewport."""
+    states = filter_viewport(CameraState.objects.exclude(weather_updated=None), parse_viewport(request), 'camera')
+    rows = states.values_list(
+        'camera_id', 'temperature', 'conditions', 'weather_updated',
+        'camera__camera_name', 'camera__road_name', 'camera__latitude', 'camera__longitude'
+    )
+    return feature_collection(rows, lambda r: {
+        "id": r[0], "temperature": r[1], "conditions": r[2], "timestamp": r[3].isoformat(),
+        "camera": r[4], "road": r[5],
+    })
+
+
+@login_required
+def segment_layer(request):
+    """
+    GeoJSON of the road segments crossing the viewport as LineStrings
+    simplified for ?zoom= (see geomap.roads), with the average and peak
+    current score of the cameras snapped to each. level follows the peak,
+    so one hot spot colours its stretch; it is null without scored cameras.
+    """
+    viewport = parse_viewport(request)
+    segments = RoadSegment.objects.all()
+    if viewport is not None:
+        segments = segments.filter(
+            min_lat__lte=viewport.north, max_lat__gte=viewport.south,
+            min_lng__lte=viewport.east, max_lng__gte=viewport.west,
+        )
+    zoom = viewport.zoom if viewport is not None else DEFAULT_ZOOM
+    rows = list(segments.values_list('pk', 'road_name', 'length_m', f'polylines__{tier_key(segment_tier(zoom))}'))
+    risk = segment_risk([r[0] for r in rows])
+
+    features = []
+    for pk, road_name, length_m, polyline in rows:
+        average, peak, cameras = risk.get(pk, (None, None, 0))
+        features.append({
+            "type": "Feature",
+            "geometry": {"type": "LineString", "coordinates": [[lng, lat] for lat, lng in polyline]},
+            "properties": {
+                "id": pk, "road": road_name, "length": round(length_m), "cameras": cameras,
+                "average": average, "peak": peak, "level": risk_level(peak) if peak is not None else None,
+            },
+        })
+    return JsonResponse({"type": "FeatureCollection", "features": features})
+
+
+@login_required
+def nearest_layer(request):
+    """
+    GeoJSON of the cameras nearest to ?lat=&lng=, nearest first with their
+    distance in metres: the ?k= nearest, those within ?radius= metres, or
+    the k nearest within the radius. k defaults to NEAREST_CAMERAS_DEFAULT_K
+    and is capped at NEAREST_CAMERAS_MAX_K.
+    """
+    try:
+        lat, lng = float(request.GET['lat']), float(request.GET['lng'])
+        k = int(request.GET['k']) if request.GET.get('k') else None
+        radius = float(request.GET['radius']) if request.GET.get('radius') else None
+    except (KeyError, ValueError):
+        return JsonResponse({"error": "lat and lng are required; k and radius must be numbers"}, status=400)
+    if not (-90 <= lat <= 90 and -180 <= lng <= 180) or (k is not None and k < 1) or (radius is not None and radius < 0):
+        return JsonResponse({"error": "lat/lng out of range or k/radius not positive"}, status=400)
+
+    if k is None and radius is None:
+        k = settings.NEAREST_CAMERAS_DEFAULT_K
+    if k is not None:
+        k = min(k, settings.NEAREST_CAMERAS_MAX_K)
+    found = nearest_cameras(lat, lng, k, radius)
+    return feature_collection(
+        [(distance,) + row for row, distance in found],
+        lambda r: dict(camera_properties(r[1:]), distance=round(r[0], 1)),
+    )
+
+
+# Incident severities as the value hex cells average and take the peak of
+SEVERITY_RANK = Case(
+    When(severity='low', then=Value(1.0)), When(severity='medium', then=Value(2.0)), When(severity='high', then=Value(3.0)),
+    default=Value(0.0), output_field=FloatField(),
+)
+
+
+def incident_points(incident_filter):
+    rows = filter_incidents(Incident.objects.exclude(camera__latitude=None), incident_filter).values_list(
+        'camera__latitude', 'camera__longitude', SEVERITY_RANK
+    )
+    return np.array(list(rows), dtype=np.float64).reshape(-1, 3)
+
+
+def score_points(incident_filter):
+    scores = AccidentProbabilityScore.objects.exclude(camera__latitude=None).filter(timestamp__gte=incident_filter.start)
+    if incident_filter.end is not None:
+        scores = scores.filter(timestamp__lt=incident_filter.end)
+    rows = scores.values_list('camera__latitude', 'camera__longitude', 'accident_prob_score')
+    return np.array(list(rows), dtype=np.float64).reshape(-1, 3)
+
+
+# Layer name -> (tables it is built from, (lat, lng, value) rows for a time filter)
+HEXBIN_LAYERS = {
+    "incidents": ([Incident, Camera], incident_points),
+    "scores": ([AccidentProbabilityScore, Camera], score_points),
+}
+
+
+@login_required
+def hexbin_layer(request, layer):
+    """
+    GeoJSON hexagons of ?resolution= metres (one of HEXBIN_SIZES) with the
+    count, mean and max value of the points in each: accident probability
+    scores, or incident severity ranks (1 low - 3 high). The time window is
+    read like the incident map's (see parse_incident_filter); results are
+    cached per window, filters and resolution until the data changes.
+    """
+    if layer not in HEXBIN_LAYERS:
+        raise Http404(f"Unknown layer {layer}")
+    try:
+        size = int(request.GET.get('resolution', settings.HEXBIN_DEFAULT_SIZE))
+    except ValueError:
+        size = settings.HEXBIN_DEFAULT_SIZE
+    if size not in settings.HEXBIN_SIZES:
+        size = settings.HEXBIN_DEFAULT_SIZE
+    incident_filter = parse_incident_filter(request)
+    models, points = HEXBIN_LAYERS[layer]
+
+    def build():
+        rows = points(incident_filter)
+        return hexbin_features(rows[:, 0], rows[:, 1], rows[:, 2], size)
+
+    features = cached_by_version(f"hexbin_{layer}", models, build, f"{size}|{incident_filter.query_string()}")
+    return JsonResponse({"type": "FeatureCollection", "features": features, "resolution": size})
+
+
+def parse_point(value):
+    """(lat, lng) from "lat,lng"; ValueError when it is not a valid coordinate."""
+    lat, lng = map(float, value.split(','))
+    if not (-90 <= lat <= 90 and -180 <= lng <= 180):
+        raise ValueError(value)
+    return lat, lng
+
+
+@login_required
+def route_layer(request):
+    """
+    Shortest drive from ?origin=lat,lng to ?destination=lat,lng as a GeoJSON
+    LineString, with the sum and max of the current accident probability
+    scores of the cameras within ?buffer= metres (ROUTE_BUFFER by default)
+    of it and those cameras, nearest the route first.
+    """
+    try:
+        origin = parse_point(request.GET['origin'])
+        destination = parse_point(request.GET['destination'])
+        buffer = float(request.GET.get('buffer') or settings.ROUTE_BUFFER)
+    except (KeyError, ValueError):
+        return JsonResponse({"error": "origin and destination must be lat,lng; buffer a number of metres"}, status=400)
+    if not 0 < buffer <= settings.ROUTE_MAX_BUFFER:
+        return JsonResponse({"error": f"buffer must be between 0 and {settings.ROUTE_MAX_BUFFER} metres"}, status=400)
+
+    graph = route_graph()
+    if graph is None:
+        return JsonResponse({"error": "The road network has not been downloaded yet"}, status=503)
+    for point in (origin, destination):
+        if graph.nearest_node(*point)[1] > settings.ROUTE_MAX_SNAP:
+            return JsonResponse({"error": f"{point[0]},{point[1]} is too far from the road network"}, status=400)
+
+    route = graph.route(origin, destination)
+    if route is None:
+        return JsonResponse({"error": "No route between these points"}, status=404)
+    path, length = route
+    cameras, risk_sum, risk_max = route_risk(path, buffer)
+    return JsonResponse({
+        "type": "Feature",
+        "geometry": {"type": "LineString", "coordinates": [[round(x, 6), round(y, 6)] for x, y in path.coords]},
+        "properties": {
+            "length": round(length), "buffer": buffer, "risk_sum": round(risk_sum, 4), "risk_max": risk_max,
+            "cameras": [
+                dict(camera_properties(row), distance=round(distance, 1), score=score)
+                for row, distance, score in cameras
+            ],
+        },
+    })
+
+
+def build_camera_clusters():
+    rows = list(Camera.objects.exclude(latitude=None).values_list(*CAMERA_FIELDS))
+    return ClusterIndex(
+        [r[-2] for r in rows], [r[-1] for r in rows],
+        properties=[camera_properties(r) for r in rows],
+    )
+
+
+def build_incident_clusters(incident_filter):
+    # Only the selected window is indexed, so the build doesn't grow with the whole history
+    rows = list(filter_incidents(Incident.objects.exclude(camera__latitude=None), incident_filter).values_list(*INCIDENT_FIELDS))
+    return ClusterIndex(
+        [r[-2] for r in rows], [r[-1] for r in rows],
+        categories=[r[2] for r in rows],
+        properties=[incident_properties(r) for r in rows],
+    )
+
+
+# Layer name -> (tables it is built from, builder, request filter passed to the builder or None)
+CLUSTER_LAYERS = {
+    "cameras": ([Camera], build_camera_clusters, None),
+    "incidents": ([Incident, Camera], build_incident_clusters, parse_incident_filter),
+}
+
+
+@login_required
+def cluster_layer(request, layer):
+    """
+    GeoJSON of a layer clustered for ?zoom=, limited to ?bbox=. Clusters carry
+    a count (and a per-severity breakdown for incidents); above
+    CLUSTER_MAX_ZOOM every point is returned on its own. Incidents are
+    limited to a time window read like the incident map's (see
+    parse_incident_filter), with one cached index per window and filters.
+    """
+    if layer not in CLUSTER_LAYERS:
+        raise Http404(f"Unknown layer {layer}")
+    models, build, parse = CLUSTER_LAYERS[layer]
+    if parse is None:
+        index = cached_by_version(f"clusters_{layer}", models, build)
+    else:
+        layer_filter = parse(request)
+        index = cached_by_version(f"clusters_{layer}", models, lambda: build(layer_filter), layer_filter.query_string())
+
+    viewport = parse_viewport(request)
+    if viewport is not None:
+        zoom = viewport.zoom
+    else:
+        try:
+            zoom = int(request.GET.get('zoom', DEFAULT_ZOOM))
+        except ValueError:
+            zoom = DEFAULT_ZOOM
+    return JsonResponse({"type": "FeatureCollection", "features": index.features(zoom, viewport)})
+
+
+# Popup details fetched when a map marker is clicked, one function per marker type.
+# Field names match the {placeholders} of the popup templates in the map views.
+def camera_popup(pk):
+    camera = Camera.objects.filter(pk=pk).values_list('camera_id', 'camera_name', 'location', 'road_name').first()
+    if camera is None:
+        return None
+    return {"id": camera[0], "name": camera[1], "location": camera[2], "road": camera[3]}
+
+
+def incident_popup(pk):
+    incident = Incident.objects.filter(pk=pk).values_list(
+        'incident_type', 'severity', 'timestamp', 'camera__camera_name', 'camera__road_name'
+    ).first()
+    if incident is None:
+        return None
+    incident_type, severity, timestamp, camera_name, road_name = incident
+    return {
+        "type": incident_type, "severity": severity.title(), "road": road_name, "camera": camera_name,
+        "time": timestamp.strftime("%Y-%m-%d %H:%M:%S"),
+    }
+
+
+def score_popup(pk):
+    score = AccidentProbabilityScore.objects.filter(pk=pk).values_list(
+        'accident_prob_score', 'timestamp', 'camera__camera_name', 'camera__road_name'
+    ).first()
+    if score is None:
+        return None
+    value, timestamp, camera_name, road_name = score
+    level = risk_level(value)
+    return {
+        "title": f"{level.title()} Risk Area", "level": level.title(), "score": f"{value:.2f}",
+        "road": road_name, "camera": camera_name, "time": timestamp.strftime('%Y-%m-%d %H:%M:%S'),
+    }
+
+
+def weather_popup(pk):
+    state = CameraState.objects.filter(pk=pk).exclude(weather_updated=None).values_list(
+        'temperature', 'conditions', 'weather_updated', 'camera__camera_name', 'camera__road_name'
+    ).first()
+    if state is None:
+        return None
+    temperature, conditions, updated, camera_name, road_name = state
+    return {
+        "temperature": temperature, "conditions": conditions, "camera": camera_name, "road": road_name,
+        "time": updated.strftime("%Y-%m-%d %H:%M:%S"),
+    }
+
+
+POPUPS = {
+    "camera": camera_popup,
+    "incident": incident_popup,
+    "score": score_popup,
+    "weather": weather_popup,
+}
+
+
+def popup_url(kind):
+    """URL template for a marker type's popup details, with {id} left for the browser."""
+    return reverse('api_popup', args=[kind, 0]).replace('/0/', '/{id}/')
+
+
+def live_options(layer, request):
+    """FastMarkerLayer arguments that keep a map's layer patched from api/changes/ with the map's own filters."""
+    url = reverse('api_changes', args=[layer])
+    if request.GET:
+        url += "?" + request.GET.urlencode()
+    return {
+        "live_url": url, "cursor": ChangeLog.cursor(), "polled": timezone.now().isoformat(),
+        "poll_seconds": settings.MAP_LIVE_POLL_SECONDS,
+    }
+
+
+@login_required
+@cache_control(private=True, max_age=settings.MAP_POPUP_MAX_AGE)
+def marker_popup(request, kind, pk):
+    """Details for one marker's popup, loaded when the marker is clicked."""
+    if kind not in POPUPS:
+        raise Http404(f"Unknown marker type {kind}")
+    details = POPUPS[kind](pk)
+    if details is None:
+        raise Http404(f"No {kind} {pk}")
+    return JsonResponse(details)
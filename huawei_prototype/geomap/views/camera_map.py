@@ -3,54 +3,56 @@ from django.shortcuts import render
 import folium
 import logging
 from django.contrib.auth.decorators import login_required
+from geomap.spatial import parse_viewport, filter_viewport, create_map
+from geomap.cache import cached_map_html
+from geomap.fast_render import FastMarkerLayer, awesome_icon
+from geomap.views.api import popup_url
 
 # Configure logging
 logger = logging.getLogger(__name__)
 
-# Singapore's coordinates
-SINGAPORE_CENTER = [1.3521, 103.8198]
+# Popup shown for each camera, filled in by the browser from api_popup when clicked
+CAMERA_POPUP = """
+<div style="min-width: 200px;">
+    <h5>Camera: {name}</h5>
+    <strong>ID:</strong> {id}<br>
+    <strong>Location:</strong> {location}<br>
+    <strong>Road:</strong> {road}<br>
+    <div class="mt-2">
+        <a href="/cameras/view/{id}/" target="_blank" class="btn btn-primary btn-sm" style="color: white !important;">
+            <i class="fa fa-video-camera"></i> View Feed
+        </a>
+    </div>
+</div>
+"""
 
 @login_required
 def camera_map(request):
     """View for displaying camera locations on a map."""
-    # Create a map centered on Singapore
-    map_sg = folium.Map(location=SINGAPORE_CENTER, zoom_start=12)
+    map_html = cached_map_html("camera_map", request, [Camera], lambda: build_camera_map(request))
+    return render(request, "geomap/camera_map.html", {"map_html": map_html})
 
-    # Fetch cameras from database
-    cameras_db = Camera.objects.all()
 
-    # Add cameras to the map
-    for camera in cameras_db:
-        try:
-            # Parse location from camera's location field (assuming format "lat,lng")
-            lat, lng = map(float, camera.location.split(','))
+def build_camera_map(request):
+    """Render the camera map to HTML."""
+    # Create a map centered on the requested viewport (Singapore by default)
+    viewport = parse_viewport(request)
+    map_sg = create_map(viewport)
 
-            # Create popup content with button for feed URL
-            popup_content = f"""
-            <div style="min-width: 200px;">
-                <h5>Camera: {camera.camera_name}</h5>
-                <strong>ID:</strong> {camera.camera_id}<br>
-                <strong>Location:</strong> {camera.location}<br>
-                <strong>Road:</strong> {camera.road_name}<br>
-                <div class="mt-2">
-                    <a href="/cameras/view/{camera.camera_id}/" target="_blank" class="btn btn-primary btn-sm" style="color: white !important;">
-                        <i class="fa fa-video-camera"></i> View Feed
-                    </a>
-                </div>
-            </div>
-            """
+    # Fetch cameras inside the viewport from database
+    cameras_db = filter_viewport(Camera.objects.all(), viewport)
 
-            folium.Marker(
-                location=[lat, lng],
-                popup=folium.Popup(popup_content, max_width=300),  # Fixed width popup
-                icon=folium.Icon(color="blue", icon="video-camera", prefix="fa"),
-            ).add_to(map_sg)
-        except Exception as e:
-            logger.error(f"Error processing camera {camera.camera_id}: {e}")
-            continue
+    # Add cameras to the map as one marker layer
+    rows = cameras_db.exclude(latitude=None).values_list('camera_id', 'latitude', 'longitude')
+    if rows:
+        ids, lat, lng = zip(*rows)
+        FastMarkerLayer(
+            lat, lng, [0] * len(ids), [awesome_icon("blue", "video-camera")], CAMERA_POPUP,
+            ids=ids, popup_url=popup_url("camera"),
+        ).add_to(map_sg)
     
-    # If no cameras found, add demo data
-    if not cameras_db:
+    # If no cameras exist at all, add demo data
+    if not Camera.objects.exists():
         # Demo data
         demo_cameras = [
             {
@@ -97,6 +99,5 @@ def camera_map(request):
                 logger.error(f"Error adding demo camera: {e}")
                 continue
 
-    # Render the map in the template
-    map_html = map_sg._repr_html_()
-    return render(request, "geomap/camera_map.html", {"map_html": map_html})
\ No newline at end of file
+    # Render map to HTML
+    return map_sg._repr_html_()
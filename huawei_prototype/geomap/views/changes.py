@@ -0,0 +1,139 @@
+from django.http import JsonResponse, Http404
+from django.conf import settings
+from django.contrib.auth.decorators import login_required
+from django.db.models import Q
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+import logging
+from dashboard.models import Incident, ChangeLog
+from geomap.spatial import parse_viewport, filter_viewport
+from geomap.filters import parse_incident_filter, filter_incidents, parse_score_filter, latest_scores
+from geomap.fast_render import awesome_icon, circle
+from geomap.views.api import risk_level
+from geomap.views.incident_map import incident_marker
+from geomap.views.probability_map import MARKER_COLORS, marker_radius
+from geomap.views.weather_map import current_weather, weather_marker
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+
+# Each layer turns the changed rows of its log into markers to draw and keys to remove.
+# Markers are filtered exactly like the map they patch, so a change that takes a row
+# out of the map's filters removes its marker.
+def incident_changes(request, viewport, entries):
+    ids = {object_id for object_id, _ in entries}
+    newest = filter_incidents(
+        filter_viewport(Incident.objects.exclude(camera__latitude=None), viewport, 'camera'), parse_incident_filter(request),
+    ).order_by('-timestamp', '-pk')
+
+    # The map draws the INCIDENT_MAP_LIMIT newest. Each change moves that cut-off by
+    # at most one place, so the incidents either side of it are sent again or removed
+    limit = settings.INCIDENT_MAP_LIMIT
+    start = max(limit - len(ids), 0)
+    edge = list(newest.values_list('pk', 'timestamp')[start:limit + len(ids)])
+    ids |= {pk for pk, _ in edge}
+    rows = newest.filter(pk__in=ids)
+    if len(edge) >= limit - start:
+        last_pk, last_time = edge[limit - start - 1]
+        rows = rows.filter(Q(timestamp__gt=last_time) | Q(timestamp=last_time, pk__gte=last_pk))
+
+    rows = rows.values_list('pk', 'incident_type', 'severity', 'camera__latitude', 'camera__longitude')
+    changed = [
+        {"key": pk, "id": pk, "lat": lat, "lng": lng, "style": awesome_icon(*incident_marker(incident_type, severity))}
+        for pk, incident_type, severity, lat, lng in rows
+    ]
+    return changed, ids - {item["key"] for item in changed}
+
+
+def expired_incidents(request, viewport, polled, now):
+    """Keys of incidents that were inside a relative time window at polled and are older than it at now."""
+    previous, current = parse_incident_filter(request, polled), parse_incident_filter(request, now)
+    if current.start <= previous.start:
+        return set()
+    expired = filter_incidents(
+        filter_viewport(Incident.objects.exclude(camera__latitude=None), viewport, 'camera'), previous,
+    ).filter(timestamp__lt=current.start)
+    return set(expired.values_list('pk', flat=True))
+
+
+def score_changes(request, viewport, entries):
+    camera_ids = {camera_id for _, camera_id in entries}
+    score_filter = parse_score_filter(request)
+    if score_filter.aggregate != 'latest' or score_filter.band == 'no markers':
+        return [], []
+    rows = latest_scores(viewport, score_filter.band, camera_ids).values_list(
+        'camera_id', 'pk', 'accident_prob_score', 'camera__latitude', 'camera__longitude'
+    )
+    radius = marker_radius(score_filter.band)
+    changed = [
+        {"key": camera_id, "id": pk, "lat": lat, "lng": lng, "style": circle(MARKER_COLORS[risk_level(score)], radius)}
+        for camera_id, pk, score, lat, lng in rows
+    ]
+    return changed, camera_ids - {item["key"] for item in changed}
+
+
+def weather_changes(request, viewport, entries):
+    camera_ids = {camera_id for _, camera_id in entries}
+    rows = current_weather(viewport, camera_ids).values_list('camera_id', 'conditions', 'camera__latitude', 'camera__longitude')
+    changed = [
+        {"key": camera_id, "id": camera_id, "lat": lat, "lng": lng, "style": awesome_icon(*weather_marker(conditions))}
+        for camera_id, conditions, lat, lng in rows
+    ]
+    return changed, camera_ids - {item["key"] for item in changed}
+
+
+LIVE_LAYERS = {
+    "incident": incident_changes,
+    "score": score_changes,
+    "weather": weather_changes,
+}
+
+# Layers whose markers also leave the map as its time window moves on, without a change
+LIVE_EXPIRY = {
+    "incident": expired_incidents,
+}
+
+
+@login_required
+def map_changes(request, layer):
+    """
+    Markers of a live map layer changed since ?since=<cursor>, filtered by
+    the map's own parameters. Returns the new cursor, markers to (re)draw
+    and keys to remove; "more" asks the client to poll again at once and
+    "reset" means the cursor is too old (or unknown) to patch from.
+    "time" is sent back as ?polled= so markers that have aged out of the
+    map's time window since then are removed too.
+    """
+    if layer not in LIVE_LAYERS:
+        raise Http404(f"Unknown layer {layer}")
+    now = timezone.now()
+    response = {"cursor": 0, "time": now.isoformat(), "changed": [], "removed": [], "more": False, "reset": False}
+    try:
+        since = int(request.GET['since'])
+    except (KeyError, ValueError):
+        # No cursor yet: the client starts from now
+        response["cursor"] = ChangeLog.cursor()
+        return JsonResponse(response)
+
+    ids = ChangeLog.objects.order_by('change_id').values_list('change_id', flat=True)
+    oldest, newest = ids.first(), ids.last()
+    if since > (newest or 0) or (oldest is not None and since < oldest - 1):
+        response["cursor"], response["reset"] = ChangeLog.cursor(), True
+        return JsonResponse(response)
+
+    # Changes of every layer share the cursor; this layer's are picked from them
+    changes, response["cursor"], response["more"] = ChangeLog.since(since, settings.MAP_CHANGES_LIMIT)
+    entries = [(object_id, camera_id) for _, change_layer, object_id, camera_id in changes if change_layer == layer]
+    viewport = parse_viewport(request)
+    changed, removed = [], set()
+    if entries:
+        changed, removed = LIVE_LAYERS[layer](request, viewport, entries)
+    try:
+        polled = parse_datetime(request.GET.get('polled', ''))
+    except ValueError:
+        polled = None
+    if layer in LIVE_EXPIRY and polled is not None and timezone.is_aware(polled):
+        removed = set(removed) | (LIVE_EXPIRY[layer](request, viewport, polled, now) - {item["key"] for item in changed})
+    response["changed"], response["removed"] = changed, sorted(removed)
+    return JsonResponse(response)
@@ -3,75 +3,88 @@ import folium
 from dashboard.models import Incident, Camera
 import logging
 from django.contrib.auth.decorators import login_required
+from django.conf import settings
+from geomap.spatial import parse_viewport, filter_viewport, create_map
+from geomap.cache import cached_map_html, cached_by_version
+from geomap.filters import INCIDENT_WINDOWS, parse_incident_filter, filter_incidents
+from geomap.fast_render import FastMarkerLayer, StyleTable, awesome_icon
+from geomap.views.api import popup_url, live_options
 
 # Configure logging
 logger = logging.getLogger(__name__)
 
-# Singapore's coordinates
-SINGAPORE_CENTER = [1.3521, 103.8198]
+# Icons for different incident types
+INCIDENT_ICONS = {
+    "accident": "ambulance",
+    "fire": "fire",
+    "infraction": "exclamation-triangle",
+}
+
+# Colors for severity levels
+SEVERITY_COLORS = {
+    "high": "red",
+    "medium": "orange",
+    "low": "blue",
+}
 
 @login_required
 def incident_map(request):
     """View for displaying real-time incidents on a map."""
-    # Create a map centered on Singapore
-    map_sg = folium.Map(location=SINGAPORE_CENTER, zoom_start=12)
-
-    # Define icons for different incident types
-    icons = {
-        "accident": "ambulance",
-        "fire": "fire",
-        "infraction": "exclamation-triangle",
-    }
-
-    # Define colors for severity levels
-    colors = {
-        "high": "red",
-        "medium": "orange",
-        "low": "blue",
-    }
-
-    # Fetch incidents from database
-    incidents_db = Incident.objects.all().select_related('camera')
-
-    # Add incidents to the map from database
-    for incident in incidents_db:
-        try:
-            # Parse location from camera's location field
-            lat, lng = map(float, incident.camera.location.split(','))
-            
-            # Get corresponding icon (default to exclamation-triangle if not found)
-            icon_name = icons.get(incident.incident_type.lower(), "exclamation-triangle")
-            
-            # Get color based on severity level
-            color = colors.get(incident.severity, "blue")
-            
-            # Create popup content with bold headings
-            popup_content = f"""
-            <div style="min-width: 200px;">
-                <h5>{incident.incident_type}</h5>
-                <strong>Severity:</strong> {incident.severity.title()}<br>
-                <strong>Location:</strong> {incident.camera.road_name}<br>
-                <strong>Camera:</strong> {incident.camera.camera_name}<br>
-                <strong>Time:</strong> {incident.timestamp.strftime("%Y-%m-%d %H:%M:%S")}
-            </div>
-            """
-            
-            folium.Marker(
-                location=[lat, lng],
-                popup=folium.Popup(popup_content, max_width=300),  # Set fixed width
-                icon=folium.Icon(
-                    color=color,
-                    icon=icon_name,
-                    prefix="fa",
-                ),
-            ).add_to(map_sg)
-        except Exception as e:
-            logger.error(f"Error processing incident {incident.incident_id}: {e}")
-            continue
+    incident_filter = parse_incident_filter(request)
+    map_html, more_available = cached_map_html(
+        "incident_map", request, [Incident, Camera],
+        lambda: build_incident_map(request, incident_filter), extra=incident_filter.query_string(),
+    )
+
+    return render(
+        request,
+        "geomap/incident_map.html",
+        {
+            "map_html": map_html,
+            "more_available": more_available,
+            "limit": settings.INCIDENT_MAP_LIMIT,
+            "windows": [(key, label) for key, (label, _) in INCIDENT_WINDOWS.items()],
+            "severities": Incident.SEVERITY_CHOICES,
+            "incident_types": incident_types(),
+            "filter": incident_filter,
+        },
+    )
+
+
+def incident_types():
+    """Distinct incident types for the filter, read from the type index."""
+    return cached_by_version(
+        "incident_types", [Incident],
+        lambda: list(Incident.objects.order_by('incident_type').values_list('incident_type', flat=True).distinct()),
+    )
+
+
+def build_incident_map(request, incident_filter):
+    """
+    Render the incident map to HTML. Returns (html, more_available): at most
+    INCIDENT_MAP_LIMIT of the newest matching incidents are drawn.
+    """
+    # Create a map centered on the requested viewport (Singapore by default)
+    viewport = parse_viewport(request)
+    map_sg = create_map(viewport)
+    icons, colors = INCIDENT_ICONS, SEVERITY_COLORS
+    # Read before the incidents so no change made while rendering is missed
+    live = live_options("incident", request)
+
+    # Fetch the newest incidents in the window and viewport, one past the cap to tell if there are more
+    incidents_db = filter_incidents(
+        filter_viewport(Incident.objects.exclude(camera__latitude=None), viewport, 'camera'), incident_filter
+    )
+    limit = settings.INCIDENT_MAP_LIMIT
+    rows = list(incidents_db.order_by('-timestamp', '-pk').values_list(
+        'pk', 'incident_type', 'severity', 'camera__latitude', 'camera__longitude'
+    )[:limit + 1])
+    more_available = len(rows) > limit
+    add_incident_markers(map_sg, rows[:limit], icons, colors, live)
 
     # ========== DEMO DATA ========== #
     # If no incidents found, add demo data
-    if not incidents_db:
+    if not Incident.objects.exists():
         # Demo data for empty database
         demo_incidents = [
             {
@@ -126,10 +139,41 @@ def incident_map(request):
                 logger.error(f"Error adding demo incident: {e}")
 
     # Render map to HTML
-    map_html = map_sg._repr_html_()
+    return map_sg._repr_html_(), more_available
 
-    return render(
-        request,
-        "geomap/incident_map.html",
-        {"map_html": map_html},
-    )
\ No newline at end of file
+
+# Popup shown for each incident, filled in by the browser from api_popup when clicked
+INCIDENT_POPUP = """
+<div style="min-width: 200px;">
+    <h5>{type}</h5>
+    <strong>Severity:</strong> {severity}<br>
+    <strong>Location:</strong> {road}<br>
+    <strong>Camera:</strong> {camera}<br>
+    <strong>Time:</strong> {time}
+</div>
+"""
+
+
+def incident_marker(incident_type, severity, icons=INCIDENT_ICONS, colors=SEVERITY_COLORS):
+    """(color, icon): icon by incident type (default exclamation-triangle), color by severity."""
+    return colors.get(severity, "blue"), icons.get(incident_type.lower(), "exclamation-triangle")
+
+
+def add_incident_markers(map_sg, rows, icons, colors, live=None):
+    """
+    Add incident markers from (id, type, severity, lat, lng) rows as one
+    layer; live is live_options() to keep it patched with new incidents.
+    """
+    styles = StyleTable()
+    ids, lat, lng, style = [], [], [], []
+    for incident_id, incident_type, severity, camera_lat, camera_lng in rows:
+        color, icon_name = incident_marker(incident_type, severity, icons, colors)
+        style.append(styles.index((color, icon_name), lambda: awesome_icon(color, icon_name)))
+        ids.append(incident_id)
+        lat.append(camera_lat)
+        lng.append(camera_lng)
+
+    if lat or live:
+        FastMarkerLayer(
+            lat, lng, style, styles.styles, INCIDENT_POPUP, ids=ids, popup_url=popup_url("incident"), **(live or {})
+        ).add_to(map_sg)
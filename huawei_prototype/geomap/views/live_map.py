@@ -0,0 +1,12 @@
+from django.shortcuts import render
+from django.contrib.auth.decorators import login_required
+from geomap.spatial import SINGAPORE_CENTER, DEFAULT_ZOOM
+
+
+@login_required
+def live_map(request):
+    """Static map page; the browser fetches each layer from the GeoJSON API and renders it."""
+    return render(request, "geomap/live_map.html", {
+        "center": SINGAPORE_CENTER,
+        "zoom": DEFAULT_ZOOM,
+    })
@@ -0,0 +1,58 @@
+import base64
+from django.shortcuts import render
+from django.conf import settings
+from django.http import JsonResponse, Http404
+from django.contrib.auth.decorators import login_required
+from django.views.decorators.http import condition
+from geomap.spatial import SINGAPORE_CENTER, DEFAULT_ZOOM
+from geomap.playback import (
+    load_rollup, rollup_path, window_frames, PLAYBACK_WINDOWS, DEFAULT_PLAYBACK_WINDOW, NO_SCORE,
+)
+from geomap.views.tiles import file_etag
+
+
+def playback_window(request):
+    window = request.GET.get('window', DEFAULT_PLAYBACK_WINDOW)
+    return window if window in PLAYBACK_WINDOWS else DEFAULT_PLAYBACK_WINDOW
+
+
+@login_required
+def risk_playback(request):
+    """Map page that replays the rolled-up risk history with a time slider."""
+    return render(request, "geomap/risk_playback.html", {
+        "center": SINGAPORE_CENTER,
+        "zoom": DEFAULT_ZOOM,
+        "windows": PLAYBACK_WINDOWS,
+        "window": playback_window(request),
+        "ready": load_rollup() is not None,
+    })
+
+
+@login_required
+@condition(etag_func=lambda request: f"{file_etag(rollup_path())}-{playback_window(request)}")
+def risk_playback_data(request):
+    """
+    Frames of the risk rollup for ?window=24h|7d: camera positions and, as
+    base64, one uint8 score per camera per bucket (score * 254, 255 for no
+    reading yet), bucket-major, so the slider slices a frame without
+    another request.
+    """
+    rollup = load_rollup()
+    if rollup is None:
+        raise Http404("Risk playback has not been rolled up yet")
+    start, scores = window_frames(rollup, playback_window(request))
+    response = JsonResponse({
+        "start": start,
+        "bucket_seconds": int(rollup["bucket_seconds"]),
+        "buckets": len(scores),
+        "no_score": NO_SCORE,
+        "cameras": {
+            "id": rollup["camera_ids"].tolist(),
+            "lat": rollup["lat"].tolist(),
+            "lng": rollup["lng"].tolist(),
+        },
+        "scores": base64.b64encode(scores.tobytes()).decode("ascii"),
+    })
+    # The rollup only changes when rollup_risk_playback runs; the ETag makes revalidation cheap
+    response["Cache-Control"] = f"private, max-age={settings.PLAYBACK_INTERVAL}"
+    return response
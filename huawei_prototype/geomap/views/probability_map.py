@@ -1,24 +1,95 @@
 from django.shortcuts import render
+from django.urls import reverse
+from django.conf import settings
+from django.db.models import Max
 import folium
 from folium.plugins import HeatMap
 import random
 import logging
 from dashboard.models import AccidentProbabilityScore, Camera
 from django.contrib.auth.decorators import login_required
+from geomap.spatial import parse_viewport, filter_viewport, create_map
+from geomap.cache import cached_map_html
+from geomap.tiles import HEAT_GRADIENT, RISK_TILES, tiles_ready
+from geomap.fast_render import FastMarkerLayer, StyleTable, circle
+from geomap.filters import (
+    INCIDENT_WINDOWS, SCORE_AGGREGATES, SCORE_WINDOWS, parse_score_filter, filter_risk_band, latest_scores,
+)
+from geomap.views.api import popup_url, live_options
 # Configure logging
 logger = logging.getLogger(__name__)
 
-# Singapore's coordinates
-SINGAPORE_CENTER = [1.3521, 103.8198]
+# Popup shown for each score, filled in by the browser from api_popup when clicked
+PROBABILITY_POPUP = """
+<div style="min-width: 200px;">
+    <h5>{title}</h5>
+    <strong>Risk Level:</strong> {level}<br>
+    <strong>Accident Probability Score:</strong> {score}<br>
+    <strong>Location:</strong> {road}<br>
+    <strong>Camera:</strong> {camera}<br>
+    <strong>Timestamp:</strong> {time}
+</div>
+"""
 
 @login_required
 def probability_map(request):
     """View for displaying accident probability scores and risk levels from the database."""
-    # Create a map centered on Singapore
-    map_sg = folium.Map(location=SINGAPORE_CENTER, zoom_start=12)
+    score_filter = parse_score_filter(request)
+    map_html = cached_map_html(
+        "probability_map", request, [AccidentProbabilityScore, Camera, RISK_TILES],
+        lambda: build_probability_map(request, score_filter), extra=score_filter.query_string(),
+    )
+
+    # Risk level filters for UI
+    risk_types = ['all', 'high risk', 'medium risk', 'low risk', 'no markers']
+
+    return render(request, 'geomap/probability_map.html', {
+        'map_html': map_html,
+        'incident_types': risk_types,
+        'selected_type': request.GET.get('type', 'all'),
+        'aggregates': [(key, label) for key, (label, _) in SCORE_AGGREGATES.items()],
+        'windows': [(key, INCIDENT_WINDOWS[key][0]) for key in SCORE_WINDOWS],
+        'score_filter': score_filter,
+        'title': 'Accident Risk Map',
+        'description': 'This map shows predicted risk levels based on accident probability scores derived from AI analysis.'
+    })
+
+
+# Marker colors by risk level
+MARKER_COLORS = {"high": "red", "medium": "orange", "low": "green"}
+
+
+def marker_radius(band):
+    # Make markers even smaller when showing 'all' risk levels
+    return 4 if band == 'all' else 6
+
+
+def aggregate_rows(viewport, score_filter):
+    """
+    One (camera name, road, newest time, score, lat, lng) row per camera in
+    the viewport with scores in the window: their average or peak, grouped
+    and banded in the query.
+    """
+    function = SCORE_AGGREGATES[score_filter.aggregate][1]
+    cameras = filter_viewport(Camera.objects.exclude(latitude=None), viewport).filter(
+        accident_probabilitys__timestamp__gte=score_filter.start
+    ).annotate(
+        score=function('accident_probabilitys__accident_prob_score'),
+        newest=Max('accident_probabilitys__timestamp'),
+    )
+    return filter_risk_band(cameras, score_filter.band, 'score').values_list(
+        'camera_name', 'road_name', 'newest', 'score', 'latitude', 'longitude'
+    )
+
+
+def build_probability_map(request, score_filter):
+    """Render the probability heatmap to HTML."""
+    # Create a map centered on the requested viewport (Singapore by default)
+    viewport = parse_viewport(request)
+    map_sg = create_map(viewport)
     
     # Filter by risk level if specified
-    risk_filter = request.GET.get('type', 'all')
+    risk_filter = score_filter.band
     
     # Define risk level categories based on accident probability scores
     def get_risk_level(score):
@@ -29,91 +100,70 @@ def probability_map(request):
         else:
             return "low"
     
-    # Fetch probability scores from database
-    probabilities = AccidentProbabilityScore.objects.all().select_related('camera')
-    
+    # Pre-rendered tiles cover the unfiltered latest scores once render_risk_tiles has run
+    use_tiles = (
+        risk_filter in ('all', 'no markers') and score_filter.aggregate == 'latest'
+        and tiles_ready() and AccidentProbabilityScore.objects.exists()
+    )
+
     # Prepare data for heatmap
     heat_data = []
-    
-    # Create markers for areas with different risk levels
-    for probability in probabilities:
-        try:
-            # Get camera location
-            if not probability.camera or not probability.camera.location:
-                continue
-                
-            lat, lng = map(float, probability.camera.location.split(','))
-            
-            # Get accident probability score and determine risk level
-            # score = probability.accident_probability_score
-            score = probability.accident_prob_score
-            risk_level = get_risk_level(score)
-            
-            # Skip if filtered by risk level
-            if risk_filter != 'all' and risk_filter != f"{risk_level} risk":
-                continue
-                
-            # Skip all markers if no markers is selected
+
+    # Marker columns for the single marker layer
+    marker_colors = MARKER_COLORS
+    radius = marker_radius(risk_filter)
+    styles = StyleTable()
+    ids, lats, lngs, style = [], [], [], []
+    fields = {"title": [], "level": [], "score": [], "road": [], "camera": [], "time": []}
+
+    def add_marker(score, lat, lng):
+        risk_level = get_risk_level(score)
+        color = marker_colors[risk_level]
+        style.append(styles.index(color, lambda: circle(color, radius)))
+        lats.append(lat)
+        lngs.append(lng)
+        return risk_level
+
+    if score_filter.aggregate == 'latest':
+        # Markers follow new scores live; read the cursor before the scores so none are missed
+        live = live_options("score", request) if risk_filter != 'no markers' else {}
+        # Latest score per camera; nothing to fetch when tiles draw the heat and no markers are wanted
+        rows = [] if use_tiles and risk_filter == 'no markers' else latest_scores(viewport, risk_filter).values_list(
+            'pk', 'accident_prob_score', 'camera__latitude', 'camera__longitude', 'camera_id'
+        )
+        keys = []
+        for score_id, score, lat, lng, camera_id in rows:
+            heat_data.append([lat, lng, score])
+            if risk_filter != 'no markers':
+                add_marker(score, lat, lng)
+                ids.append(score_id)
+                keys.append(camera_id)
+        if lats or live:
+            # Markers are keyed by camera: a newer score replaces the camera's marker
+            FastMarkerLayer(
+                lats, lngs, style, styles.styles, PROBABILITY_POPUP, ids=ids, popup_url=popup_url("score"),
+                keys=keys, **live
+            ).add_to(map_sg)
+    else:
+        # Aggregates have no single score row to fetch, so their few popups travel with the page
+        label = SCORE_AGGREGATES[score_filter.aggregate][0]
+        window = INCIDENT_WINDOWS[score_filter.window][0].lower()
+        for camera_name, road_name, newest, score, lat, lng in aggregate_rows(viewport, score_filter):
+            heat_data.append([lat, lng, score])
             if risk_filter == 'no markers':
                 continue
-                
-            # Add to heatmap data (lat, lng, intensity)
-            # heat_data.append([lat, lng, score])
-            heat_data.append([lat, lng, score])
-
-            # Add marker based on risk level and filter
-            show_marker = False
-            marker_color = "blue"  # Default color
-            
-            if score >= 0.7 and (risk_filter == 'all' or risk_filter == 'high risk'):
-                show_marker = True
-                marker_color = "red"
-                risk_text = "High Risk Area"
-            elif score >= 0.4 and score < 0.7 and (risk_filter == 'all' or risk_filter == 'medium risk'):
-                show_marker = True
-                marker_color = "orange"
-                risk_text = "Medium Risk Area"
-            elif score < 0.4 and (risk_filter == 'all' or risk_filter == 'low risk'):
-                show_marker = True
-                marker_color = "green"
-                risk_text = "Low Risk Area"
-            
-            if show_marker:
-                popup_content = f"""
-                <div style="min-width: 200px;">
-                    <h5>{risk_text}</h5>
-                    <strong>Risk Level:</strong> {risk_level.title()}<br>
-                    <strong>Accident Probability Score:</strong> {score:.2f}<br>
-                    <strong>Location:</strong> {probability.camera.road_name}<br>
-                    <strong>Camera:</strong> {probability.camera.camera_name}<br>
-                    <strong>Timestamp:</strong> {probability.timestamp.strftime('%Y-%m-%d %H:%M:%S')}
-                </div>
-                """
-                
-                radius = 6
-                
-                # Make markers even smaller when showing 'all' risk levels
-                if risk_filter == 'all':
-                    radius = 4
-                    
-                folium.CircleMarker(
-                    location=[lat, lng],
-                    radius=radius,
-                    popup=folium.Popup(popup_content, max_width=300),
-                    color=marker_color,
-                    fill=True,
-                    fill_color=marker_color,
-                    fill_opacity=0.7
-                ).add_to(map_sg)
-        # except Exception as e:
-        #     logger.error(f"Error processing probability {probability.accident_probability_score_id}: {e}")
-        #     continue
-        except Exception as e:
-            # use the correct PK attribute name
-            logger.error(f"Error processing probability {probability.accident_prob_score_id}: {e}")
+            risk_level = add_marker(score, lat, lng)
+            fields["title"].append(f"{risk_level.title()} Risk Area ({label.lower()}, {window})")
+            fields["level"].append(risk_level.title())
+            fields["score"].append(f"{score:.2f}")
+            fields["road"].append(road_name)
+            fields["camera"].append(camera_name)
+            fields["time"].append(newest.strftime('%Y-%m-%d %H:%M:%S'))
+        if lats:
+            FastMarkerLayer(lats, lngs, style, styles.styles, PROBABILITY_POPUP, fields).add_to(map_sg)
     
-    # If no data is found, generate demo data
-    if not heat_data:
+    # If there is no data at all, generate demo data
+    if not heat_data and not AccidentProbabilityScore.objects.exists():
         # List of major roads in Singapore for demo data
         major_roads = [
             # PIE (Pan Island Expressway)
@@ -200,28 +250,24 @@ def probability_map(request):
                         fill_opacity=0.7
                     ).add_to(map_sg)
     
-    # Add heatmap layer
-    HeatMap(
-        heat_data, 
-        radius=15, 
-        gradient={
-            '0.1': 'green', 
-            '0.5': 'yellow', 
-            '0.7': 'orange', 
-            '1.0': 'red'
-        }
-    ).add_to(map_sg)
+    # Add heatmap layer: pre-rendered tiles for the unfiltered latest scores once
+    # render_risk_tiles has run, otherwise rasterised in the browser
+    if use_tiles:
+        tile_url = reverse('risk_tile', args=[0, 0, 0]).replace('/0/0/0.png', '/{z}/{x}/{y}.png')
+        folium.TileLayer(
+            tiles=tile_url,
+            attr='Accident risk',
+            name='Accident risk',
+            overlay=True,
+            min_native_zoom=settings.RISK_TILE_MIN_ZOOM,
+            max_native_zoom=settings.RISK_TILE_MAX_ZOOM,
+        ).add_to(map_sg)
+    else:
+        HeatMap(
+            heat_data, 
+            radius=15, 
+            gradient=HEAT_GRADIENT
+        ).add_to(map_sg)
     
-    # Risk level filters for UI
-    risk_types = ['all', 'high risk', 'medium risk', 'low risk', 'no markers']
-        
     # Render map to HTML
-    map_html = map_sg._repr_html_()
-    
-    return render(request, 'geomap/probability_map.html', {
-        'map_html': map_html,
-        'incident_types': risk_types,
-        'selected_type': risk_filter,
-        'title': 'Accident Risk Map',
-        'description': 'This map shows predicted risk levels based on accident probability scores derived from AI analysis.'
-    })
\ No newline at end of file
+    return map_sg._repr_html_()
@@ -0,0 +1,55 @@
+import os
+from functools import lru_cache
+import numpy as np
+import cv2
+from django.conf import settings
+from django.http import HttpResponse, FileResponse, Http404
+from django.contrib.auth.decorators import login_required
+from django.views.decorators.http import condition
+from geomap.tiles import tile_path, TILE_SIZE
+from geomap.weather_grid import overlay_path, OVERLAYS
+
+
+@lru_cache(maxsize=1)
+def blank_tile():
+    _, png = cv2.imencode(".png", np.zeros((TILE_SIZE, TILE_SIZE, 4), dtype=np.uint8))
+    return png.tobytes()
+
+
+def file_etag(path):
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return "blank"
+    return f"{stat.st_mtime_ns:x}-{stat.st_size:x}"
+
+
+def tile_etag(request, z, x, y):
+    return file_etag(tile_path(z, x, y))
+
+
+@login_required
+@condition(etag_func=tile_etag)
+def risk_tile(request, z, x, y):
+    """One pre-rendered accident risk tile; a transparent tile where nothing was drawn."""
+    path = tile_path(z, x, y)
+    if os.path.exists(path):
+        response = FileResponse(open(path, "rb"), content_type="image/png")
+    else:
+        response = HttpResponse(blank_tile(), content_type="image/png")
+    # Tiles only change when render_risk_tiles runs; the ETag makes revalidation cheap after that
+    response["Cache-Control"] = f"private, max-age={settings.RISK_TILE_INTERVAL}"
+    return response
+
+
+@login_required
+@condition(etag_func=lambda request, name: file_etag(overlay_path(name)) if name in OVERLAYS else None)
+def weather_overlay(request, name):
+    """An interpolated weather overlay image drawn by render_weather_grid."""
+    path = overlay_path(name)
+    if name not in OVERLAYS or not os.path.exists(path):
+        raise Http404(f"No {name} overlay")
+    response = FileResponse(open(path, "rb"), content_type="image/png")
+    # Maps link to the overlay with the grid's fingerprint, so a redraw is a new URL
+    response["Cache-Control"] = f"private, max-age={settings.WEATHER_GRID_INTERVAL}"
+    return response
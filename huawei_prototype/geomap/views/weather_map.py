@@ -2,73 +2,129 @@ from django.shortcuts import render
 import folium
 import random
 import logging
-from dashboard.models import Weather, Camera
+from dashboard.models import Weather, Camera, CameraState
 from django.contrib.auth.decorators import login_required
+from django.urls import reverse
+from geomap.spatial import parse_viewport, filter_viewport, create_map
+from geomap.cache import cached_map_html
+from geomap.fast_render import FastMarkerLayer, StyleTable, awesome_icon
+from geomap.views.api import popup_url, live_options
+from geomap.weather_grid import load_manifest
 
 # Configure logging
 logger = logging.getLogger(__name__)
 
-# Singapore's coordinates
-SINGAPORE_CENTER = [1.3521, 103.8198]
+# Popup shown for each reading, filled in by the browser from api_popup when clicked
+WEATHER_POPUP = """
+<div style="min-width: 200px;">
+    <h5>Weather at {camera}</h5>
+    <strong>Temperature:</strong> {temperature}°C<br>
+    <strong>Conditions:</strong> {conditions}<br>
+    <strong>Location:</strong> {road}<br>
+    <strong>Time:</strong> {time}
+</div>
+"""
 
 @login_required
 def weather_map(request):
     """View for displaying weather information on a map."""
-    # Create a map centered on Singapore
-    map_sg = folium.Map(location=SINGAPORE_CENTER, zoom_start=12)
+    # The overlays drawn by render_weather_grid change without a Weather write of their own
+    grid = load_manifest()
+    map_html = cached_map_html(
+        "weather_map", request, [Weather, Camera], lambda: build_weather_map(request, grid),
+        extra=f"{grid['fingerprint']}|{request.get_host()}" if grid else "",
+    )
+
+    return render(
+        request,
+        "geomap/weather_map.html",
+        {
+            "map_html": map_html,
+            "title": "Live Weather Map",
+            "description": "Current weather conditions across Singapore's traffic camera network.",
+            "weather_grid": grid is not None,
+        },
+    )
+
+
+def current_weather(viewport, camera_ids=None):
+    """Current reading of each camera inside the viewport (or of camera_ids)."""
+    states = CameraState.objects.exclude(weather_updated=None).exclude(camera__latitude=None)
+    if camera_ids is not None:
+        states = states.filter(camera_id__in=camera_ids)
+    return filter_viewport(states, viewport, 'camera')
+
+
+def weather_marker(conditions):
+    """(color, icon) for a reading, chosen based on conditions."""
+    icon_name = "cloud"
+    color = "lightblue"
     
-    # Fetch latest weather data for each camera
-    weather_data = Weather.objects.all().select_related('camera')
+    if "rain" in conditions.lower():
+        icon_name = "umbrella"
+        color = "blue"
+    elif "thunderstorm" in conditions.lower():
+        icon_name = "bolt"
+        color = "purple"
+    elif "sun" in conditions.lower() or "clear" in conditions.lower():
+        icon_name = "sun-o"
+        color = "orange"
+    elif "fog" in conditions.lower() or "mist" in conditions.lower():
+        icon_name = "low-vision"
+        color = "gray"
+    elif "cloud" in conditions.lower():
+        icon_name = "cloud"
+        color = "lightgray"
+    return color, icon_name
+
+
+def add_weather_overlays(map_sg, request, grid):
+    """Interpolated rain and temperature images from render_weather_grid, switchable in a layer control."""
+    for name, title, show in [("rain", "Rain likelihood", True), ("temperature", "Temperature", False)]:
+        # Absolute, or folium would read the URL as a local file to embed
+        url = request.build_absolute_uri(reverse('weather_overlay', args=[name]))
+        folium.raster_layers.ImageOverlay(
+            image=f"{url}?v={grid['fingerprint']}",
+            bounds=grid["bounds"],
+            name=title,
+            show=show,
+        ).add_to(map_sg)
+    folium.LayerControl(collapsed=False).add_to(map_sg)
+
+
+def build_weather_map(request, grid=None):
+    """Render the weather map to HTML."""
+    # Create a map centered on the requested viewport (Singapore by default)
+    viewport = parse_viewport(request)
+    map_sg = create_map(viewport)
+    if grid:
+        add_weather_overlays(map_sg, request, grid)
     
-    # Add weather markers to the map
-    for weather in weather_data:
-        try:
-            # Parse location from camera's location field
-            lat, lng = map(float, weather.camera.location.split(','))
-            
-            # Choose icon and color based on conditions
-            icon_name = "cloud"
-            color = "lightblue"
-            
-            if "rain" in weather.conditions.lower():
-                icon_name = "umbrella"
-                color = "blue"
-            elif "thunderstorm" in weather.conditions.lower():
-                icon_name = "bolt"
-                color = "purple"
-            elif "sun" in weather.conditions.lower() or "clear" in weather.conditions.lower():
-                icon_name = "sun-o"
-                color = "orange"
-            elif "fog" in weather.conditions.lower() or "mist" in weather.conditions.lower():
-                icon_name = "low-vision"
-                color = "gray"
-            elif "cloud" in weather.conditions.lower():
-                icon_name = "cloud"
-                color = "lightgray"
-            
-            # Create popup content
-            popup_content = f"""
-            <div style="min-width: 200px;">
-                <h5>Weather at {weather.camera.camera_name}</h5>
-                <strong>Temperature:</strong> {weather.temperature}°C<br>
-                <strong>Conditions:</strong> {weather.conditions}<br>
-                <strong>Location:</strong> {weather.camera.road_name}<br>
-                <strong>Time:</strong> {weather.timestamp.strftime("%Y-%m-%d %H:%M:%S")}
-            </div>
-            """
-            
-            folium.Marker(
-                location=[lat, lng],
-                popup=folium.Popup(popup_content, max_width=300),
-                icon=folium.Icon(color=color, icon=icon_name, prefix="fa"),
-            ).add_to(map_sg)
-        except Exception as e:
-            logger.error(f"Error processing weather data: {e}")
-            continue
+    # Markers follow new readings live; read the cursor before the readings so none are missed
+    live = live_options("weather", request)
+
+    # Fetch the current reading of each camera inside the viewport
+    weather_data = current_weather(viewport).values_list(
+        'camera_id', 'conditions', 'camera__latitude', 'camera__longitude'
+    )
+    
+    # Add weather markers to the map as one layer
+    styles = StyleTable()
+    ids, lats, lngs, style = [], [], [], []
+    for camera_id, conditions, lat, lng in weather_data:
+        color, icon_name = weather_marker(conditions)
+        style.append(styles.index((color, icon_name), lambda: awesome_icon(color, icon_name)))
+        ids.append(camera_id)
+        lats.append(lat)
+        lngs.append(lng)
     
-    # If no weather data found, display cameras with demo weather
-    if not weather_data:
-        cameras = Camera.objects.all()
+    FastMarkerLayer(
+        lats, lngs, style, styles.styles, WEATHER_POPUP, ids=ids, popup_url=popup_url("weather"), **live
+    ).add_to(map_sg)
+    
+    # If no weather data exists, display cameras with demo weather
+    if not Weather.objects.exists():
+        cameras = filter_viewport(Camera.objects.all(), viewport)
         
         # Weather conditions for demo
         demo_conditions = [
@@ -83,8 +139,9 @@ def weather_map(request):
         
         for camera in cameras:
             try:
-                # Parse location
-                lat, lng = map(float, camera.location.split(','))
+                if camera.latitude is None:
+                    continue
+                lat, lng = camera.latitude, camera.longitude
                 
                 # Random weather condition
                 weather = random.choice(demo_conditions)
@@ -130,7 +187,7 @@ def weather_map(request):
                 continue
         
         # If no cameras either, add some demo cameras with weather
-        if not cameras:
+        if not Camera.objects.exists():
             demo_cameras = [
                 {"name": "ECP-01", "location": "1.3099,103.9053", "road": "East Coast Parkway"},
                 {"name": "PIE-04", "location": "1.3347,103.7775", "road": "Pan Island Expressway"},
@@ -185,14 +242,4 @@ def weather_map(request):
                     continue
     
     # Render map to HTML
-    map_html = map_sg._repr_html_()
-    
-    return render(
-        request,
-        "geomap/weather_map.html",
-        {
-            "map_html": map_html,
-            "title": "Live Weather Map",
-            "description": "Current weather conditions across Singapore's traffic camera network."
-        },
-    )
\ No newline at end of file
+    return map_sg._repr_html_()
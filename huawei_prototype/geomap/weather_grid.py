@@ -0,0 +1,177 @@
+import os
+import json
+import hashlib
+import logging
+import numpy as np
+import cv2
+from scipy.spatial import cKDTree
+from django.conf import settings
+from django.utils import timezone
+from dashboard.models import CameraState
+from geomap.spatial import local_metres
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+MANIFEST = "manifest.json"
+OVERLAYS = ("rain", "temperature")
+
+# Chance of rain read from a reading's conditions; the first keyword found wins
+RAIN_LIKELIHOOD = [
+    ("thunder", 1.0),
+    ("heavy", 1.0),
+    ("shower", 0.8),
+    ("light rain", 0.6),
+    ("rain", 0.8),
+    ("drizzle", 0.6),
+    ("overcast", 0.4),
+    ("cloud", 0.25),
+    ("fog", 0.1),
+    ("mist", 0.1),
+    ("haz", 0.05),
+    ("sun", 0.0),
+    ("clear", 0.0),
+    ("fair", 0.0),
+]
+DEFAULT_RAIN_LIKELIHOOD = 0.2
+
+# Colour stops (BGR) of the temperature overlay, cold to hot across WEATHER_GRID_TEMPERATURE_RANGE
+TEMPERATURE_STOPS = [(0.0, (255, 128, 0)), (0.5, (0, 220, 255)), (1.0, (0, 0, 220))]
+RAIN_BGR = (200, 60, 0)
+
+
+def rain_likelihood(conditions):
+    conditions = (conditions or "").lower()
+    for keyword, likelihood in RAIN_LIKELIHOOD:
+        if keyword in conditions:
+            return likelihood
+    return DEFAULT_RAIN_LIKELIHOOD
+
+
+def overlay_path(name):
+    return os.path.join(settings.WEATHER_GRID_DIR, f"{name}.png")
+
+
+def load_manifest():
+    """What render_weather_grid last drew (fingerprint, bounds, time), or None before it has run."""
+    try:
+        with open(os.path.join(settings.WEATHER_GRID_DIR, MANIFEST)) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def current_readings():
+    """(lat, lng, temperature or None, conditions) of every camera's current reading."""
+    return list(
+        CameraState.objects.exclude(weather_updated=None).exclude(camera__latitude=None)
+        .order_by('camera_id').values_list('camera__latitude', 'camera__longitude', 'temperature', 'conditions')
+    )
+
+
+def idw(points, values, targets, power, neighbours):
+    """
+    Inverse-distance weighted values at the target x/y positions from the
+    nearest neighbours among the points. Returns the values and the
+    distance from each target to its nearest point.
+    """
+    k = min(neighbours, len(points))
+    distances, indexes = cKDTree(points).query(targets, k=k)
+    distances, indexes = distances.reshape(len(targets), k), indexes.reshape(len(targets), k)
+    weights = 1.0 / np.maximum(distances, 1e-6) ** power
+    interpolated = (weights * values[indexes]).sum(axis=1) / weights.sum(axis=1)
+    return interpolated, distances[:, 0]
+
+
+class WeatherGrid:
+    """
+    Temperature and rain likelihood over WEATHER_GRID_BOUNDS, interpolated
+    from the current per-camera readings and saved as PNG overlays. The
+    manifest keeps a fingerprint of the readings drawn, so runs without
+    new readings write nothing.
+    """
+
+    def __init__(self, step=None, power=None, neighbours=None):
+        self.step = settings.WEATHER_GRID_STEP if step is None else step
+        self.power = settings.WEATHER_IDW_POWER if power is None else power
+        self.neighbours = settings.WEATHER_IDW_NEIGHBOURS if neighbours is None else neighbours
+        (self.south, self.west), (self.north, self.east) = settings.WEATHER_GRID_BOUNDS
+
+    def fingerprint(self, readings):
+        key = json.dumps([self.step, self.power, self.neighbours, settings.WEATHER_GRID_BOUNDS,
+                          settings.WEATHER_GRID_REACH, settings.WEATHER_GRID_TEMPERATURE_RANGE, readings])
+        return hashlib.sha256(key.encode()).hexdigest()[:16]
+
+    def cells(self):
+        """lat/lng of every cell centre, north row first, as (rows, cols) arrays."""
+        lats = np.arange(self.north - self.step / 2, self.south, -self.step)
+        lngs = np.arange(self.west + self.step / 2, self.east, self.step)
+        return np.meshgrid(lats, lngs, indexing='ij')
+
+    def interpolate(self, readings):
+        """(temperature, rain, alpha) grids; alpha fades cells out beyond WEATHER_GRID_REACH of any reading."""
+        lat, lng = self.cells()
+        targets = local_metres(lat.ravel(), lng.ravel())
+        points = local_metres([r[0] for r in readings], [r[1] for r in readings])
+
+        rain, nearest = idw(points, np.array([rain_likelihood(r[3]) for r in readings]), targets, self.power, self.neighbours)
+        alpha = np.clip(1 - nearest / settings.WEATHER_GRID_REACH, 0, 1)
+
+        has_temperature = np.array([r[2] is not None for r in readings])
+        if has_temperature.any():
+            temperature, _ = idw(points[has_temperature], np.array([r[2] for r in readings if r[2] is not None], dtype=np.float64),
+                                 targets, self.power, self.neighbours)
+        else:
+            temperature = np.full(len(targets), np.nan)
+        return (grid.reshape(lat.shape) for grid in (temperature, rain, alpha))
+
+    def render(self, temperature, rain, alpha):
+        """{overlay name: BGRA image}."""
+        low, high = settings.WEATHER_GRID_TEMPERATURE_RANGE
+        level = np.clip((np.nan_to_num(temperature, nan=low) - low) / (high - low), 0, 1)
+        positions = [p for p, _ in TEMPERATURE_STOPS]
+        bgr = np.dstack([np.interp(level, positions, [c[i] for _, c in TEMPERATURE_STOPS]) for i in range(3)])
+        temperature_alpha = np.where(np.isnan(temperature), 0, alpha * 160)
+
+        rain_bgr = np.broadcast_to(np.array(RAIN_BGR, dtype=np.float64), rain.shape + (3,))
+        rain_alpha = alpha * rain * 200
+        return {
+            "temperature": np.dstack([bgr, temperature_alpha]).astype(np.uint8),
+            "rain": np.dstack([rain_bgr, rain_alpha]).astype(np.uint8),
+        }
+
+    def run(self, force=False):
+        """Redraw the overlays if the readings changed since the last run. Returns whether anything was written."""
+        readings = current_readings()
+        fingerprint = self.fingerprint(readings)
+        manifest = load_manifest()
+        if not force and manifest is not None and manifest.get("fingerprint") == fingerprint:
+            return False
+
+        os.makedirs(settings.WEATHER_GRID_DIR, exist_ok=True)
+        lat, _ = self.cells()
+        if readings:
+            images = self.render(*self.interpolate(readings))
+        else:
+            images = {name: np.zeros(lat.shape + (4,), dtype=np.uint8) for name in OVERLAYS}
+        for name, image in images.items():
+            success, png = cv2.imencode(".png", image)
+            if not success:
+                raise RuntimeError(f"Could not encode the {name} overlay")
+            path = overlay_path(name)
+            with open(path + ".tmp", "wb") as f:
+                f.write(png.tobytes())
+            os.replace(path + ".tmp", path)
+
+        path = os.path.join(settings.WEATHER_GRID_DIR, MANIFEST)
+        with open(path + ".tmp", "w") as f:
+            json.dump({
+                "fingerprint": fingerprint,
+                # Whole cells from the north-west corner, so the image may reach just past the bounds
+                "bounds": [[self.north - lat.shape[0] * self.step, self.west], [self.north, self.west + lat.shape[1] * self.step]],
+                "readings": len(readings),
+                "updated": timezone.now().isoformat(),
+            }, f)
+        os.replace(path + ".tmp", path)
+        logger.info(f"Weather grid redrawn from {len(readings)} readings")
+        return True
@@ -0,0 +1,28 @@
+# Gunicorn config for serving huawei_prototype with prefork workers.
+#
+#   YOLO_PRELOAD=1 gunicorn huawei_prototype.wsgi
+#
+# With YOLO_PRELOAD=1 the app (and the YOLO weights, see cameras/detection.py)
+# is loaded once in the master and shared copy-on-write with every worker,
+# instead of each worker loading its own copy of the weights.
+#
+# Preloaded workers must call detection.after_fork() before serving: it
+# replaces the locks inherited from the master and sets the per-worker torch
+# thread count. post_fork below does that.
+
+import os
+
+bind = os.environ.get("GUNICORN_BIND", "0.0.0.0:8000")
+workers = int(os.environ.get("GUNICORN_WORKERS", "4"))
+# Streams are long-lived responses
+worker_class = "gthread"
+threads = int(os.environ.get("GUNICORN_THREADS", "4"))
+timeout = 0
+
+preload_app = os.environ.get("YOLO_PRELOAD", "0") == "1"
+
+
+def post_fork(server, worker):
+    if preload_app:
+        from cameras import detection
+        detection.after_fork()
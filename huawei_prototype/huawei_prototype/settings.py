@@ -12,6 +12,7 @@ https://docs.djangoproject.com/en/5.1/ref/settings/
 
 from pathlib import Path
 import os
+import tempfile
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
@@ -20,6 +21,110 @@ MEDIA_URL = '/media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 
 YOLO_MODEL_PATH = os.path.join(BASE_DIR, "models", "initial-run-weighted2_best.pt")
+# Detector used by camera_stream (see cameras/detectors/). The stub backend needs no
+# weights or torch and replays DETECTOR_STUB_SCRIPT, one entry per frame, e.g.
+# [["Tailgating"], ["Tailgating"], [], [], [], [], []]
+DETECTOR_BACKEND = os.environ.get("DETECTOR_BACKEND", "cameras.detectors.yolo.YoloDetector")
+DETECTOR_STUB_SCRIPT = []
+# How often (seconds) running streams check YOLO_MODEL_PATH for new weights; 0 disables hot reload.
+# Replace the file atomically (write elsewhere, then rename over it) when deploying new weights.
+YOLO_RELOAD_CHECK_INTERVAL = 30
+# Load the detector once in the server master before forking workers (see gunicorn.conf.py).
+# A hot reload inside a worker gives that worker a private copy again until the next restart.
+YOLO_PRELOAD = os.environ.get("YOLO_PRELOAD", "0") == "1"
+YOLO_WORKER_THREADS = int(os.environ.get("YOLO_WORKER_THREADS", "1"))  # torch threads per worker
+
+# Per-camera detection occupancy grids (see cameras/heatmaps.py)
+HEATMAP_DIR = os.path.join(MEDIA_ROOT, 'heatmaps')
+HEATMAP_GRID = (36, 64)  # rows, cols over the frame
+HEATMAP_FLUSH_INTERVAL = 60  # seconds between merges to disk while streaming
+
+# Online risk scores from live detections (see cameras/risk.py)
+RISK_HALF_LIFE = 300  # seconds for accumulated evidence to halve
+RISK_PERSIST_DELTA = 0.05  # write an AccidentProbabilityScore row only when the score moves this much
+RISK_CLASS_WEIGHTS = {  # evidence added per second a class is detected
+    "Multiple collision": 0.05,
+    "Vehicle fire":       0.05,
+    "Vehicular accident": 0.03,
+    "Self-accident":      0.02,
+    "Reckless driving":   0.01,
+    "Tailgating":         0.005,
+    "default":            0.005,
+}
+
+# Camera liveness monitor (see cameras/monitor.py)
+CAMERA_MONITOR_INTERVAL = 60  # seconds between sweeps
+CAMERA_MONITOR_CONCURRENCY = 2  # max feeds probed at once, keeps CPU free for live streams
+CAMERA_MONITOR_PROBE_FRAMES = 5  # frames decoded per probe to estimate FPS
+CAMERA_MONITOR_TIMEOUT_MS = 5000  # open/read timeout for remote feeds
+CAMERA_MONITOR_OFFLINE_AFTER = 3  # consecutive failed probes before a camera is offline
+CAMERA_STATE_FRAME_INTERVAL = 10  # seconds between CameraState.last_frame_time writes while streaming
+
+# Rendered map cache (see geomap/cache.py). File-based so every worker process sees
+# the same entries and the same data versions bumped by model signals.
+CACHES = {
+    "default": {
+        "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+    },
+    "geomap": {
+        "BACKEND": "django.core.cache.backends.filebased.FileBasedCache",
+        "LOCATION": os.environ.get("MAP_CACHE_DIR", os.path.join(tempfile.gettempdir(), "huawei_prototype_geomap")),
+    },
+}
+MAP_CACHE_TIMEOUT = 60 * 60  # seconds; entries are also invalidated as soon as their data changes
+MAP_POPUP_MAX_AGE = 30  # seconds browsers may reuse a marker's popup details
+INCIDENT_MAP_LIMIT = 2000  # newest incidents drawn on the incident map; narrower filters show the rest
+MAP_LIVE_POLL_SECONDS = 15  # how often open maps ask for changed markers
+MAP_CHANGES_LIMIT = 500  # changes per poll; clients ask again at once when there are more
+CHANGE_LOG_RETENTION = 24 * 60 * 60  # seconds of changes kept; older cursors reload the page
+CHANGE_LOG_GAP_GRACE = 10  # seconds a missing change id may still commit before cursors move past it
+
+# Road segments (geomap build_road_segments)
+OSM_GRAPH_PATH = os.path.join(MEDIA_ROOT, 'osm', 'singapore_drive.graphml')  # downloaded once, then reused
+ROAD_SEGMENT_LENGTH = 1000  # metres per stretch
+ROAD_SNAP_DISTANCE = 150  # metres; cameras further from every road stay unsnapped
+ROAD_SIMPLIFY_TOLERANCES = {0: 150, 12: 40, 14: 8}  # min zoom -> simplification tolerance in metres
+
+# Nearest-camera lookups (geomap.nearest, api/nearest/)
+NEAREST_CAMERAS_DEFAULT_K = 5
+NEAREST_CAMERAS_MAX_K = 100  # radius queries without k are not capped
+NEAREST_CAMERAS_VERSION_CHECK = 5  # seconds before a worker notices cameras saved by other workers
+
+# Hex-bin density (api/hexbin/)
+HEXBIN_SIZES = [250, 500, 1000, 2000]  # hexagon circumradius in metres
+HEXBIN_DEFAULT_SIZE = 500
+
+# Interpolated weather overlays (geomap render_weather_grid)
+WEATHER_GRID_DIR = os.path.join(MEDIA_ROOT, 'weather_grid')
+WEATHER_GRID_BOUNDS = [[1.15, 103.6], [1.48, 104.1]]  # [[south, west], [north, east]] around Singapore
+WEATHER_GRID_STEP = 0.005  # degrees per cell, about 550 m
+WEATHER_IDW_POWER = 2
+WEATHER_IDW_NEIGHBOURS = 8  # readings each cell is interpolated from
+WEATHER_GRID_REACH = 5000  # metres from the nearest reading at which the overlays fade out
+WEATHER_GRID_TEMPERATURE_RANGE = [24, 34]  # °C mapped onto the temperature colour scale
+WEATHER_GRID_INTERVAL = 60  # seconds between checks for new readings when the command runs continuously
+
+# Route risk (api/route/), on the cached OSM drive graph
+ROUTE_BUFFER = 200  # metres either side of the route in which cameras count
+ROUTE_MAX_BUFFER = 2000
+ROUTE_MAX_SNAP = 2000  # metres from the nearest junction beyond which an origin/destination is refused
+
+# Risk playback (geomap rollup_risk_playback)
+PLAYBACK_DIR = os.path.join(MEDIA_ROOT, 'playback')
+PLAYBACK_HISTORY_DAYS = 7
+PLAYBACK_BUCKET_MINUTES = 15
+PLAYBACK_INTERVAL = 15 * 60  # seconds between rollups when the command runs continuously
+
+# Server-side marker clustering (see geomap/clusters.py)
+CLUSTER_MAX_ZOOM = 15  # above this zoom every marker is sent on its own
+CLUSTER_CELL_PIXELS = 60  # on-screen size of a cluster cell
+
+# Pre-rendered accident risk heat tiles (see geomap/tiles.py, manage.py render_risk_tiles)
+RISK_TILE_DIR = os.path.join(MEDIA_ROOT, 'risk_tiles')
+RISK_TILE_MIN_ZOOM = 10
+RISK_TILE_MAX_ZOOM = 16
+RISK_TILE_RADIUS = 15  # px, same as the HeatMap layer
+RISK_TILE_INTERVAL = 300  # seconds between incremental updates when the command runs continuously
 
 # Quick-start development settings - unsuitable for production
 # See https://docs.djangoproject.com/en/5.1/howto/deployment/checklist/
@@ -14,3 +14,10 @@ from django.core.wsgi import get_wsgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'huawei_prototype.settings')
 
 application = get_wsgi_application()
+
+from django.conf import settings
+
+if settings.YOLO_PRELOAD:
+    # Runs once in the master when the server preloads the app (gunicorn --preload)
+    from cameras import detection
+    detection.preload()